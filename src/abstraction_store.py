@@ -0,0 +1,240 @@
+import json
+import logging
+import os
+import shutil
+from collections.abc import Mapping
+
+import numpy as np
+
+from earth_observation_abstract_mdp import EarthObservationAbstractMDP
+
+# Bump the version whenever the layout of the arrays or the manifest changes so that older stores get rebuilt
+FORMAT_VERSION = 1
+
+MANIFEST_FILE_NAME = "manifest.json"
+
+METADATA_ATTRIBUTES = [
+    'abstraction',
+    'abstract_state_width',
+    'abstract_state_height',
+    'abstract_mdp_width',
+    'abstract_mdp_height',
+    'ground_mdp_width',
+    'ground_mdp_height',
+    'num_points_of_interest',
+    'visibility_fidelity',
+    'is_factored',
+    'abstract_actions',
+    'num_samples',
+    'seed'
+]
+
+BLOCK_TABLES = ['block_offsets', 'block_ground_states', 'ground_to_abstract']
+
+
+# Decodes the rewards of an abstract state from its row of the reward table the first time that something asks for them
+class RewardTable(Mapping):
+    def __init__(self, rewards, abstract_state_names, abstract_state_indices, abstract_actions):
+        self.rewards = rewards
+        self.abstract_state_names = abstract_state_names
+        self.abstract_state_indices = abstract_state_indices
+        self.abstract_actions = abstract_actions
+        self.rows = {}
+
+    def __getitem__(self, abstract_state):
+        if abstract_state not in self.rows:
+            row = self.rewards[self.abstract_state_indices[abstract_state]].tolist()
+            self.rows[abstract_state] = dict(zip(self.abstract_actions, row))
+        return self.rows[abstract_state]
+
+    def __iter__(self):
+        return iter(self.abstract_state_names)
+
+    def __len__(self):
+        return len(self.abstract_state_names)
+
+
+# Decodes the successors of an abstract state from the sparse transition table where row i * |A| + j holds the nonzero
+# transition probabilities of abstract state i and abstract action j in the order that the abstraction computed them
+class TransitionTable(Mapping):
+    def __init__(self, offsets, successors, probabilities, abstract_state_names, abstract_state_indices, abstract_actions):
+        self.offsets = offsets
+        self.successors = successors
+        self.probabilities = probabilities
+        self.abstract_state_names = abstract_state_names
+        self.abstract_state_indices = abstract_state_indices
+        self.abstract_actions = abstract_actions
+        self.rows = {}
+
+    def __getitem__(self, abstract_state):
+        if abstract_state not in self.rows:
+            first_row = self.abstract_state_indices[abstract_state] * len(self.abstract_actions)
+
+            self.rows[abstract_state] = {}
+            for j, abstract_action in enumerate(self.abstract_actions):
+                start, end = self.offsets[first_row + j], self.offsets[first_row + j + 1]
+                successor_names = [self.abstract_state_names[successor] for successor in self.successors[start:end].tolist()]
+                self.rows[abstract_state][abstract_action] = dict(zip(successor_names, self.probabilities[start:end].tolist()))
+
+        return self.rows[abstract_state]
+
+    def __iter__(self):
+        return iter(self.abstract_state_names)
+
+    def __len__(self):
+        return len(self.abstract_state_names)
+
+
+# Every abstraction lists the weather partition statuses of each block in order so the names follow from the index
+def get_abstract_state_names(num_abstract_states, num_points_of_interest):
+    num_weather_partition_statuses = pow(2, num_points_of_interest)
+    return [f'abstract_{i // num_weather_partition_statuses}_{i % num_weather_partition_statuses}' for i in range(num_abstract_states)]
+
+
+def get_transition_arrays(abstract_transition_probabilities, abstract_state_names, abstract_state_indices, abstract_actions):
+    offsets = [0]
+    successors = []
+    probabilities = []
+
+    for abstract_state in abstract_state_names:
+        for abstract_action in abstract_actions:
+            for successor_state, probability in abstract_transition_probabilities[abstract_state][abstract_action].items():
+                if probability > 0:
+                    successors.append(abstract_state_indices[successor_state])
+                    probabilities.append(probability)
+            offsets.append(len(successors))
+
+    return np.array(offsets, dtype=np.int64), np.array(successors, dtype=np.int32), np.array(probabilities, dtype=float)
+
+
+# NOTE: The sizes of an abstraction can be NumPy integers when they come from a row of a config file
+def get_metadata_value(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def get_old_store_path(store_path):
+    return store_path + ".old"
+
+
+def get_array_path(store_path, name):
+    return os.path.join(store_path, name + ".npy")
+
+
+def load_manifest(store_path):
+    manifest_path = os.path.join(store_path, MANIFEST_FILE_NAME)
+    if not os.path.isfile(manifest_path):
+        return None
+
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+
+    if manifest['version'] != FORMAT_VERSION:
+        logging.warning("Ignored an abstraction store with a different version: [path=%s, version=%s]", store_path, manifest['version'])
+        return None
+
+    return manifest
+
+
+def is_stored(store_path):
+    return load_manifest(store_path) is not None
+
+
+# Writes the abstraction as a directory of arrays and a manifest that is written last into a temporary directory that
+# then replaces the store so that a reader never sees a partial store or no store at all
+def save(abstract_mdp, store_path):
+    abstract_state_names = abstract_mdp.states()
+    abstract_actions = abstract_mdp.actions()
+
+    arrays = {}
+
+    arrays['rewards'] = np.array([[abstract_mdp.abstract_rewards[abstract_state][abstract_action] for abstract_action in abstract_actions] for abstract_state in abstract_state_names], dtype=float)
+    arrays['start_state_probabilities'] = np.array([abstract_mdp.abstract_start_state_probabilities[abstract_state] for abstract_state in abstract_state_names], dtype=float)
+    arrays['transition_offsets'], arrays['transition_successors'], arrays['transition_probabilities'] = get_transition_arrays(abstract_mdp.abstract_transition_probabilities, abstract_state_names, abstract_mdp.abstract_state_indices, abstract_actions)
+
+    if not abstract_mdp.is_factored:
+        for name in BLOCK_TABLES:
+            arrays[name] = getattr(abstract_mdp, name)
+
+    # NOTE: The standard errors of a sampled abstraction follow the same rows as the transition probabilities
+    if abstract_mdp.num_samples is not None:
+        arrays['reward_standard_errors'] = np.array([[abstract_mdp.abstract_reward_standard_errors[abstract_state][abstract_action] for abstract_action in abstract_actions] for abstract_state in abstract_state_names], dtype=float)
+        arrays['transition_standard_errors'] = np.array([abstract_mdp.abstract_transition_standard_errors[abstract_state][abstract_action][successor_state] for abstract_state in abstract_state_names for abstract_action in abstract_actions for successor_state, probability in abstract_mdp.abstract_transition_probabilities[abstract_state][abstract_action].items() if probability > 0], dtype=float)
+
+    manifest = {
+        'version': FORMAT_VERSION,
+        'num_abstract_states': len(abstract_state_names),
+        'metadata': {attribute: get_metadata_value(getattr(abstract_mdp, attribute)) for attribute in METADATA_ATTRIBUTES},
+        'arrays': {name: {'dtype': str(array.dtype), 'shape': list(array.shape)} for name, array in arrays.items()}
+    }
+
+    temporary_store_path = store_path + ".tmp"
+    shutil.rmtree(temporary_store_path, ignore_errors=True)
+    os.makedirs(temporary_store_path)
+
+    for name, array in arrays.items():
+        np.save(get_array_path(temporary_store_path, name), np.ascontiguousarray(array))
+
+    with open(os.path.join(temporary_store_path, MANIFEST_FILE_NAME), "w") as f:
+        json.dump(manifest, f, indent=4, sort_keys=True)
+
+    # Move the old store aside first since a directory can only replace an empty one and only then delete it
+    old_store_path = get_old_store_path(store_path)
+    shutil.rmtree(old_store_path, ignore_errors=True)
+    if os.path.isdir(store_path):
+        os.replace(store_path, old_store_path)
+    os.replace(temporary_store_path, store_path)
+    shutil.rmtree(old_store_path, ignore_errors=True)
+
+
+def read(store_path):
+    manifest = load_manifest(store_path)
+    if manifest is None:
+        return None
+
+    arrays = {name: np.load(get_array_path(store_path, name), mmap_mode='r') for name in manifest['arrays']}
+
+    metadata = manifest['metadata']
+
+    state = dict(metadata)
+    state['abstract_state_names'] = get_abstract_state_names(manifest['num_abstract_states'], metadata['num_points_of_interest'])
+
+    abstract_state_indices = {abstract_state: i for i, abstract_state in enumerate(state['abstract_state_names'])}
+    abstract_actions = metadata['abstract_actions']
+
+    state['abstract_rewards'] = RewardTable(arrays['rewards'], state['abstract_state_names'], abstract_state_indices, abstract_actions)
+    state['abstract_transition_probabilities'] = TransitionTable(arrays['transition_offsets'], arrays['transition_successors'], arrays['transition_probabilities'], state['abstract_state_names'], abstract_state_indices, abstract_actions)
+    state['abstract_start_state_probabilities'] = dict(zip(state['abstract_state_names'], arrays['start_state_probabilities'].tolist()))
+
+    if metadata['is_factored']:
+        num_weather_partition_statuses = pow(2, metadata['num_points_of_interest'])
+        state['abstract_states'] = {abstract_state: divmod(i, num_weather_partition_statuses) for i, abstract_state in enumerate(state['abstract_state_names'])}
+    else:
+        for name in BLOCK_TABLES:
+            state[name] = arrays[name]
+
+    if metadata['num_samples'] is not None:
+        state['abstract_reward_standard_errors'] = RewardTable(arrays['reward_standard_errors'], state['abstract_state_names'], abstract_state_indices, abstract_actions)
+        state['abstract_transition_standard_errors'] = TransitionTable(arrays['transition_offsets'], arrays['transition_successors'], arrays['transition_standard_errors'], state['abstract_state_names'], abstract_state_indices, abstract_actions)
+
+    # Restore the abstraction the same way that unpickling it would without running its constructor
+    abstract_mdp = EarthObservationAbstractMDP.__new__(EarthObservationAbstractMDP)
+    abstract_mdp.__setstate__(state)
+
+    return abstract_mdp
+
+
+# Maps the arrays of a store into memory so that every process that loads the same abstraction shares its pages and only
+# decodes the abstract states that it actually visits
+def load(store_path):
+    # NOTE: A store that another process is replacing is only under its old path for a moment and that path goes away as
+    # soon as the new store is in place so a reader that misses one of them tries the other
+    for path in [store_path, get_old_store_path(store_path), store_path]:
+        try:
+            abstract_mdp = read(path)
+        except FileNotFoundError:
+            continue
+
+        if abstract_mdp is not None:
+            return abstract_mdp
+
+    return None
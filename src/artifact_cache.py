@@ -0,0 +1,244 @@
+import ast
+import hashlib
+import json
+import logging
+import os
+import pickle
+import shutil
+
+import numpy as np
+
+# Bump the version whenever the layout of an entry changes so that every older entry gets rebuilt
+CACHE_VERSION = 1
+
+# The number of megabytes that the cache holds before it evicts the least recently used entries
+DEFAULT_MAX_SIZE = 10240
+
+PICKLE_FILE_NAME = "artifact.pickle"
+LOG_FILE_NAME = "log.json"
+
+
+# NOTE: A row of a config file holds NumPy scalars that have to hash the same as the plain values of the command line
+def get_json_value(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+# The directory of the modules that build the artifacts since none of them live anywhere else
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# The code versions of each set of modules since their source does not change while a run is going
+CODE_VERSIONS = {}
+
+
+def get_module_path(module_name):
+    return os.path.join(SOURCE_DIR, module_name + ".py")
+
+
+# Reads the imports of a module without running it, including the ones inside functions, and keeps only the modules of the
+# source directory since every other package is outside of the model code
+def get_imported_modules(module_name):
+    with open(get_module_path(module_name), "rb") as f:
+        tree = ast.parse(f.read())
+
+    imported_modules = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            imported_modules.update(alias.name.split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and node.level == 0:
+            imported_modules.add(node.module.split(".")[0])
+
+    return {imported_module for imported_module in imported_modules if os.path.isfile(get_module_path(imported_module))}
+
+
+# Follows the imports of the given modules so that an artifact depends on every module that its modules use
+def get_module_dependencies(module_names):
+    dependencies = set()
+
+    pending_modules = list(module_names)
+    while pending_modules:
+        module_name = pending_modules.pop()
+        if module_name not in dependencies:
+            dependencies.add(module_name)
+            pending_modules.extend(get_imported_modules(module_name))
+
+    return sorted(dependencies)
+
+
+# Hashes the source of every module that an artifact depends on so that changing the model code invalidates the artifact
+def get_code_version(module_names):
+    key = tuple(sorted(set(module_names)))
+
+    if key not in CODE_VERSIONS:
+        code_hash = hashlib.sha256()
+        for module_name in get_module_dependencies(key):
+            code_hash.update(module_name.encode())
+            with open(get_module_path(module_name), "rb") as f:
+                code_hash.update(f.read())
+        CODE_VERSIONS[key] = code_hash.hexdigest()
+
+    return CODE_VERSIONS[key]
+
+
+def get_directory_size(path):
+    size = 0
+    for directory_path, _, file_names in os.walk(path):
+        for file_name in file_names:
+            try:
+                size += os.path.getsize(os.path.join(directory_path, file_name))
+            except FileNotFoundError:
+                pass
+    return size
+
+
+def write_pickle(artifact, log=None):
+    def write(path):
+        with open(os.path.join(path, PICKLE_FILE_NAME), "wb") as f:
+            pickle.dump(artifact, f, pickle.HIGHEST_PROTOCOL)
+        if log is not None:
+            write_log(path, log)
+    return write
+
+
+def read_pickle(path):
+    with open(os.path.join(path, PICKLE_FILE_NAME), "rb") as f:
+        return pickle.load(f)
+
+
+def write_log(path, log):
+    with open(os.path.join(path, LOG_FILE_NAME), "w") as f:
+        json.dump(log, f, indent=4, sort_keys=True)
+
+
+def read_log(path):
+    with open(os.path.join(path, LOG_FILE_NAME)) as f:
+        return json.load(f)
+
+
+# Keeps every artifact in a directory named after a hash of its kind, its parameters, and the code that built it so that
+# an artifact is only ever reused by a run that would have built exactly the same one
+class ArtifactCache:
+    def __init__(self, cache_dir, max_size=DEFAULT_MAX_SIZE):
+        if max_size <= 0:
+            raise ValueError("Invalid parameter provided: max_size must be positive")
+
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+        self.statistics = {
+            'Max Size': max_size,
+            'Hits': 0,
+            'Misses': 0,
+            'Evictions': 0
+        }
+
+    def get_key(self, kind, parameters, modules):
+        description = {
+            'version': CACHE_VERSION,
+            'kind': kind,
+            'parameters': parameters,
+            'code': get_code_version(modules)
+        }
+        return hashlib.sha256(json.dumps(description, sort_keys=True, default=get_json_value).encode()).hexdigest()
+
+    def get_path(self, kind, parameters, modules):
+        return os.path.join(self.cache_dir, f"{kind}_{self.get_key(kind, parameters, modules)}")
+
+    def contains(self, kind, parameters, modules):
+        return os.path.isdir(self.get_path(kind, parameters, modules))
+
+    # Removes an entry that its reader cannot read so that the next save can put a new one in its place
+    def discard(self, kind, parameters, modules):
+        path = self.get_path(kind, parameters, modules)
+        shutil.rmtree(path, ignore_errors=True)
+        logging.info("Discarded an artifact from the cache: [kind=%s, path=%s]", kind, path)
+
+    # Reads an artifact with the given reader or returns None if there is not one yet or the reader cannot read it
+    def load(self, kind, parameters, modules, read):
+        path = self.get_path(kind, parameters, modules)
+
+        try:
+            # Mark the entry as recently used for the eviction order
+            os.utime(path)
+            artifact = read(path)
+        except FileNotFoundError:
+            # NOTE: The entry is either not there yet or another process evicted it while this one was reading it
+            artifact = None
+
+        if artifact is None:
+            self.statistics['Misses'] += 1
+            return None
+
+        self.statistics['Hits'] += 1
+
+        logging.info("Loaded an artifact from the cache: [kind=%s, path=%s]", kind, path)
+
+        return artifact
+
+    # Writes an artifact with the given writer into a temporary directory that then replaces the entry all at once so that
+    # a reader never sees a partial artifact even if another process writes the same artifact at the same time
+    def save(self, kind, parameters, modules, write):
+        path = self.get_path(kind, parameters, modules)
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+
+        shutil.rmtree(temporary_path, ignore_errors=True)
+        os.makedirs(temporary_path)
+
+        try:
+            write(temporary_path)
+        except BaseException:
+            # Leave nothing behind for a write that failed partway since no later save or eviction would clean it up
+            shutil.rmtree(temporary_path, ignore_errors=True)
+            raise
+
+        try:
+            os.replace(temporary_path, path)
+        except OSError:
+            # NOTE: Another process already finished the same artifact so there is no need to replace it
+            shutil.rmtree(temporary_path, ignore_errors=True)
+
+        logging.info("Saved an artifact to the cache: [kind=%s, path=%s]", kind, path)
+
+        self.evict(path)
+
+        return path
+
+    def get(self, kind, parameters, modules, compute, write, read):
+        artifact = self.load(kind, parameters, modules, read)
+        if artifact is not None:
+            return artifact
+
+        artifact = compute()
+        self.save(kind, parameters, modules, write(artifact))
+
+        return artifact
+
+    # Removes the least recently used entries until the cache fits within its size again without touching the given entry
+    def evict(self, protected_path=None):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if not name.endswith(".tmp") and os.path.isdir(path):
+                try:
+                    entries.append((os.path.getmtime(path), path, get_directory_size(path)))
+                except FileNotFoundError:
+                    pass
+
+        size = sum(entry_size for _, _, entry_size in entries)
+
+        for _, path, entry_size in sorted(entries):
+            if size <= self.max_size * 1024 * 1024:
+                break
+
+            if path == protected_path:
+                continue
+
+            shutil.rmtree(path, ignore_errors=True)
+            size -= entry_size
+            self.statistics['Evictions'] += 1
+
+            logging.info("Evicted an artifact from the cache: [path=%s, size=%d]", path, entry_size)
@@ -1,5 +1,9 @@
 import cplex
 import numpy as np
+from scipy.sparse import csr_matrix, identity, vstack
+
+import utils
+from memory_mdp import MemoryMDP, get_action_values, get_transition_matrix, validate
 
 IS_VERBOSE = False
 IS_RECORDING = False
@@ -8,47 +12,6 @@ LOWER_BOUND = -10000
 UPPER_BOUND = 10000
 
 
-class MemoryMDP:
-    def __init__(self, mdp):
-        self.states = mdp.states()
-        self.actions = mdp.actions()
-
-        self.n_states = len(self.states)
-        self.n_actions = len(self.actions)
-
-        self.rewards = np.zeros(shape=(self.n_states, self.n_actions))
-        for state in range(self.n_states):
-            for action in range(self.n_actions):
-                self.rewards[state, action] = mdp.reward_function(self.states[state], self.actions[action])
-
-        self.transition_probabilities = np.zeros(shape=(self.n_states, self.n_actions, self.n_states))
-        for state in range(self.n_states):
-            for action in range(self.n_actions):
-                for successor_state in range(self.n_states):
-                    self.transition_probabilities[state, action, successor_state] = mdp.transition_function(self.states[state], self.actions[action], self.states[successor_state])
-
-        self.start_state_probabilities = np.zeros(self.n_states)
-        for state in range(self.n_states):
-            self.start_state_probabilities[state] = self.start_state_probabilities[state] = mdp.start_state_function(self.states[state])
-
-
-def validate(memory_mdp, constant_state_values):
-    assert memory_mdp.n_states is not None
-    assert memory_mdp.n_actions is not None
-
-    assert memory_mdp.states is not None
-    assert memory_mdp.actions is not None
-    assert memory_mdp.rewards is not None
-    assert memory_mdp.transition_probabilities is not None
-    assert memory_mdp.start_state_probabilities is not None
-
-    assert memory_mdp.rewards.shape == (memory_mdp.n_states, memory_mdp.n_actions)
-    assert memory_mdp.transition_probabilities.shape == (memory_mdp.n_states, memory_mdp.n_actions, memory_mdp.n_states)
-    assert memory_mdp.start_state_probabilities.shape == (memory_mdp.n_states,)
-
-    assert all(state in memory_mdp.states for state in constant_state_values)
-
-
 # TODO: Determine if we need lower and upper bounds in this function
 def set_variables(problem, memory_mdp, constant_state_values):
     n_variable_states = memory_mdp.n_states - len(constant_state_values)
@@ -83,94 +46,84 @@ def set_objective(problem, memory_mdp, constant_state_values):
     problem.objective.set_sense(problem.objective.sense.minimize)
 
 
-def set_constraints(problem, memory_mdp, gamma, constant_state_values):
-    linear_expressions = []
+# Return the names, the CSR coefficient matrix over the variables, and the right hand sides of every useful linear constraint
+def compute_constraints(memory_mdp, gamma, constant_state_values):
+    is_variable_state = np.array([state not in constant_state_values for state in memory_mdp.states], dtype=bool)
+    constant_values = np.array([constant_state_values.get(state, 0) for state in memory_mdp.states], dtype=float)
+
+    n_variable_states = int(np.sum(is_variable_state))
+
+    # Map each variable state to the column of its variable so that the constant states drop out of the constraint matrix
+    variable_state_indices = np.flatnonzero(is_variable_state)
+    variable_selection = csr_matrix((np.ones(n_variable_states), (variable_state_indices, np.arange(n_variable_states))), shape=(memory_mdp.n_states, n_variable_states))
+    identity_matrix = identity(memory_mdp.n_states, format='csr')
+
+    coefficient_matrices = []
     right_hand_sides = []
-    names = []
 
-    n_variable_states = memory_mdp.n_states - len(constant_state_values)
-    variables = range(n_variable_states)
+    # Create a linear constraint for each state-action pair one action at a time
+    for j in range(memory_mdp.n_actions):
+        transition_matrix = get_transition_matrix(memory_mdp, j)
 
-    # Create a linear constraint for each state-action pair
-    for i in range(memory_mdp.n_states):
-        for j in range(memory_mdp.n_actions):
-            # Define a linear constraint for the state-action pair
-            right_hand_side = memory_mdp.rewards[i, j]
-
-            state = memory_mdp.states[i]
-
-            # Discount its value from the right hand side of the constraint if the start state is a constant
-            if state in constant_state_values:
-                right_hand_side -= constant_state_values[state]
-
-            # Loop across all of the existing states as successor states by either:
-            # (a) setting the coefficients of the variable to correspond to variables states
-            # (b) modifying the right hand side for constant states
-            coefficients = []
-            for k in range(memory_mdp.n_states):
-                successor_state = memory_mdp.states[k]
-
-                # Use the value and the transition probability of the successor state to modify the right hand side of the constraint
-                if successor_state in constant_state_values:
-                    right_hand_side += gamma * memory_mdp.transition_probabilities[i, j, k] * constant_state_values[successor_state]
-                # Set the coefficient of the successor state's variable
-                else:
-                    # Check if the successor state is not the start state
-                    if k != i:
-                        coefficient = - gamma * memory_mdp.transition_probabilities[i, j, k]
-                    # Check if the successor state is the start state
-                    else:
-                        coefficient = 1 - gamma * memory_mdp.transition_probabilities[i, j, k]
-                    coefficients.append(coefficient)
-
-            # TODO: Determine why this problem happens
-            if sum(coefficients) <= 0 < right_hand_side:
-                continue
-
-            # Skip useless constraints without any variables
-            if all(coefficient == 0 for coefficient in coefficients):
-                continue
-
-            # TODO: Avoid using 0 coefficients altogether if necessary for space complexity
-            # TODO: Do we need to cast the right hand side as a float - seems not needed
-            linear_expressions.append([variables, coefficients])
-            right_hand_sides.append(float(right_hand_side))
-            names.append(f'{state}_{memory_mdp.actions[j]}')
-
-    senses = ['G'] * len(linear_expressions)
-
-    # Add all linear constraints to CPLEX at once
-    problem.linear_constraints.add(names=names, lin_expr=linear_expressions, rhs=right_hand_sides, senses=senses)
-
-
-# TODO: Clean this up - there might be a better way to do it
-def get_policy(values, memory_mdp, gamma, constant_state_values):
-    policy = []
+        # Set the coefficient of each variable as (1 - gamma * T) for the start state and as (- gamma * T) for any other successor state
+        coefficient_matrix = ((identity_matrix - gamma * transition_matrix) @ variable_selection).tocsr()
+        coefficient_matrix.eliminate_zeros()
+        coefficient_matrices.append(coefficient_matrix)
 
-    n_variable_states = memory_mdp.n_states - len(constant_state_values)
-    variables = range(n_variable_states)
+        # Discount the value of the start state from the right hand side if it is a constant and
+        # use the value and the transition probability of each constant successor state to modify the right hand side
+        right_hand_sides.append(memory_mdp.rewards[:, j] - constant_values + (gamma * transition_matrix) @ constant_values)
 
+    # Reorder the stacked constraints of every action by state then action
+    order = np.arange(memory_mdp.n_states * memory_mdp.n_actions).reshape(memory_mdp.n_actions, memory_mdp.n_states).T.ravel()
+    coefficient_matrix = vstack(coefficient_matrices, format='csr')[order]
+    right_hand_sides = np.concatenate(right_hand_sides)[order]
+
+    coefficient_sums = np.asarray(coefficient_matrix.sum(axis=1)).ravel()
+    coefficient_counts = np.diff(coefficient_matrix.indptr)
+
+    # TODO: Determine why this problem happens
+    is_valid_constraint = ~((coefficient_sums <= 0) & (0 < right_hand_sides))
+
+    # Skip useless constraints without any variables
+    is_valid_constraint &= coefficient_counts > 0
+
+    constraint_indices = np.flatnonzero(is_valid_constraint)
+
+    names = [f'{memory_mdp.states[k // memory_mdp.n_actions]}_{memory_mdp.actions[k % memory_mdp.n_actions]}' for k in constraint_indices]
+
+    return names, coefficient_matrix[constraint_indices], right_hand_sides[constraint_indices]
+
+
+def set_constraints(problem, memory_mdp, gamma, constant_state_values):
+    names, coefficient_matrix, right_hand_sides = compute_constraints(memory_mdp, gamma, constant_state_values)
+    coefficient_matrix = coefficient_matrix.tocoo()
+
+    senses = ['G'] * len(names)
+
+    # Add all linear constraints to CPLEX at once and then hand it only their nonzero coefficients at once
+    offset = problem.linear_constraints.get_num()
+    problem.linear_constraints.add(names=names, rhs=right_hand_sides.tolist(), senses=senses)
+    if coefficient_matrix.nnz > 0:
+        problem.linear_constraints.set_coefficients(zip((coefficient_matrix.row + offset).tolist(), coefficient_matrix.col.tolist(), coefficient_matrix.data.tolist()))
+
+
+def get_policy(values, memory_mdp, gamma, constant_state_values, action_value_tolerance=0.0):
     variable_state_indices = []
     for i in range(memory_mdp.n_states):
         if memory_mdp.states[i] not in constant_state_values:
             variable_state_indices.append(i)
 
-    assert len(variables) == len(values) == len(variable_state_indices)
-
-    for i in variables:
-        best_action = None
-        best_action_value = None
-
-        for j in range(memory_mdp.n_actions):
-            action_value = memory_mdp.rewards[i, j] + gamma * np.sum(memory_mdp.transition_probabilities[i, j][variable_state_indices] * values)
+    assert len(values) == len(variable_state_indices)
 
-            if best_action_value is None or action_value > best_action_value:
-                best_action = j
-                best_action_value = action_value
+    # Fill in the value of every state so that constant successor states contribute to the action values too
+    state_values = np.array([constant_state_values.get(state, 0) for state in memory_mdp.states], dtype=float)
+    state_values[variable_state_indices] = values
 
-        policy.append(best_action)
+    # Compute every Q-value at once and take the first best action just like a strict > comparison would
+    action_values = get_action_values(memory_mdp, state_values, gamma)[variable_state_indices]
 
-    return policy
+    return utils.get_best_action_indices(action_values, action_value_tolerance).tolist()
 
 
 def create_problem(memory_mdp, gamma, constant_state_values):
@@ -236,8 +189,10 @@ def solve_feasibly(problem):
     return None
 
 
-def solve(mdp, gamma, constant_state_values={}, relax_infeasible=False):
-    memory_mdp = MemoryMDP(mdp)
+# Every solve builds one CSR transition matrix per action by default since the dense (n, A, n) tensor of a PAMDP or a
+# ground MDP quickly outgrows memory
+def solve(mdp, gamma, constant_state_values={}, relax_infeasible=False, is_sparse=True):
+    memory_mdp = MemoryMDP(mdp, is_sparse)
 
     validate(memory_mdp, constant_state_values)
 
@@ -253,23 +208,144 @@ def solve(mdp, gamma, constant_state_values={}, relax_infeasible=False):
         status = solve_feasibly(problem)
 
     if status == 'SUCCESS':
-        objective_value = problem.solution.get_objective_value()
-        values = problem.solution.get_values()
-        policy = get_policy(values, memory_mdp, gamma, constant_state_values)
-
-        # TODO: Clean up all of this stuff
-        variable_states = []
-        for i in range(memory_mdp.n_states):
-            state = memory_mdp.states[i]
-            if state not in constant_state_values:
-                variable_states.append(state)
-
-        assert len(values) == len(variable_states)
-
-        return {
-            'objective_value': objective_value,
-            'values': {variable_states[i]: value for i, value in enumerate(values)},
-            'policy': {variable_states[i]: memory_mdp.actions[j] for i, j in enumerate(policy)}
-        }
+        return get_solution(problem.solution.get_objective_value(), problem.solution.get_values(), memory_mdp, gamma, constant_state_values)
 
     return None
+
+
+def get_solution(objective_value, values, memory_mdp, gamma, constant_state_values, action_value_tolerance=0.0):
+    policy = get_policy(values, memory_mdp, gamma, constant_state_values, action_value_tolerance)
+
+    # TODO: Clean up all of this stuff
+    variable_states = []
+    for i in range(memory_mdp.n_states):
+        state = memory_mdp.states[i]
+        if state not in constant_state_values:
+            variable_states.append(state)
+
+    assert len(values) == len(variable_states)
+
+    return {
+        'objective_value': objective_value,
+        'values': {variable_states[i]: value for i, value in enumerate(values)},
+        'policy': {variable_states[i]: memory_mdp.actions[j] for i, j in enumerate(policy)}
+    }
+
+
+# Keeps the CPLEX problem of the last solve alive so that the next MDP, which typically only differs in a few states (e.g.,
+# the abstract states that a PAMDP grounds), is solved by only adding and deleting the variables and constraints that changed
+# and by re-solving with the dual simplex method from the previous optimal basis
+class SolverSession:
+    def __init__(self):
+        self.problem = None
+        self.gamma = None
+
+        # The variables are named after their states and the constraints after their state-action pairs
+        self.variables = set()
+        self.constraints = {}
+
+        self.statistics = {}
+
+    def reset(self):
+        self.problem = None
+        self.gamma = None
+        self.variables = set()
+        self.constraints = {}
+
+    def __create_problem(self):
+        problem = cplex.Cplex()
+
+        if not IS_VERBOSE:
+            problem.set_log_stream(None)
+            problem.set_results_stream(None)
+
+        problem.objective.set_sense(problem.objective.sense.minimize)
+        problem.parameters.lpmethod.set(problem.parameters.lpmethod.values.dual)
+
+        return problem
+
+    def __update_problem(self, memory_mdp, gamma, constant_state_values):
+        if self.problem is None or self.gamma != gamma:
+            self.reset()
+            self.problem = self.__create_problem()
+            self.gamma = gamma
+
+        variable_state_indices = [i for i in range(memory_mdp.n_states) if memory_mdp.states[i] not in constant_state_values]
+        variable_names = [str(memory_mdp.states[i]) for i in variable_state_indices]
+        variable_name_set = set(variable_names)
+
+        names, coefficient_matrix, right_hand_sides = compute_constraints(memory_mdp, gamma, constant_state_values)
+
+        constraints = {}
+        for k, name in enumerate(names):
+            start, end = coefficient_matrix.indptr[k], coefficient_matrix.indptr[k + 1]
+            indices = tuple(variable_names[index] for index in coefficient_matrix.indices[start:end])
+            constraints[name] = (indices, tuple(coefficient_matrix.data[start:end].tolist()), float(right_hand_sides[k]))
+
+        deleted_constraints = [name for name in self.constraints if self.constraints[name] != constraints.get(name)]
+        added_constraints = [name for name in names if self.constraints.get(name) != constraints[name]]
+        deleted_variables = [name for name in self.variables if name not in variable_name_set]
+        added_variables = [name for name in variable_names if name not in self.variables]
+
+        # Delete the stale constraints before the stale variables since they may still reference them
+        if deleted_constraints:
+            self.problem.linear_constraints.delete(deleted_constraints)
+
+        if deleted_variables:
+            self.problem.variables.delete(deleted_variables)
+
+        if added_variables:
+            n_added_variables = len(added_variables)
+            types = [self.problem.variables.type.continuous] * n_added_variables
+            self.problem.variables.add(names=added_variables, types=types, lb=[LOWER_BOUND] * n_added_variables, ub=[UPPER_BOUND] * n_added_variables)
+
+        self.problem.objective.set_linear(zip(variable_names, memory_mdp.start_state_probabilities[variable_state_indices].tolist()))
+
+        if added_constraints:
+            linear_expressions = [cplex.SparsePair(ind=list(constraints[name][0]), val=list(constraints[name][1])) for name in added_constraints]
+            right_hand_side = [constraints[name][2] for name in added_constraints]
+            self.problem.linear_constraints.add(names=added_constraints, lin_expr=linear_expressions, rhs=right_hand_side, senses=['G'] * len(added_constraints))
+
+        self.variables = variable_name_set
+        self.constraints = constraints
+
+        self.statistics = {
+            'Added Variables': len(added_variables),
+            'Deleted Variables': len(deleted_variables),
+            'Added Constraints': len(added_constraints),
+            'Deleted Constraints': len(deleted_constraints),
+            'Variables': len(variable_names),
+            'Constraints': len(names)
+        }
+
+        if IS_VERBOSE:
+            print("Solver Session Statistics:", self.statistics)
+
+        return variable_names
+
+    def solve(self, mdp, gamma, constant_state_values={}, relax_infeasible=False, is_sparse=True):
+        memory_mdp = MemoryMDP(mdp, is_sparse)
+
+        validate(memory_mdp, constant_state_values)
+
+        variable_names = self.__update_problem(memory_mdp, gamma, constant_state_values)
+
+        status = solve_optimally(self.problem)
+
+        is_relaxed = False
+        if status == 'INFEASIBLE' and relax_infeasible:
+            status = solve_feasibly(self.problem)
+            is_relaxed = True
+
+        # Break near-ties toward the first action since the values of a warm-started solve only match a fresh solve up to
+        # rounding errors that would otherwise flip the policy between actions that are tied
+        solution = None
+        if status == 'SUCCESS':
+            solution = get_solution(self.problem.solution.get_objective_value(), self.problem.solution.get_values(variable_names), memory_mdp, gamma, constant_state_values,
+                                    utils.ACTION_VALUE_TOLERANCE)
+
+        # Start over on the next solve since neither a failed nor a relaxed solve leaves a basis worth reusing
+        if status != 'SUCCESS' or is_relaxed:
+            self.reset()
+
+        return solution
@@ -11,231 +11,143 @@ ABSTRACTION = {
     'MAX': lambda ground_values, _: max(ground_values)
 }
 
-GS_SAMPLES = None 
-GSS_SAMPLES = None
 NUM_PROCESSES = 8
 
+DEFAULT_SAMPLING_SEED = 0
 
-def task(mdp, state_space, abstract_mdp):
-    results = {}
 
-    for abstract_state, ground_states in state_space:
-        results[abstract_state] = {}
-        abstract_state_index = int((abstract_state.split("_"))[1])
+# Splits the visibilities into the poor half and the good half of the weather of a point of interest
+def get_weather_partition(visibility_fidelity):
+    assert(visibility_fidelity > 1)
+    lower_vis = math.floor(visibility_fidelity / 2) - 1 # At or below is considered poor vis
+    upper_vis = lower_vis + 1 # At or above is considered good vis
 
-        for abstract_action in abstract_mdp.abstract_actions:
-            results[abstract_state][abstract_action] = {}
+    # Assume min visibility = 0
+    return [range(0, lower_vis + 1), range(upper_vis, visibility_fidelity)]
 
-            normalizer = 0
 
-            for abstract_successor_state, ground_successor_states in abstract_mdp.abstract_states.items():
-                abstract_successor_state_index = int((abstract_successor_state.split("_"))[1])
-                abstract_successor_weather_index = int((abstract_successor_state.split("_"))[2])
+def scatter_mean(abstract_state_indices, ground_values, ground_states):
+    abstract_values = np.zeros(int(abstract_state_indices.max(initial=-1)) + 1)
+    np.add.at(abstract_values, abstract_state_indices, ground_values)
+    return abstract_values / float(len(ground_states))
+
 
-                # Satellite can only end up in 6 abstract states - the current, upper, lower, right, right upper, right lower.
-                # There are some conditions with even fewer possibilities.
-                # These are further limited by the choice of action.
-                abstract_state_col = abstract_state_index % abstract_mdp.abstract_mdp_width
-                abstract_state_row = math.floor(abstract_state_index / abstract_mdp.abstract_mdp_width)
-                abstract_successor_state_col = abstract_successor_state_index % abstract_mdp.abstract_mdp_width
-                abstract_successor_state_row = math.floor(abstract_successor_state_index / abstract_mdp.abstract_mdp_width)
+def scatter_max(abstract_state_indices, ground_values, _):
+    abstract_values = np.zeros(int(abstract_state_indices.max(initial=-1)) + 1)
+    np.maximum.at(abstract_values, abstract_state_indices, ground_values)
+    return abstract_values
 
-                is_possible_successor = True
 
-                # STAY and IMAGE cannot shift focus North or South
-                if (abstract_action == 'STAY' or abstract_action == 'IMAGE') and (abstract_state_row != abstract_successor_state_row):
-                    is_possible_successor = False
+# Aggregates the ground values of each abstract state in the same way as ABSTRACTION but for every abstract state at once
+# given the index of the abstract state of each ground value
+SCATTER_ABSTRACTION = {
+    'MEAN': scatter_mean,
+    'MAX': scatter_max
+}
 
-                # SOUTH cannot shift focus North
-                if abstract_action == 'SOUTH' and abstract_state_row != abstract_successor_state_row and abstract_successor_state_row != abstract_state_row + 1:
-                    is_possible_successor = False
 
-                # NORTH cannot shift focus South
-                if abstract_action == 'NORTH' and abstract_state_row != abstract_successor_state_row and abstract_successor_state_row != abstract_state_row - 1:
-                    is_possible_successor = False
+# The standard error of the mean of a sample drawn without replacement from the ground states of an abstract state given the
+# sum and the sum of squares of the sampled ground values of each abstract value (zero whenever every ground state is drawn)
+def get_standard_errors(sums, squared_sums, num_samples, num_ground_states):
+    if num_samples >= num_ground_states or num_samples < 2:
+        return np.zeros(len(sums))
 
-                # If on the far east column
-                if abstract_state_col == abstract_mdp.abstract_mdp_width - 1:
-                    if abstract_state_col != abstract_successor_state_col and abstract_successor_state_col != 0:
-                        is_possible_successor = False
+    means = sums / num_samples
+    variances = np.maximum(squared_sums - num_samples * means * means, 0) / (num_samples - 1)
 
-                # If not on the far east column
-                else:
-                    if abstract_state_col != abstract_successor_state_col and abstract_successor_state_col != abstract_state_col + 1:
-                        is_possible_successor = False
+    return np.sqrt(variances / num_samples * (1 - num_samples / num_ground_states))
 
-                if is_possible_successor:
-                    ground_transition_probabilities = []
-                    abstract_transition_probability = None
 
-                    if GS_SAMPLES:
-                        sampled_ground_states = np.random.choice(ground_states, GS_SAMPLES, replace=False)
-                        for ground_state in sampled_ground_states:
-                            #likely_successor_ground_states = mdp.get_successors(ground_state, abstract_action)
-                            #relevant_successor_ground_states = list(likely_successor_ground_states.intersection(set(ground_successor_states)))
-                            #if len(relevant_successor_ground_states) == 0:
-                            #    #print("zero relevant succ")
-                            #    continue
-                            #sampled_ground_successor_states = np.random.choice(relevant_successor_ground_states, GSS_SAMPLES)
+# Pushes the successor distribution of every ground state of an abstract state through the ground-to-abstract map so that
+# only the abstract successor states that its ground states can actually reach are ever visited
+def task(mdp, state_space, abstract_mdp):
+    results = {}
+    standard_errors = {}
 
-                            #for ground_successor_state in sampled_ground_successor_states:
-                            #    ground_transition_probabilities.append(mdp.transition_function(ground_state, abstract_action, ground_successor_state))
+    for abstract_state, ground_states in state_space:
+        results[abstract_state] = {}
+        standard_errors[abstract_state] = {}
 
+        sampled_ground_states = abstract_mdp.get_sampled_ground_states(abstract_state)
 
-                            likely_ground_successor_states = mdp.get_successors(ground_state, abstract_action)
-                            for ground_successor_state in ground_successor_states:
-                                if ground_successor_state in likely_ground_successor_states:
-                                    ground_transition_probabilities.append(mdp.transition_function(ground_state, abstract_action, ground_successor_state))
+        for abstract_action in abstract_mdp.abstract_actions:
+            indices, ground_successor_states, probabilities = utils.get_batch_successor_arrays(mdp, sampled_ground_states, abstract_action)
 
+            # NOTE: The unbuffered scatter visits the probabilities by ground state and then by successor state like the sum of a list would
+            abstract_successor_state_indices, inverse = np.unique(abstract_mdp.get_abstract_state_indices(ground_successor_states), return_inverse=True)
+            abstract_transition_probabilities = SCATTER_ABSTRACTION[abstract_mdp.abstraction](inverse.ravel(), probabilities, sampled_ground_states).tolist()
 
-                        abstract_transition_probability = ABSTRACTION[abstract_mdp.abstraction](ground_transition_probabilities, sampled_ground_states)
-                    else:
-                        for ground_state in ground_states:
-                            visibility_fidelity = mdp.get_visibility_fidelity()
-                            assert(visibility_fidelity > 1)
-                            lower_vis = math.floor(visibility_fidelity / 2) - 1 # At or below is considered poor vis
-                            upper_vis = lower_vis + 1 # At or above is considered good vis
-
-                            # Assume min visibility = 0
-                            weather_partition = [range(0, lower_vis + 1), range(upper_vis, visibility_fidelity)]
-                            _, ground_weather_status = mdp.get_state_factors_from_state(ground_state)
-
-                            locations = sorted(list(ground_weather_status.keys()))
-
-                            extreme_ground_weather = []
-                            for loc in locations:
-                                if ground_weather_status[loc] + 1 in weather_partition[0]:
-                                    extreme_ground_weather.append(-1)
-                                elif ground_weather_status[loc] - 1 in weather_partition[1]:
-                                    extreme_ground_weather.append(1)
-                                else:
-                                    extreme_ground_weather.append(0)
-
-                            extreme_abstract_weather = []
-                            num_points_of_interest = mdp.get_num_point_of_interests()
-                            partial_weather_partition_status = abstract_successor_weather_index
-                            for location_index in range(num_points_of_interest - 1, -1, -1):
-                                # When location index is high, ids are more contiguous - this is how we match to the ground state definitions
-                                location_divisor = pow(2, location_index)
-
-                                # Location i has lower_vis or less visibility
-                                if (math.floor(partial_weather_partition_status / location_divisor < 1)):
-                                    extreme_abstract_weather.insert(0, -1)
-
-                                # Location i has upper_vis or greater visibility
-                                elif (math.floor(partial_weather_partition_status / location_divisor < 2)):
-                                    extreme_abstract_weather.insert(0, 1)
-
-                                partial_weather_partition_status = partial_weather_partition_status % location_divisor
-
-                            # If every weather has a chance of transitioning to a weather in the abstract successor state
-                            ground_weather_bounds = np.array(extreme_ground_weather)
-                            abstract_weather_bounds = np.array(extreme_abstract_weather)
-                            if 2 not in np.absolute(ground_weather_bounds - abstract_weather_bounds):
-                                likely_ground_successor_states = mdp.get_successors(ground_state, abstract_action)
-                                for ground_successor_state in ground_successor_states:
-                                    if ground_successor_state in likely_ground_successor_states:
-                                        ground_transition_probabilities.append(mdp.transition_function(ground_state, abstract_action, ground_successor_state))
-
-                        abstract_transition_probability = ABSTRACTION[abstract_mdp.abstraction](ground_transition_probabilities, ground_states)
-
-                    results[abstract_state][abstract_action][abstract_successor_state] = abstract_transition_probability
-                    normalizer += abstract_transition_probability
-                else:
-                    results[abstract_state][abstract_action][abstract_successor_state] = 0.0
-
-            for abstract_successor_state in abstract_mdp.abstract_states:
-                results[abstract_state][abstract_action][abstract_successor_state] /= normalizer
-
-    return results
+            normalizer = 0
+            for abstract_transition_probability in abstract_transition_probabilities:
+                normalizer += abstract_transition_probability
+
+            # Sum the probability that each sampled ground state sends to each abstract successor state for its spread
+            ground_transition_probabilities = np.bincount(indices * len(abstract_successor_state_indices) + inverse.ravel(), weights=probabilities, minlength=len(sampled_ground_states) * len(abstract_successor_state_indices))
+            ground_transition_probabilities = ground_transition_probabilities.reshape(len(sampled_ground_states), len(abstract_successor_state_indices))
+            abstract_transition_standard_errors = get_standard_errors(ground_transition_probabilities.sum(axis=0), np.square(ground_transition_probabilities).sum(axis=0), len(sampled_ground_states), len(ground_states))
+
+            results[abstract_state][abstract_action] = {}
+            standard_errors[abstract_state][abstract_action] = {}
+            for abstract_successor_state_index, abstract_transition_probability, standard_error in zip(abstract_successor_state_indices.tolist(), abstract_transition_probabilities, abstract_transition_standard_errors.tolist()):
+                if abstract_transition_probability > 0:
+                    abstract_successor_state = abstract_mdp.abstract_state_names[abstract_successor_state_index]
+                    results[abstract_state][abstract_action][abstract_successor_state] = abstract_transition_probability / normalizer
+                    standard_errors[abstract_state][abstract_action][abstract_successor_state] = standard_error / normalizer
+
+    return results, standard_errors
 
 
 class EarthObservationAbstractMDP:
-    # TODO: Test and polish this function
+    # Every location of a block has the same weather ids in an abstract state so the weather ids of each weather partition
+    # status are computed once and then offset by the first ground state of each location
     def compute_abstract_states(self, mdp):
         abstract_states = {}
 
-        num_points_of_interest = mdp.get_num_point_of_interests()
-        visibility_fidelity = mdp.get_visibility_fidelity()
-        weather_expansion_factor = pow(visibility_fidelity, num_points_of_interest)
-        
-        assert(visibility_fidelity > 1)
-        lower_vis = math.floor(visibility_fidelity / 2) - 1 # At or below is considered poor vis
-        upper_vis = lower_vis + 1 # At or above is considered good vis
-
-        # Assume min visibility = 0
-        weather_partition = [range(0, lower_vis + 1), range(upper_vis, visibility_fidelity)]
-
-        # Number of abstract states which have identical location, but different weather
-        num_weather_conditions = pow(2, num_points_of_interest)
-
-        for abstract_row_index in range(self.abstract_mdp_height):
-            for abstract_column_index in range(self.abstract_mdp_width):
-                block_rows = self.abstract_state_height
-                if abstract_row_index == self.abstract_mdp_height - 1:
-                    block_rows += mdp.height() - self.abstract_state_height * (abstract_row_index + 1)
-
-                block_cols = self.abstract_state_width
-                if abstract_column_index == self.abstract_mdp_width - 1:
-                    block_cols += mdp.width() - self.abstract_state_width * (abstract_column_index + 1)
-
-                for weather_partition_status in range(0, num_weather_conditions):
-                    abstract_state_index = self.abstract_mdp_width * abstract_row_index + abstract_column_index
-                    abstract_states[f'abstract_{abstract_state_index}_{weather_partition_status}'] = []
-
-                    for row_index in range(block_rows):
-                        for column_index in range(block_cols):
-                            row_offset = abstract_row_index * self.abstract_state_height
-                            column_offset = abstract_column_index * self.abstract_state_width
-
-                            partial_weather_partition_status = weather_partition_status
-                            eligible_weather_states = range(0, weather_expansion_factor)
-                            for location_index in range(num_points_of_interest - 1, -1, -1):
-                                
-                                # When location index is high, ids are more contiguous - this is how we match to the ground state definitions
-                                location_divisor = pow(2, location_index)
-                                
-                                # Location i has lower_vis or less visibility
-                                if (math.floor(partial_weather_partition_status / location_divisor < 1)):
-                                    eligible_weather_states = [x for x in eligible_weather_states if math.floor((x % pow(visibility_fidelity, location_index + 1)) / pow(visibility_fidelity, location_index)) in weather_partition[0]]
-
-                                # Location i has upper_vis or greater visibility
-                                elif (math.floor(partial_weather_partition_status / location_divisor < 2)):
-                                    eligible_weather_states = [x for x in eligible_weather_states if math.floor((x % pow(visibility_fidelity, location_index + 1)) / pow(visibility_fidelity, location_index)) in weather_partition[1]]
-                                else:
-                                    assert "sum ting wong"
-
-                                partial_weather_partition_status = partial_weather_partition_status % location_divisor
-
-                            ground_state_anchor_index = weather_expansion_factor * (mdp.width() * (row_offset + row_index) + (column_offset + column_index))
-                            ground_states = [x + ground_state_anchor_index for x in eligible_weather_states]
-                            abstract_states[f'abstract_{abstract_state_index}_{weather_partition_status}'] += ground_states
+        num_weather_statuses = pow(mdp.get_visibility_fidelity(), mdp.get_num_point_of_interests())
+        weather_ids = [self.__get_weather_ids(weather_partition_status) for weather_partition_status in range(pow(2, mdp.get_num_point_of_interests()))]
+
+        for abstract_state_index in range(self.abstract_mdp_width * self.abstract_mdp_height):
+            location_ids = np.array([row * mdp.width() + col for row, col in self.__get_block_locations(abstract_state_index)], dtype=np.int64)
+
+            for weather_partition_status, partition_weather_ids in enumerate(weather_ids):
+                abstract_states[f'abstract_{abstract_state_index}_{weather_partition_status}'] = (num_weather_statuses * location_ids[:, None] + partition_weather_ids).ravel()
 
         return abstract_states
 
     def __compute_abstract_rewards(self, mdp):
         abstract_rewards = {}
+        abstract_reward_standard_errors = {}
 
         statistics = {'count': 0, 'total': len(self.abstract_states) * len(self.abstract_actions)}
 
         for abstract_state, ground_states in self.abstract_states.items():
             abstract_rewards[abstract_state] = {}
-            for abstract_action in self.abstract_actions:
+            abstract_reward_standard_errors[abstract_state] = {}
+
+            # Slice the rewards of every sampled ground state out of the reward matrix at once
+            sampled_ground_states = self.get_sampled_ground_states(abstract_state)
+            ground_reward_matrix = mdp.reward_matrix[sampled_ground_states]
+
+            standard_errors = get_standard_errors(ground_reward_matrix.sum(axis=0), np.square(ground_reward_matrix).sum(axis=0), len(sampled_ground_states), len(ground_states))
+
+            for j, abstract_action in enumerate(self.abstract_actions):
                 printer.print_loading_bar(statistics['count'], statistics['total'], 'Abstract Rewards')
                 statistics['count'] += 1
 
-                ground_rewards = [mdp.reward_function(ground_state, abstract_action) for ground_state in ground_states]
-                abstract_reward = ABSTRACTION[self.abstraction](ground_rewards, ground_states)
+                ground_rewards = ground_reward_matrix[:, j].tolist()
+                abstract_reward = ABSTRACTION[self.abstraction](ground_rewards, sampled_ground_states)
                 abstract_rewards[abstract_state][abstract_action] = abstract_reward
+                abstract_reward_standard_errors[abstract_state][abstract_action] = float(standard_errors[j])
 
-        return abstract_rewards
+        return abstract_rewards, abstract_reward_standard_errors
 
     def __compute_abstract_transition_probabilities(self, mdp):
         abstract_transition_probabilities = {}
+        abstract_transition_standard_errors = {}
 
         with ProcessPoolExecutor(max_workers=NUM_PROCESSES) as pool:
             partition_futures = []
-            state_space_partitions = utils.get_partitions(list(self.abstract_states.items()), NUM_PROCESSES)
+            state_space_partitions = utils.get_partitions(list(self.abstract_states.items()), math.ceil(len(self.abstract_states) / NUM_PROCESSES))
 
             statistics = {'count': 0, 'total': len(state_space_partitions)}
 
@@ -247,11 +159,12 @@ class EarthObservationAbstractMDP:
                 partition_futures.append(partition_future)
 
             for partition_future in partition_futures:
-                result = partition_future.result()
+                result, standard_errors = partition_future.result()
                 for key in result:
                     abstract_transition_probabilities[key] = result[key]
+                    abstract_transition_standard_errors[key] = standard_errors[key]
 
-        return abstract_transition_probabilities
+        return abstract_transition_probabilities, abstract_transition_standard_errors
 
     def __compute_abstract_start_state_probabilities(self, mdp):
         abstract_start_state_probabilities = {}
@@ -275,11 +188,202 @@ class EarthObservationAbstractMDP:
 
         return abstract_start_state_probabilities
 
-    def __init__(self, mdp, abstraction, abstract_state_width, abstract_state_height):
+    # The factored abstraction builds every abstract state from its block of locations and the half of the weather partition
+    # of each point of interest. Both the location and the weather of every point of interest change independently so
+    # each abstract transition probability is the product of a location term and a weather term for each point of
+    # interest. This is exact for the MEAN and the MAX abstractions since each abstract state holds every combination.
+    def __compute_factored_abstract_states(self):
+        abstract_states = {}
+
+        for abstract_state_index in range(self.abstract_mdp_width * self.abstract_mdp_height):
+            for weather_partition_status in range(pow(2, self.num_points_of_interest)):
+                abstract_states[f'abstract_{abstract_state_index}_{weather_partition_status}'] = (abstract_state_index, weather_partition_status)
+
+        return abstract_states
+
+    def __get_block_locations(self, abstract_state_index):
+        abstract_row_index, abstract_column_index = divmod(abstract_state_index, self.abstract_mdp_width)
+
+        row_offset = abstract_row_index * self.abstract_state_height
+        column_offset = abstract_column_index * self.abstract_state_width
+
+        # The last row and the last column of blocks cover whatever is left of the grid
+        block_rows = min(self.abstract_state_height, self.ground_mdp_height - row_offset)
+        block_cols = min(self.abstract_state_width, self.ground_mdp_width - column_offset)
+
+        return [(row_offset + row_index, column_offset + column_index) for row_index in range(block_rows) for column_index in range(block_cols)]
+
+    def __get_weather_ids(self, weather_partition_status):
+        weather_partition = get_weather_partition(self.visibility_fidelity)
+
+        # Fold in the point of interest with the highest index first since it is the most significant digit of the weather id
+        weather_ids = np.zeros(1, dtype=int)
+        for location_index in range(self.num_points_of_interest - 1, -1, -1):
+            weathers = np.array(weather_partition[(weather_partition_status >> location_index) & 1])
+            weather_ids = (weather_ids[:, None] * self.visibility_fidelity + weathers).ravel()
+
+        return weather_ids
+
+    def __compute_factored_abstract_rewards(self, mdp):
+        abstract_rewards = {}
+
+        weather_partition = get_weather_partition(self.visibility_fidelity)
+
+        statistics = {'count': 0, 'total': len(self.abstract_states)}
+
+        # NOTE: The reward of a ground state only depends on its location and the weather of the point of interest there
+        for abstract_state, (abstract_state_index, weather_partition_status) in self.abstract_states.items():
+            printer.print_loading_bar(statistics['count'], statistics['total'], 'Abstract Rewards')
+            statistics['count'] += 1
+
+            locations = self.__get_block_locations(abstract_state_index)
+            representative_weathers = [weather_partition[(weather_partition_status >> location_index) & 1][0] for location_index in range(self.num_points_of_interest)]
+
+            abstract_rewards[abstract_state] = {}
+            for abstract_action in self.abstract_actions:
+                location_rewards = []
+
+                for location in locations:
+                    ground_states = []
+
+                    if location in mdp.point_of_interest_indices:
+                        location_index = mdp.point_of_interest_indices[location]
+                        for weather in weather_partition[(weather_partition_status >> location_index) & 1]:
+                            weathers = list(representative_weathers)
+                            weathers[location_index] = weather
+                            ground_states.append(mdp.get_states_from_state_factor_arrays([location[0]], [location[1]], [weathers])[0])
+                    else:
+                        ground_states.append(mdp.get_states_from_state_factor_arrays([location[0]], [location[1]], [representative_weathers])[0])
+
+                    ground_rewards = [mdp.reward_function(int(ground_state), abstract_action) for ground_state in ground_states]
+                    location_rewards.append(ABSTRACTION[self.abstraction](ground_rewards, ground_states))
+
+                abstract_rewards[abstract_state][abstract_action] = ABSTRACTION[self.abstraction](location_rewards, locations)
+
+        return abstract_rewards
+
+    def __compute_factored_abstract_transition_probabilities(self, mdp):
+        abstract_transition_probabilities = {}
+
+        weather_partition = get_weather_partition(self.visibility_fidelity)
+        weather_transition_matrix = mdp.get_weather_transition_matrix()
+
+        # Aggregate the probability that the weather of a single point of interest moves from one half to another half
+        weather_partition_transition_matrix = np.zeros((2, 2))
+        for status in range(2):
+            for successor_status in range(2):
+                weather_transition_probabilities = weather_transition_matrix[np.ix_(weather_partition[status], weather_partition[successor_status])]
+                weather_partition_transition_matrix[status, successor_status] = ABSTRACTION[self.abstraction](weather_transition_probabilities.ravel().tolist(), weather_partition[status])
+
+        num_blocks = self.abstract_mdp_width * self.abstract_mdp_height
+
+        statistics = {'count': 0, 'total': len(self.abstract_states)}
+
+        for abstract_state, (abstract_state_index, weather_partition_status) in self.abstract_states.items():
+            printer.print_loading_bar(statistics['count'], statistics['total'], 'Abstract Transition Probabilities')
+            statistics['count'] += 1
+
+            locations = self.__get_block_locations(abstract_state_index)
+
+            # The weather term of every successor weather partition status as a Kronecker product over the points of interest
+            weather_probabilities = np.ones(1)
+            for location_index in range(self.num_points_of_interest - 1, -1, -1):
+                weather_probabilities = np.multiply.outer(weather_probabilities, weather_partition_transition_matrix[(weather_partition_status >> location_index) & 1]).ravel()
+
+            abstract_transition_probabilities[abstract_state] = {}
+            for abstract_action in self.abstract_actions:
+                successor_abstract_state_indices = [self.__get_block_index(mdp.get_successor_location(location, abstract_action)) for location in locations]
+
+                # Only keep the nonzero probabilities since there are far too many abstract states to list every one
+                results = {}
+                for successor_abstract_state_index in range(num_blocks):
+                    location_indicators = [1.0 if index == successor_abstract_state_index else 0.0 for index in successor_abstract_state_indices]
+                    location_probability = ABSTRACTION[self.abstraction](location_indicators, locations)
+
+                    if location_probability > 0:
+                        for successor_weather_partition_status in np.flatnonzero(weather_probabilities).tolist():
+                            results[f'abstract_{successor_abstract_state_index}_{successor_weather_partition_status}'] = location_probability * weather_probabilities[successor_weather_partition_status]
+
+                normalizer = sum(results.values())
+                abstract_transition_probabilities[abstract_state][abstract_action] = {successor_state: float(probability / normalizer) for successor_state, probability in results.items()}
+
+        return abstract_transition_probabilities
+
+    # NOTE: The start state distribution of the ground MDP is uniform so the abstract one is uniform as well
+    def __compute_factored_abstract_start_state_probabilities(self):
+        return {abstract_state: 1.0 / len(self.abstract_states) for abstract_state in self.abstract_states}
+
+    def __get_block_index(self, location):
+        return self.abstract_mdp_width * (location[0] // self.abstract_state_height) + location[1] // self.abstract_state_width
+
+    # Store the abstraction as an array that maps each ground state to the index of its abstract state along with the ground
+    # states of every abstract state back to back and the offset of each block so that neither lookup scans the abstraction
+    def __init_abstraction_table(self):
+        block_sizes = np.array([len(ground_states) for ground_states in self.abstract_states.values()], dtype=np.int64)
+
+        self.block_offsets = np.zeros(len(block_sizes) + 1, dtype=np.int64)
+        self.block_offsets[1:] = np.cumsum(block_sizes)
+
+        self.block_ground_states = np.concatenate([np.asarray(ground_states, dtype=np.int64) for ground_states in self.abstract_states.values()]) if self.abstract_states else np.zeros(0, dtype=np.int64)
+
+        self.ground_to_abstract = np.full(int(self.block_ground_states.max(initial=-1)) + 1, -1, dtype=np.int32)
+        self.ground_to_abstract[self.block_ground_states] = np.repeat(np.arange(len(block_sizes), dtype=np.int32), block_sizes)
+
+        for table in (self.block_offsets, self.block_ground_states, self.ground_to_abstract):
+            table.setflags(write=False)
+
+        self.__init_abstract_state_views()
+
+    # The ground states of each abstract state are a view of its block so that nothing holds a second copy of them
+    def __init_abstract_state_views(self):
+        self.abstract_states = {abstract_state: self.block_ground_states[self.block_offsets[i]:self.block_offsets[i + 1]] for i, abstract_state in enumerate(self.abstract_state_names)}
+
+    def __init_abstract_state_names(self):
+        self.abstract_state_names = list(self.abstract_states)
+        self.abstract_state_indices = {abstract_state: i for i, abstract_state in enumerate(self.abstract_state_names)}
+
+    # Leave the views of the blocks out of pickles since they would each be saved as a copy
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('abstract_state_indices', None)
+        if not self.is_factored:
+            state.pop('abstract_states', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__dict__.setdefault('is_factored', False)
+        self.__dict__.setdefault('num_samples', None)
+        self.__dict__.setdefault('seed', DEFAULT_SAMPLING_SEED)
+
+        # NOTE: An abstraction pickled before it had a table still has the ground states of each abstract state as a list
+        if 'abstract_state_names' not in state:
+            self.__init_abstract_state_names()
+        else:
+            self.abstract_state_indices = {abstract_state: i for i, abstract_state in enumerate(self.abstract_state_names)}
+
+        if not self.is_factored:
+            if 'block_ground_states' not in state:
+                self.__init_abstraction_table()
+            else:
+                self.__init_abstract_state_views()
+
+    def __init__(self, mdp, abstraction, abstract_state_width, abstract_state_height, num_samples=None, seed=DEFAULT_SAMPLING_SEED):
         self.abstraction = abstraction
         if not self.abstraction in ABSTRACTION:
             raise ValueError(f"Invalid parameter provided: abstraction must be in {list(ABSTRACTION)}")
 
+        # Estimate the abstraction from at most this many ground states of each abstract state if there is a sample budget
+        self.num_samples = num_samples
+        self.seed = seed
+        if self.num_samples is not None:
+            if not self.num_samples > 0:
+                raise ValueError("Invalid parameter provided: num_samples must be greater than 0")
+            if self.abstraction != 'MEAN':
+                raise ValueError("Invalid parameter provided: num_samples can only be used with the MEAN abstraction")
+            if getattr(mdp, 'is_factored', False):
+                raise ValueError("Invalid parameter provided: num_samples cannot be used with a factored ground MDP")
+
         self.abstract_state_width = abstract_state_width
         self.abstract_state_height = abstract_state_height
         if not self.abstract_state_width > 0 or not self.abstract_state_height > 0:
@@ -291,24 +395,43 @@ class EarthObservationAbstractMDP:
         self.abstract_mdp_width = math.ceil(mdp.width() / self.abstract_state_width)
         self.abstract_mdp_height = math.ceil(mdp.height() / self.abstract_state_height)
 
-        self.ground_states = {}
+        self.ground_mdp_width = mdp.width()
+        self.ground_mdp_height = mdp.height()
+        self.num_points_of_interest = mdp.get_num_point_of_interests()
+        self.visibility_fidelity = mdp.get_visibility_fidelity()
+
+        # Build the abstraction from the factors of the ground MDP instead of its states if it is factored
+        self.is_factored = getattr(mdp, 'is_factored', False)
 
-        # NOTE: You can use the basic trans probs with either abstract state space representation. However, you 
-        # must use the regular (includes weather) abstraction when using the regular transition function
-        self.abstract_states = self.compute_abstract_states(mdp)
         self.abstract_actions = mdp.actions()
-        self.abstract_rewards = self.__compute_abstract_rewards(mdp)
-        self.abstract_transition_probabilities = self.__compute_abstract_transition_probabilities(mdp)
-        self.abstract_start_state_probabilities = self.__compute_abstract_start_state_probabilities(mdp)
+
+        if self.is_factored:
+            self.abstract_states = self.__compute_factored_abstract_states()
+            self.__init_abstract_state_names()
+            self.abstract_rewards = self.__compute_factored_abstract_rewards(mdp)
+            self.abstract_transition_probabilities = self.__compute_factored_abstract_transition_probabilities(mdp)
+            self.abstract_start_state_probabilities = self.__compute_factored_abstract_start_state_probabilities()
+        else:
+            # NOTE: You can use the basic trans probs with either abstract state space representation. However, you 
+            # must use the regular (includes weather) abstraction when using the regular transition function
+            self.abstract_states = self.compute_abstract_states(mdp)
+            self.__init_abstract_state_names()
+            self.__init_abstraction_table()
+            self.abstract_rewards, self.abstract_reward_standard_errors = self.__compute_abstract_rewards(mdp)
+            self.abstract_transition_probabilities, self.abstract_transition_standard_errors = self.__compute_abstract_transition_probabilities(mdp)
+            self.abstract_start_state_probabilities = self.__compute_abstract_start_state_probabilities(mdp)
 
     def states(self):
-        return list(self.abstract_states)
+        return list(self.abstract_state_names)
 
     def actions(self):
         return self.abstract_actions
 
     def transition_function(self, state, action, successor_state):
-        return self.abstract_transition_probabilities[state][action][successor_state]
+        return self.abstract_transition_probabilities[state][action].get(successor_state, 0.0)
+
+    def successors(self, state, action):
+        return [(successor_state, probability) for successor_state, probability in self.abstract_transition_probabilities[state][action].items() if probability > 0]
 
     def reward_function(self, state, action):
         return self.abstract_rewards[state][action]
@@ -317,16 +440,130 @@ class EarthObservationAbstractMDP:
         return self.abstract_start_state_probabilities[state]
 
     def get_abstract_state(self, ground_state):
-        if ground_state not in self.ground_states:
-            for abstract_state, ground_states in self.abstract_states.items():
-                if ground_state in ground_states:
-                    self.ground_states[ground_state] = abstract_state
-                    return abstract_state 
-   
-        return self.ground_states[ground_state]
+        if self.is_factored:
+            num_weather_statuses = pow(self.visibility_fidelity, self.num_points_of_interest)
+            location_id, weather_id = divmod(ground_state, num_weather_statuses)
+
+            weather_partition = get_weather_partition(self.visibility_fidelity)
+            weather_partition_status = 0
+            for location_index in range(self.num_points_of_interest):
+                if (weather_id // pow(self.visibility_fidelity, location_index)) % self.visibility_fidelity in weather_partition[1]:
+                    weather_partition_status += pow(2, location_index)
+
+            return f'abstract_{self.__get_block_index(divmod(location_id, self.ground_mdp_width))}_{weather_partition_status}'
+
+        return self.abstract_state_names[self.ground_to_abstract[ground_state]]
+
+    def get_abstract_states(self, ground_states):
+        return [self.abstract_state_names[abstract_state_index] for abstract_state_index in self.get_abstract_state_indices(ground_states).tolist()]
+
+    # The index of an abstract state is its position in the abstract state space, which is the block index times the
+    # number of weather partition statuses plus the weather partition status in the factored abstraction
+    def get_abstract_state_indices(self, ground_states):
+        if not self.is_factored:
+            return self.ground_to_abstract[np.asarray(ground_states, dtype=int)]
+
+        num_weather_statuses = pow(self.visibility_fidelity, self.num_points_of_interest)
+        location_ids, weather_ids = np.divmod(np.asarray(ground_states, dtype=int), num_weather_statuses)
+        rows, cols = np.divmod(location_ids, self.ground_mdp_width)
+
+        weather_partition = get_weather_partition(self.visibility_fidelity)
+        weather_partition_statuses = np.zeros(len(weather_ids), dtype=int)
+        for location_index in range(self.num_points_of_interest):
+            is_good_weather = (weather_ids // pow(self.visibility_fidelity, location_index)) % self.visibility_fidelity >= weather_partition[1][0]
+            weather_partition_statuses += is_good_weather * pow(2, location_index)
+
+        block_indices = self.abstract_mdp_width * (rows // self.abstract_state_height) + cols // self.abstract_state_width
+
+        return block_indices * pow(2, self.num_points_of_interest) + weather_partition_statuses
+
+    def get_abstract_state_index(self, abstract_state):
+        return self.abstract_state_indices[abstract_state]
+
+    # Each abstract state draws its sample from its own generator so that the sample never depends on the worker that draws it
+    def get_sampled_ground_states(self, abstract_state):
+        ground_states = self.abstract_states[abstract_state]
+
+        if self.num_samples is None or self.num_samples >= len(ground_states):
+            return ground_states
+
+        rng = np.random.default_rng([self.seed, self.abstract_state_indices[abstract_state]])
+        return np.sort(rng.choice(ground_states, self.num_samples, replace=False))
+
+    # Summarizes the standard errors of the estimated abstract transition probabilities and rewards of a sampled abstraction
+    def get_sampling_statistics(self):
+        if self.num_samples is None:
+            return None
+
+        transition_standard_errors = [standard_error for action_standard_errors in self.abstract_transition_standard_errors.values() for successor_standard_errors in action_standard_errors.values() for standard_error in successor_standard_errors.values()]
+        reward_standard_errors = [standard_error for action_standard_errors in self.abstract_reward_standard_errors.values() for standard_error in action_standard_errors.values()]
+
+        return {
+            "Samples": self.num_samples,
+            "Seed": self.seed,
+            "Sampled Ground States": sum(min(self.num_samples, len(ground_states)) for ground_states in self.abstract_states.values()),
+            "Mean Transition Standard Error": float(np.mean(transition_standard_errors)) if transition_standard_errors else 0.0,
+            "Max Transition Standard Error": max(transition_standard_errors, default=0.0),
+            "Mean Reward Standard Error": float(np.mean(reward_standard_errors)) if reward_standard_errors else 0.0,
+            "Max Reward Standard Error": max(reward_standard_errors, default=0.0)
+        }
 
     def get_ground_states(self, abstract_states):
+        if self.is_factored:
+            ground_states = []
+            for abstract_state in abstract_states:
+                ground_states.extend(self.__compute_factored_ground_states(abstract_state))
+            return ground_states
+
+        blocks = [self.abstract_states[abstract_state] for abstract_state in abstract_states]
+        return np.concatenate(blocks).tolist() if blocks else []
+
+    def get_num_ground_states(self, abstract_state):
+        if self.is_factored:
+            abstract_state_index, weather_partition_status = self.abstract_states[abstract_state]
+            return len(self.__get_block_locations(abstract_state_index)) * len(self.__get_weather_ids(weather_partition_status))
+
+        return len(self.abstract_states[abstract_state])
+
+    # The location moves deterministically and the weather of each point of interest changes independently so a ground
+    # state drawn uniformly from a factored abstract state moves to a ground successor state with the fraction of the block
+    # that moves to its location times, for each point of interest, the mean probability of its successor weather over the
+    # half of the weather partition in the abstract state. This only visits the ground states of the successor abstract state.
+    def get_ground_successor_distribution(self, mdp, abstract_state, action, successor_abstract_state):
+        assert self.is_factored, "Only a factored abstraction computes ground successor distributions in closed form"
+
+        abstract_state_index, weather_partition_status = self.abstract_states[abstract_state]
+        locations = self.__get_block_locations(abstract_state_index)
+
+        successor_location_counts = {}
+        for location in locations:
+            successor_location = mdp.get_successor_location(location, action)
+            successor_location_counts[successor_location] = successor_location_counts.get(successor_location, 0) + 1
+
+        ground_successor_states = np.array(self.__compute_factored_ground_states(successor_abstract_state), dtype=int)
+        rows, cols, weathers = mdp.get_state_factor_arrays_from_states(ground_successor_states)
+
+        probabilities = np.array([successor_location_counts.get(location, 0) for location in zip(rows.tolist(), cols.tolist())], dtype=float) / len(locations)
+
+        weather_partition = get_weather_partition(self.visibility_fidelity)
+        weather_transition_matrix = mdp.get_weather_transition_matrix()
+
+        # Fold in the point of interest with the highest index first like the successor distributions of the ground MDP
+        for location_index in range(self.num_points_of_interest - 1, -1, -1):
+            weather_probabilities = weather_transition_matrix[list(weather_partition[(weather_partition_status >> location_index) & 1])].mean(axis=0)
+            probabilities = probabilities * weather_probabilities[weathers[:, location_index]]
+
+        is_possible_successor = probabilities > 0
+        return ground_successor_states[is_possible_successor], probabilities[is_possible_successor]
+
+    def __compute_factored_ground_states(self, abstract_state):
+        abstract_state_index, weather_partition_status = self.abstract_states[abstract_state]
+
+        num_weather_statuses = pow(self.visibility_fidelity, self.num_points_of_interest)
+        weather_ids = self.__get_weather_ids(weather_partition_status)
+
         ground_states = []
-        for abstract_state in abstract_states:
-            ground_states = ground_states + self.abstract_states[abstract_state]
+        for row, col in self.__get_block_locations(abstract_state_index):
+            ground_states += (num_weather_statuses * (row * self.ground_mdp_width + col) + weather_ids).tolist()
+
         return ground_states
@@ -1,5 +1,7 @@
-import math
-from random import randint
+import os
+from random import randint, random
+
+import numpy as np
 
 ACTIONS = ['STAY', 'NORTH', 'SOUTH', 'IMAGE']
 
@@ -15,9 +17,37 @@ MAX_VISIBILITY = 3
 
 VISIBILITY_FIDELITY = MAX_VISIBILITY - MIN_VISIBILITY + 1
 
+# The read-only tables that every process maps from the same files once they are saved instead of building its own copy
+TABLE_NAMES = ['state_rows', 'state_cols', 'state_weathers', 'reward_matrix']
+
+
+def get_weather_transition_probabilities(weather):
+    # Weather cannot get worse than minimum visibility
+    if weather == MIN_VISIBILITY:
+        return [(weather, WEATHER_GETS_WORSE_PROBABILITY + WEATHER_STAYS_SAME_PROBABILITY), (weather + 1, WEATHER_GETS_BETTER_PROBABILITY)]
+
+    # Weather cannot get better than maximum visibility
+    if weather == MAX_VISIBILITY:
+        return [(weather - 1, WEATHER_GETS_WORSE_PROBABILITY), (weather, WEATHER_GETS_BETTER_PROBABILITY + WEATHER_STAYS_SAME_PROBABILITY)]
+
+    return [(weather - 1, WEATHER_GETS_WORSE_PROBABILITY), (weather, WEATHER_STAYS_SAME_PROBABILITY), (weather + 1, WEATHER_GETS_BETTER_PROBABILITY)]
+
+
+def get_weather_transition_matrix():
+    weather_transition_matrix = np.zeros((VISIBILITY_FIDELITY, VISIBILITY_FIDELITY))
+
+    for weather in range(MIN_VISIBILITY, MAX_VISIBILITY + 1):
+        for successor_weather, probability in get_weather_transition_probabilities(weather):
+            weather_transition_matrix[weather - MIN_VISIBILITY, successor_weather - MIN_VISIBILITY] = probability
+
+    return weather_transition_matrix
+
+
+WEATHER_TRANSITION_MATRIX = get_weather_transition_matrix()
+
 
 class EarthObservationMDP:
-    def __init__(self, size=DEFAULT_SIZE, points_of_interest=None, visibility=None):
+    def __init__(self, size=DEFAULT_SIZE, points_of_interest=None, visibility=None, is_factored=False):
         # Create a dictionary ({(x, y): vis, ...}) containing the location tuple and starting visibility for each POI
         self.point_of_interest_description = {}
 
@@ -25,9 +55,15 @@ class EarthObservationMDP:
         self.num_rows = size[0]
         self.num_cols = size[1]
 
-        self.state_registry = {}
-
         self.state_space = None
+        self.successor_location_ids = None
+
+        # The directory that the tables were saved to or None if they only live in the memory of this process
+        self.table_dir = None
+
+        # A factored MDP never enumerates its states and instead computes everything from the location and the weather of
+        # each point of interest so that it can have many more points of interest than the tables could ever hold
+        self.is_factored = is_factored
 
         # Set the points of interest in one of three different ways
         self.num_points_of_interest = 0
@@ -53,6 +89,86 @@ class EarthObservationMDP:
         else:
             assert "Failed to parse the visibility argument"
 
+        # Sort the locations of the points of interest to enforce the ordering of the weather in the state id
+        self.point_of_interest_locations = sorted(self.point_of_interest_description.keys())
+        self.point_of_interest_indices = {location: i for i, location in enumerate(self.point_of_interest_locations)}
+
+        if not self.is_factored:
+            self.__init_state_factor_table()
+            self.__init_reward_matrix()
+
+    # Decodes every state once into read-only arrays that worker processes can share instead of decoding states on demand
+    def __init_state_factor_table(self):
+        rows, cols, weathers = self.get_state_factor_arrays_from_states(np.arange(len(self.states())))
+
+        self.state_rows = rows.astype(np.int32)
+        self.state_cols = cols.astype(np.int32)
+        self.state_weathers = weathers.astype(np.int8)
+
+        for state_factors in (self.state_rows, self.state_cols, self.state_weathers):
+            state_factors.setflags(write=False)
+
+    # TODO: Determine the correct reward function
+    def __init_reward_matrix(self):
+        reward_matrix = np.zeros((len(self.state_rows), len(ACTIONS)))
+
+        # Look up the index of the point of interest at the location of each state or -1 if there is not one
+        location_point_of_interest_indices = np.full(self.num_rows * self.num_cols, -1)
+        for location, i in self.point_of_interest_indices.items():
+            location_point_of_interest_indices[location[0] * self.num_cols + location[1]] = i
+        point_of_interest_indices = location_point_of_interest_indices[self.state_rows * self.num_cols + self.state_cols]
+
+        location_weathers = np.zeros(len(self.state_rows))
+        if self.num_points_of_interest > 0:
+            location_weathers = self.state_weathers[np.arange(len(self.state_rows)), np.maximum(point_of_interest_indices, 0)]
+
+        # Imaging a point of interest pays more in better weather while imaging anywhere else costs a little
+        reward_matrix[:, ACTIONS.index('IMAGE')] = np.where(point_of_interest_indices >= 0, 1.0 + 3.0 * location_weathers, -0.1)
+
+        self.reward_matrix = reward_matrix
+        self.reward_matrix.setflags(write=False)
+
+    def save_tables(self, table_dir):
+        for name in TABLE_NAMES:
+            np.save(os.path.join(table_dir, name + ".npy"), getattr(self, name))
+
+    # Maps the tables from the files of a directory so that every process that loads them shares the same pages
+    def load_tables(self, table_dir):
+        try:
+            tables = {name: np.load(os.path.join(table_dir, name + ".npy"), mmap_mode='r') for name in TABLE_NAMES}
+        except FileNotFoundError:
+            # NOTE: The directory is either not there yet or the artifact cache evicted it
+            return False
+
+        self.__dict__.update(tables)
+        self.table_dir = table_dir
+
+        return True
+
+    # Leave the tables and the successor locations out of pickles since a process either maps the tables from their
+    # directory or builds them from the size and the points of interest the first time that it reads them
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in TABLE_NAMES + ['state_space', 'successor_location_ids']:
+            state.pop(key, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__dict__.setdefault('table_dir', None)
+        self.state_space = None
+        self.successor_location_ids = None
+
+    def __getattr__(self, name):
+        if name not in TABLE_NAMES or self.__dict__.get('is_factored', True):
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+
+        if not (self.table_dir and self.load_tables(self.table_dir)):
+            self.__init_state_factor_table()
+            self.__init_reward_matrix()
+
+        return self.__dict__[name]
+
     def __init_random_points_of_interest(self):
         while len(self.point_of_interest_description) < self.num_points_of_interest:
             random_row = randint(0, self.num_rows - 1)
@@ -78,103 +194,190 @@ class EarthObservationMDP:
     def __init_exact_visibility(self, visibility):
         self.point_of_interest_description = visibility
 
-    def get_state_factors_from_state(self, state):
-        base = VISIBILITY_FIDELITY
-        power = self.num_points_of_interest
-        num_weather_statuses = pow(base, power)
+    # Decodes an array of state ids into arrays of rows, columns, and weathers where column i of the weathers holds the
+    # weather of the point of interest at index i of the sorted point of interest locations
+    def get_state_factor_arrays_from_states(self, states):
+        states = np.asarray(states, dtype=int)
 
-        # Calculate the index of the location
-        location_id = math.floor(state / num_weather_statuses)
-        row = math.floor(location_id / self.num_cols)
-        col = location_id - row * self.num_cols
-        location = (row, col)
+        num_weather_statuses = pow(VISIBILITY_FIDELITY, self.num_points_of_interest)
 
-        weather_status = {}
+        location_ids, weather_ids = np.divmod(states, num_weather_statuses)
+        rows, cols = np.divmod(location_ids, self.num_cols)
 
-        # Sort the locations array to enforce an ordering
-        locations = sorted(self.point_of_interest_description.keys())
+        weathers = (weather_ids[:, None] // np.power(VISIBILITY_FIDELITY, np.arange(self.num_points_of_interest))) % VISIBILITY_FIDELITY
 
-        # Overwrite values with whatever the state is representing
-        weather_id = state % num_weather_statuses
-        for i in range(power - 1, -1, -1):
-            base_to_the_i = pow(base, i)
-            location_weather = math.floor(weather_id / base_to_the_i)
-            weather_status[locations[i]] = location_weather
-            weather_id = weather_id % base_to_the_i
+        return rows, cols, weathers
 
-        return location, weather_status
+    def get_states_from_state_factor_arrays(self, rows, cols, weathers):
+        weathers = np.asarray(weathers, dtype=int).reshape(-1, self.num_points_of_interest)
 
-    def get_state_from_state_factors(self, location, weather_status):
-        base = VISIBILITY_FIDELITY
-        power = self.num_points_of_interest
-        num_weather_statuses = pow(base, power)
+        num_weather_statuses = pow(VISIBILITY_FIDELITY, self.num_points_of_interest)
 
-        assert (len(weather_status) == power), "Inconsistent number of points of interest"
+        location_ids = np.asarray(rows, dtype=int) * self.num_cols + np.asarray(cols, dtype=int)
+        weather_ids = weathers @ np.power(VISIBILITY_FIDELITY, np.arange(self.num_points_of_interest))
 
-        # Calculate the starting index of the location
-        location_id = num_weather_statuses * (location[0] * self.num_cols + location[1])
+        return num_weather_statuses * location_ids + weather_ids
 
-        # Sort the locations array to enforce an ordering
-        locations = sorted(list(weather_status.keys()))
+    # NOTE: The dictionary form only remains for compatibility so any code that decodes many states should use the arrays
+    def get_state_factors_from_state(self, state):
+        rows, cols, weathers = self.get_state_factor_arrays_from_states([state])
 
-        # Calculate the offset index of the weather
-        weather_id = 0
-        for i in range(power - 1, -1, -1):
-            weather_id += weather_status[locations[i]] * pow(base, i)
+        location = (int(rows[0]), int(cols[0]))
 
-        # Add the offset index of the weather to the starting index of the location
-        return location_id + weather_id
+        # Add the points of interest from the highest index down to keep the ordering that the weather status always had
+        weather_status = {}
+        for i in range(self.num_points_of_interest - 1, -1, -1):
+            weather_status[self.point_of_interest_locations[i]] = int(weathers[0, i])
 
-    def get_successors(self, state, action):
-        successors = []
+        return location, weather_status
 
-        # TODO: do the weather part for even more speedup / accuracy
-        location, _ = self.get_state_factors_from_state(state)
+    def get_state_from_state_factors(self, location, weather_status):
+        assert (len(weather_status) == self.num_points_of_interest), "Inconsistent number of points of interest"
 
-        successor_location = (0, 0)
+        # Sort the locations array to enforce an ordering
+        locations = sorted(weather_status.keys())
+        weathers = [weather_status[location] for location in locations]
 
-        # Northern-most row
-        if location[0] == 0:
-            if location[1] == self.num_cols - 1:
-                successor_location = (location[0], 0) if action in ('NORTH', 'STAY', 'IMAGE') else (location[0] + 1, 0)
-            else:
-                successor_location = (location[0], location[1] + 1) if action in ('NORTH', 'STAY', 'IMAGE') else (location[0] + 1, location[1] + 1)
+        return int(self.get_states_from_state_factor_arrays([location[0]], [location[1]], [weathers])[0])
 
-        # Southern-most row
-        elif location[0] == self.num_rows - 1:
-            if location[1] == self.num_cols - 1:
-                successor_location = (location[0], 0) if action in ('SOUTH', 'STAY', 'IMAGE') else (location[0] - 1, 0)
-            else:
-                successor_location = (location[0], location[1] + 1) if action in ('SOUTH', 'STAY', 'IMAGE') else (location[0] - 1, location[1] + 1)
+    # Move east by one grid cell with periodic boundaries and north or south by one grid cell unless at the edge, which
+    # clamps the row the same way as get_successor_distributions even when a single row is both edges
+    def get_successor_location(self, location, action):
+        successor_row = location[0]
+        if action == 'NORTH':
+            successor_row = max(location[0] - 1, 0)
+        if action == 'SOUTH':
+            successor_row = min(location[0] + 1, self.num_rows - 1)
 
-        # Any interior row
-        else:
-            if location[1] == self.num_cols - 1:
-                succs = {
-                    'NORTH': (location[0] - 1, 0),
-                    'SOUTH': (location[0] + 1, 0),
-                    'STAY': (location[0], 0),
-                    'IMAGE': (location[0], 0)
-                }
-                successor_location = succs[action]
-            else:
-                succs = {
-                    'NORTH': (location[0] - 1, location[1] + 1),
-                    'SOUTH': (location[0] + 1, location[1] + 1),
-                    'STAY': (location[0], location[1] + 1),
-                    'IMAGE': (location[0], location[1] + 1)
-                }
-                successor_location = succs[action]
+        return (successor_row, (location[1] + 1) % self.num_cols)
 
-        base = VISIBILITY_FIDELITY
-        power = self.num_points_of_interest
-        num_weather_statuses = pow(base, power)
+    def get_successors(self, state, action):
+        # TODO: do the weather part for even more speedup / accuracy
+        num_weather_statuses = pow(VISIBILITY_FIDELITY, self.num_points_of_interest)
+
+        location = divmod(state // num_weather_statuses, self.num_cols)
+        successor_location = self.get_successor_location(location, action)
 
         successor_location_id = num_weather_statuses * (successor_location[0] * self.num_cols + successor_location[1])
         successors = range(successor_location_id, successor_location_id + num_weather_statuses)
 
         return set(successors)
 
+    # Since the location moves deterministically and the weather of each point of interest changes independently, the
+    # successors of a state are the weather statuses of a single location with probabilities given by the Kronecker
+    # product of the rows of the weather transition matrix. Each row covers every weather status so it includes zeros.
+    def get_successor_distributions(self, states, action):
+        if action not in ACTIONS:
+            raise ValueError(f"Invalid parameter provided: action must be in {ACTIONS}")
+
+        states = np.asarray(states, dtype=int)
+
+        num_weather_statuses = pow(VISIBILITY_FIDELITY, self.num_points_of_interest)
+
+        location_ids = states // num_weather_statuses
+        weather_ids = states % num_weather_statuses
+
+        rows = location_ids // self.num_cols
+        cols = location_ids % self.num_cols
+
+        # Move east by one grid cell with periodic boundaries and north or south by one grid cell unless at the edge
+        successor_cols = (cols + 1) % self.num_cols
+        successor_rows = rows
+        if action == 'NORTH':
+            successor_rows = np.where(rows > 0, rows - 1, rows)
+        if action == 'SOUTH':
+            successor_rows = np.where(rows < self.num_rows - 1, rows + 1, rows)
+
+        successor_location_ids = successor_rows * self.num_cols + successor_cols
+        successor_states = (num_weather_statuses * successor_location_ids)[:, None] + np.arange(num_weather_statuses)
+
+        # Fold in the point of interest with the highest index first since it is the most significant digit of the weather id
+        probabilities = np.ones((len(states), 1))
+        for i in range(self.num_points_of_interest - 1, -1, -1):
+            location_weathers = (weather_ids // pow(VISIBILITY_FIDELITY, i)) % VISIBILITY_FIDELITY
+            probabilities = (probabilities[:, :, None] * WEATHER_TRANSITION_MATRIX[location_weathers - MIN_VISIBILITY][:, None, :]).reshape(len(states), -1)
+
+        return successor_states, probabilities
+
+    # The same distribution as a single row of get_successor_distributions without the overhead of batching a single state
+    def get_successor_distribution(self, state, action):
+        if action not in ACTIONS:
+            raise ValueError(f"Invalid parameter provided: action must be in {ACTIONS}")
+
+        num_weather_statuses = pow(VISIBILITY_FIDELITY, self.num_points_of_interest)
+
+        location_id, weather_id = divmod(state, num_weather_statuses)
+        successor_location = self.get_successor_location(divmod(location_id, self.num_cols), action)
+        successor_location_id = successor_location[0] * self.num_cols + successor_location[1]
+
+        probabilities = np.ones(1)
+        for i in range(self.num_points_of_interest - 1, -1, -1):
+            location_weather = (weather_id // pow(VISIBILITY_FIDELITY, i)) % VISIBILITY_FIDELITY
+            probabilities = np.multiply.outer(probabilities, WEATHER_TRANSITION_MATRIX[location_weather - MIN_VISIBILITY]).ravel()
+
+        return num_weather_statuses * successor_location_id + np.arange(num_weather_statuses), probabilities
+
+    def successors(self, state, action):
+        successor_states, probabilities = self.get_successor_distribution(state, action)
+
+        is_possible_successor = probabilities > 0
+        return list(zip(successor_states[is_possible_successor].tolist(), probabilities[is_possible_successor].tolist()))
+
+    # Samples a successor state without a scan over the successor states since the location moves deterministically and
+    # the weather of each point of interest changes independently of the others
+    def sample_successor_state(self, state, action):
+        if action not in ACTIONS:
+            raise ValueError(f"Invalid parameter provided: action must be in {ACTIONS}")
+
+        location, weathers = self.__get_location_and_weathers(state)
+        successor_location = self.get_successor_location(location, action)
+
+        successor_weather_id = 0
+        for i in range(self.num_points_of_interest):
+            probability_threshold = random()
+
+            total_probability = 0
+            for successor_weather, probability in get_weather_transition_probabilities(weathers[i]):
+                total_probability += probability
+                if total_probability >= probability_threshold:
+                    break
+
+            successor_weather_id += (successor_weather - MIN_VISIBILITY) * pow(VISIBILITY_FIDELITY, i)
+
+        num_weather_statuses = pow(VISIBILITY_FIDELITY, self.num_points_of_interest)
+
+        return int(num_weather_statuses * (successor_location[0] * self.num_cols + successor_location[1]) + successor_weather_id)
+
+    # Samples a successor state for each state of a batch under its own action index with a NumPy generator
+    def sample_successor_states(self, states, action_indices, rng):
+        num_weather_statuses = pow(VISIBILITY_FIDELITY, self.num_points_of_interest)
+
+        location_ids, weather_ids = np.divmod(np.asarray(states, dtype=int), num_weather_statuses)
+        successor_location_ids = self.__get_successor_location_ids()[location_ids, action_indices]
+
+        # NOTE: Each threshold is in (0, 1] so that a weather with no probability at the front of a row is never drawn
+        cumulative_probabilities = np.cumsum(WEATHER_TRANSITION_MATRIX, axis=1)
+        cumulative_probabilities[:, -1] = 1.0
+
+        successor_weather_ids = np.zeros(len(weather_ids), dtype=int)
+        for i in range(self.num_points_of_interest):
+            weathers = (weather_ids // pow(VISIBILITY_FIDELITY, i)) % VISIBILITY_FIDELITY
+            probability_thresholds = 1.0 - rng.random(len(weather_ids))
+            successor_weathers = np.sum(cumulative_probabilities[weathers - MIN_VISIBILITY] < probability_thresholds[:, None], axis=1) + MIN_VISIBILITY
+            successor_weather_ids += (successor_weathers - MIN_VISIBILITY) * pow(VISIBILITY_FIDELITY, i)
+
+        return num_weather_statuses * successor_location_ids + successor_weather_ids
+
+    def __get_successor_location_ids(self):
+        if self.successor_location_ids is None:
+            self.successor_location_ids = np.zeros((self.num_rows * self.num_cols, len(ACTIONS)), dtype=int)
+            for location_id in range(self.num_rows * self.num_cols):
+                for j, action in enumerate(ACTIONS):
+                    successor_location = self.get_successor_location(divmod(location_id, self.num_cols), action)
+                    self.successor_location_ids[location_id, j] = successor_location[0] * self.num_cols + successor_location[1]
+
+        return self.successor_location_ids
+
     def get_num_point_of_interests(self):
         return self.num_points_of_interest
 
@@ -187,6 +390,9 @@ class EarthObservationMDP:
     def height(self):
         return self.num_rows
 
+    def get_weather_transition_matrix(self):
+        return WEATHER_TRANSITION_MATRIX
+
     def states(self):
         if self.state_space:
             return self.state_space
@@ -199,98 +405,54 @@ class EarthObservationMDP:
 
         num_states = nums_locations * num_weather_statuses
 
-        self.state_space = list(range(num_states))
+        # A range answers len, indexing, and membership without holding a list of every state
+        self.state_space = range(num_states) if self.is_factored else list(range(num_states))
 
         return self.state_space
 
     def actions(self):
         return ACTIONS
 
-    def transition_function(self, state, action, successor_state):
-        if state not in self.state_registry:
-            self.state_registry[state] = self.get_state_factors_from_state(state)
+    def __get_location_and_weathers(self, state):
+        if not self.is_factored:
+            return (self.state_rows[state], self.state_cols[state]), self.state_weathers[state].tolist()
 
-        if successor_state not in self.state_registry:
-            self.state_registry[successor_state] = self.get_state_factors_from_state(successor_state)
+        num_weather_statuses = pow(VISIBILITY_FIDELITY, self.num_points_of_interest)
 
-        location, weather_status = self.state_registry[state]
-        successor_location, successor_weather_status = self.state_registry[successor_state]
+        location_id, weather_id = divmod(state, num_weather_statuses)
+        weathers = [(weather_id // pow(VISIBILITY_FIDELITY, i)) % VISIBILITY_FIDELITY for i in range(self.num_points_of_interest)]
 
-        # Move east by one grid cell if we are not at the edge of the domain
-        if location[1] != successor_location[1] - 1 and location[1] != self.num_cols - 1:
-            return 0.0
+        return divmod(location_id, self.num_cols), weathers
 
-        # Loop back around if we go off the eastern edge (i.e., periodic boundaries for the east to west direction)
-        if location[1] == self.num_cols - 1 and successor_location[1] != 0:
-            return 0.0
+    def transition_function(self, state, action, successor_state):
+        location, weathers = self.__get_location_and_weathers(state)
+        successor_location, successor_weathers = self.__get_location_and_weathers(successor_state)
 
-        # STAY and IMAGE cannot shift focus north-south
-        if (action == 'STAY' or action == 'IMAGE') and (location[0] != successor_location[0]):
+        # The location moves deterministically so any other successor location is impossible
+        if self.get_successor_location(location, action) != successor_location:
             return 0.0
 
-        # SOUTH does nothing at the bottom
-        if action == 'SOUTH' and (location[0] == self.num_rows - 1) and (location[0] != successor_location[0]):
-            return 0.0
+        # Multiply the weather transition probabilities from the highest point of interest index down like the successors
+        weather_transition_probability = 1.0
+        for i in range(self.num_points_of_interest - 1, -1, -1):
+            weather_transition_probability *= WEATHER_TRANSITION_MATRIX[weathers[i] - MIN_VISIBILITY, successor_weathers[i] - MIN_VISIBILITY]
 
-        # SOUTH always goes south by one cell otherwise
-        if action == 'SOUTH' and (location[0] != self.num_rows - 1) and (location[0] != successor_location[0] - 1):
-            return 0.0
+        return float(weather_transition_probability)
 
-        # NORTH does nothing at the top
-        if action == 'NORTH' and (location[0] == 0) and (location[0] != successor_location[0]):
-            return 0.0
+    def reward_function(self, state, action):
+        if not self.is_factored:
+            return float(self.reward_matrix[state, ACTIONS.index(action)])
 
-        # NORTH always goes north by one cell otherwise
-        if action == 'NORTH' and (location[0] != 0) and (location[0] != successor_location[0] + 1):
+        if action != 'IMAGE':
             return 0.0
 
-        weather_transition_probability = 1.0
-        for location in weather_status:
-            location_weather = weather_status[location]
-            successor_location_weather = successor_weather_status[location]
-
-            assert (location_weather >= MIN_VISIBILITY and location_weather <= MAX_VISIBILITY), "Bad weather value in current state"
-            assert (successor_location_weather >= MIN_VISIBILITY and successor_location_weather <= MAX_VISIBILITY), "Bad weather value in successor state"
-
-            # Weather in our model cannot change from good to bad immediately
-            if abs(successor_location_weather - location_weather) > 1:
-                return 0
-
-            if location_weather == MIN_VISIBILITY:
-                # Weather cannot get worse than minimum visibility
-                if successor_location_weather == location_weather:
-                    weather_transition_probability *= WEATHER_GETS_WORSE_PROBABILITY + WEATHER_STAYS_SAME_PROBABILITY
-                else:
-                    weather_transition_probability *= WEATHER_GETS_BETTER_PROBABILITY
-
-            elif location_weather == MAX_VISIBILITY:
-                # Weather cannot get better than maximum visibility
-                if successor_location_weather == location_weather:
-                    weather_transition_probability *= WEATHER_GETS_BETTER_PROBABILITY + WEATHER_STAYS_SAME_PROBABILITY
-                else:
-                    weather_transition_probability *= WEATHER_GETS_WORSE_PROBABILITY
-
-            else:
-                if successor_location_weather == location_weather:
-                    weather_transition_probability *= WEATHER_STAYS_SAME_PROBABILITY
-                elif successor_location_weather > location_weather:
-                    weather_transition_probability *= WEATHER_GETS_BETTER_PROBABILITY
-                else:
-                    weather_transition_probability *= WEATHER_GETS_WORSE_PROBABILITY
-
-        return weather_transition_probability
-
-    # TODO: Determine the correct reward function
-    def reward_function(self, state, action):
-        location, weather_status = self.get_state_factors_from_state(state)
-
-        if location in weather_status and action == 'IMAGE':
-            return 1.0 + 3.0 * weather_status[location]
+        # Only decode the weather of the point of interest at the current location instead of the whole weather status
+        location, weathers = self.__get_location_and_weathers(state)
 
-        if location not in weather_status and action == 'IMAGE':
-            return -0.1
+        if location in self.point_of_interest_indices:
+            return 1.0 + 3.0 * weathers[self.point_of_interest_indices[location]]
 
-        return 0
+        return -0.1
 
     def start_state_function(self, _):
         return 1.0 / len(self.states())
@@ -0,0 +1,74 @@
+import logging
+
+import numpy as np
+
+import utils
+from earth_observation_mdp import EarthObservationMDP
+
+# Degenerate grids where a single row is both the northern-most and the southern-most row or a single column wraps onto itself
+SIZES = [(1, 4), (4, 1), (1, 1)]
+POINTS_OF_INTEREST = 1
+VISIBILITY = None
+DOMAIN_VARIATION = 1
+
+NUM_SAMPLES = 100
+SAMPLING_SEED = 0
+
+logging.basicConfig(format='[%(asctime)s|%(module)-30s|%(funcName)-10s|%(levelname)-5s] %(message)s', datefmt='%H:%M:%S', level=logging.INFO)
+
+
+# The successors of each state must match its row of the batched successor distributions
+def check_successors(mdp):
+    states = mdp.states()
+
+    for action in mdp.actions():
+        successor_states, probabilities = mdp.get_successor_distributions(states, action)
+
+        for i, state in enumerate(states):
+            is_possible_successor = probabilities[i] > 0
+            expected_successors = list(zip(successor_states[i][is_possible_successor].tolist(), probabilities[i][is_possible_successor].tolist()))
+            assert mdp.successors(state, action) == expected_successors, f"The successors of state {state} under {action} disagree"
+
+            for successor_state, _ in expected_successors:
+                assert successor_state in states, f"The successor {successor_state} of state {state} under {action} is off the grid"
+
+
+# Every row of the transition function must be a probability distribution over the states of the grid
+def check_transition_function(mdp):
+    states = mdp.states()
+
+    for state in states:
+        for action in mdp.actions():
+            total_probability = sum(mdp.transition_function(state, action, successor_state) for successor_state in states)
+            assert np.isclose(total_probability, 1.0), f"The transition probabilities of state {state} under {action} sum to {total_probability}"
+
+
+# Every sampled successor state must be a state of the grid whether it is sampled alone or in a batch
+def check_sampled_successor_states(mdp):
+    states = mdp.states()
+    rng = np.random.default_rng(SAMPLING_SEED)
+
+    for j, action in enumerate(mdp.actions()):
+        for state in states:
+            for _ in range(NUM_SAMPLES):
+                successor_state = mdp.sample_successor_state(state, action)
+                assert successor_state in range(len(states)), f"The sampled successor {successor_state} of state {state} under {action} is off the grid"
+
+        successor_states = mdp.sample_successor_states(np.repeat(states, NUM_SAMPLES), np.full(len(states) * NUM_SAMPLES, j), rng)
+        assert np.all((successor_states >= 0) & (successor_states < len(states))), f"A sampled successor under {action} is off the grid"
+
+
+def main():
+    for size in SIZES:
+        utils.set_domain_random_variation(DOMAIN_VARIATION)
+        mdp = EarthObservationMDP(size, POINTS_OF_INTEREST, VISIBILITY)
+
+        check_successors(mdp)
+        check_transition_function(mdp)
+        check_sampled_successor_states(mdp)
+
+        logging.info("Checked the earth observation MDP: [size=%s, states=%d]", size, len(mdp.states()))
+
+
+if __name__ == '__main__':
+    main()
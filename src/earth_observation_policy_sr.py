@@ -1,22 +1,44 @@
 import json
 import logging
+import math
 import os
-import pickle
 import time
 import yaml
 from termcolor import colored
 
-import cplex_mdp_solver
+import abstraction_store
+import artifact_cache
+import earth_observation_abstract_mdp
+import partially_abstract_mdp
+import policy_evaluation
 import policy_sketch_refine
 import printer
+import rollout
 import utils
 from argparse import ArgumentParser
 from earth_observation_abstract_mdp import EarthObservationAbstractMDP
 from earth_observation_mdp import EarthObservationMDP
+from partially_abstract_mdp import PartiallyAbstractMDPCache, PartiallyAbstractMDPPool
+from refine_prefetcher import RefinePrefetcher
 
 # FIXME: Should we change/randomize this one?
 INITIAL_GROUND_STATE = 0
 
+# Offsets the seed of the evaluation rollouts from the simulation variation to keep them independent of the simulation's random stream
+ROLLOUT_SEED_OFFSET = 1000
+
+ARTIFACT_CACHE_DIR_NAME = "artifacts"
+ABSTRACTION_STORE_NAME = "abstraction.store"
+
+# The modules that build each kind of artifact so that changing any of them or any module that they import rebuilds the
+# artifacts that depend on it
+GROUND_MDP_MODULES = ["earth_observation_mdp", "utils"]
+ABSTRACT_MDP_MODULES = GROUND_MDP_MODULES + ["earth_observation_abstract_mdp", "abstraction_store"]
+SOLUTION_MODULES = ["policy_sketch_refine", "cplex_mdp_solver", "iterative_mdp_solver"]
+
+# Ground-only rows build and load this abstraction since they only need it to map ground states to abstract states
+GROUND_ABSTRACT_AGGREGATE = "MEAN"
+
 logging.basicConfig(
     format='[%(asctime)s|%(module)-30s|%(funcName)-10s|%(levelname)-5s] %(message)s',
     datefmt='%H:%M:%S',
@@ -29,6 +51,74 @@ def readable_time(time_seconds):
     return "{:d}:{:02d}:{:02d}".format(int(h), int(m), int(s))
 
 
+def get_config_value(config, key, default):
+    value = config.get(key, default)
+
+    # Treat a column that is empty or missing in the CSV config file as the default
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return default
+
+    return value
+
+
+def get_config_flag(config, key, default):
+    return str(get_config_value(config, key, default)).lower() in ("1", "1.0", "yes", "y", "t", "true")
+
+
+def get_solver_config(config):
+    return {
+        "solver": get_config_value(config, "solver", policy_sketch_refine.DEFAULT_SOLVER_CONFIG["solver"]),
+        "tolerance": float(get_config_value(config, "solver_tolerance", policy_sketch_refine.DEFAULT_SOLVER_CONFIG["tolerance"])),
+        "max_iterations": int(get_config_value(config, "solver_max_iterations", policy_sketch_refine.DEFAULT_SOLVER_CONFIG["max_iterations"]))
+    }
+
+
+def is_policy_evaluated(config):
+    return int(get_config_value(config, "num_rollouts", 0)) > 0 or get_config_flag(config, "exact_evaluation", False)
+
+
+# Evaluating a policy enumerates every ground state, which is exactly what a factored ground MDP exists to avoid
+def validate_policy_evaluation(config, is_factored):
+    if is_factored and is_policy_evaluated(config):
+        raise ValueError("Invalid parameter provided: num_rollouts and exact_evaluation cannot be used with a factored ground MDP")
+
+
+def get_evaluation_method(config):
+    return get_config_value(config, "evaluation_method", policy_evaluation.DEFAULT_METHOD)
+
+
+# Evaluates a fixed ground policy with a batch of rollouts from the initial ground state and exactly under the start
+# state distribution if the config asks for either
+def evaluate_policy(log, ground_mdp, policy, config):
+    validate_policy_evaluation(config, ground_mdp.is_factored)
+
+    num_rollouts = int(get_config_value(config, "num_rollouts", 0))
+    if num_rollouts > 0:
+        policy_array = rollout.get_policy_array(ground_mdp, policy)
+        log["Simulation"]["Rollouts"] = rollout.evaluate(ground_mdp, policy_array, INITIAL_GROUND_STATE, config["time_horizon"],
+                                                         config["gamma"], num_rollouts, config["simulation_variation"] + ROLLOUT_SEED_OFFSET)
+        logging.info("Evaluated the policy with rollouts: [rollouts=%d, time=%f]", num_rollouts, log["Simulation"]["Rollouts"]["Time"])
+
+    if get_config_flag(config, "exact_evaluation", False):
+        start = time.time()
+        evaluation = policy_evaluation.evaluate(ground_mdp, policy, config["gamma"], get_evaluation_method(config))
+        end = time.time()
+        logging.info("Evaluated the policy exactly: [method=%s, iterations=%d, residual=%e, time=%f]",
+                     evaluation["method"], evaluation["iterations"], evaluation["residual"], end - start)
+
+        # An evaluation that does not converge raises an error so every stored evaluation has converged
+        log["Simulation"]["Policy Evaluation"] = {
+            "Expected Value": evaluation["objective_value"],
+            "Initial State Value": evaluation["values"][INITIAL_GROUND_STATE],
+            "Method": evaluation["method"],
+            "Iterations": evaluation["iterations"],
+            "Residual": evaluation["residual"],
+            "Converged": True,
+            "Time": end - start,
+            "Human Time": readable_time(end - start)
+        }
+
+
 def get_domain_path(data_dir, config):
     domain_name = f"Earth_Observation_W{config['width']}_H{config['height']}_I{config['n_pois']}_" \
                   f"V{config['visibility']}_v{config['domain_variation']}"
@@ -41,9 +131,27 @@ def get_domain_path(data_dir, config):
     return domain_name
 
 
+def get_abstract_samples(config):
+    abstract_samples = get_config_value(config, "abstract_samples", None)
+    return None if abstract_samples is None else int(abstract_samples)
+
+
+def get_abstract_seed(config):
+    return int(get_config_value(config, "abstract_seed", earth_observation_abstract_mdp.DEFAULT_SAMPLING_SEED))
+
+
 def get_abstraction_path(data_dir, config):
     abstraction_name = f"W{config['abstract_width']}_H{config['abstract_height']}"
 
+    # A factored abstraction is computed differently so its simulations cannot share the directory of the regular abstraction
+    if get_config_flag(config, "factored", False):
+        abstraction_name += "_Factored"
+
+    # A sampled abstraction is an estimate of the abstraction that depends on its sample budget and its seed
+    abstract_samples = get_abstract_samples(config)
+    if abstract_samples is not None:
+        abstraction_name += f"_S{abstract_samples}_Seed{get_abstract_seed(config)}"
+
     abstraction_name = os.path.join(get_domain_path(data_dir, config), abstraction_name)
 
     if not os.path.isdir(abstraction_name):
@@ -52,6 +160,125 @@ def get_abstraction_path(data_dir, config):
     return abstraction_name
 
 
+def get_artifact_cache(data_dir, config):
+    max_size = int(get_config_value(config, "artifact_cache_size", artifact_cache.DEFAULT_MAX_SIZE))
+    return artifact_cache.ArtifactCache(os.path.join(data_dir, ARTIFACT_CACHE_DIR_NAME), max_size)
+
+
+# Only the columns that change an artifact go into its key so that every simulation of a sweep shares the same artifacts
+def get_ground_mdp_parameters(config):
+    return {
+        "width": config["width"],
+        "height": config["height"],
+        "n_pois": config["n_pois"],
+        "visibility": get_config_value(config, "visibility", None),
+        "domain_variation": config["domain_variation"],
+        "factored": get_config_flag(config, "factored", False)
+    }
+
+
+def get_abstract_aggregate(config):
+    return GROUND_ABSTRACT_AGGREGATE if config["abstract_aggregate"] == "NONE" else config["abstract_aggregate"]
+
+
+def get_abstract_mdp_parameters(config):
+    parameters = {
+        **get_ground_mdp_parameters(config),
+        "abstract_aggregate": get_abstract_aggregate(config),
+        "abstract_width": config["abstract_width"],
+        "abstract_height": config["abstract_height"]
+    }
+
+    abstract_samples = get_abstract_samples(config)
+    if abstract_samples is not None:
+        parameters["abstract_samples"] = abstract_samples
+        parameters["abstract_seed"] = get_abstract_seed(config)
+
+    return parameters
+
+
+def get_sketch_parameters(config):
+    return {**get_abstract_mdp_parameters(config), "gamma": config["gamma"], "solver": get_solver_config(config)}
+
+
+def get_ground_solution_parameters(config):
+    return {**get_ground_mdp_parameters(config), "gamma": config["gamma"], "solver": get_solver_config(config)}
+
+
+def write_ground_mdp(ground_mdp):
+    def write(path):
+        artifact_cache.write_pickle(ground_mdp)(path)
+        if not ground_mdp.is_factored:
+            ground_mdp.save_tables(path)
+    return write
+
+
+# The ground MDP maps its tables from the artifact so that the workers that it is sent to map the same files
+def read_ground_mdp(path):
+    ground_mdp = artifact_cache.read_pickle(path)
+    if not ground_mdp.is_factored:
+        ground_mdp.load_tables(path)
+    return ground_mdp
+
+
+# The domain random variation seeds the random points of interest so it is part of the key of the ground MDP
+def get_ground_mdp(cache, config):
+    def compute():
+        utils.set_domain_random_variation(config["domain_variation"])
+        size = config["width"], config["height"]
+        return EarthObservationMDP(size, config["n_pois"], config["visibility"], get_config_flag(config, "factored", False))
+
+    parameters = get_ground_mdp_parameters(config)
+
+    ground_mdp = cache.load("ground_mdp", parameters, GROUND_MDP_MODULES, read_ground_mdp)
+    if ground_mdp is not None:
+        return ground_mdp
+
+    # Load a ground MDP that was just built from the cache too so that it maps its tables like every other one
+    ground_mdp = compute()
+    cache.save("ground_mdp", parameters, GROUND_MDP_MODULES, write_ground_mdp(ground_mdp))
+    saved_ground_mdp = cache.load("ground_mdp", parameters, GROUND_MDP_MODULES, read_ground_mdp)
+
+    return ground_mdp if saved_ground_mdp is None else saved_ground_mdp
+
+
+def write_abstract_mdp(abstract_mdp, log):
+    def write(path):
+        abstraction_store.save(abstract_mdp, os.path.join(path, ABSTRACTION_STORE_NAME))
+        artifact_cache.write_log(path, log)
+    return write
+
+
+# A store that is missing or has another version is a cache miss rather than an abstraction without an abstract MDP
+def read_abstract_mdp(path):
+    abstract_mdp = abstraction_store.load(os.path.join(path, ABSTRACTION_STORE_NAME))
+    if abstract_mdp is None:
+        return None
+    return abstract_mdp, artifact_cache.read_log(path)
+
+
+def read_ground_solution(path):
+    return artifact_cache.read_pickle(path), artifact_cache.read_log(path)
+
+
+# Loads the sketched solution from the artifact cache or solves it once so that every refine of the simulation finds it in memory
+def load_sketch(abstract_mdp, data_dir, config):
+    solver_config = get_solver_config(config)
+
+    def compute():
+        return policy_sketch_refine.get_sketch(abstract_mdp, config["gamma"], solver_config)
+
+    # Keep the sketched solution out of the artifact cache if it is disabled in the config file
+    if not get_config_flag(config, "persist_sketch", True):
+        return compute()
+
+    cache = get_artifact_cache(data_dir, config)
+    sketched_solution = cache.get("sketch", get_sketch_parameters(config), ABSTRACT_MDP_MODULES + SOLUTION_MODULES, compute, artifact_cache.write_pickle, artifact_cache.read_pickle)
+    policy_sketch_refine.set_sketch(abstract_mdp, config["gamma"], solver_config, sketched_solution)
+
+    return sketched_solution
+
+
 def get_simulator_path(data_dir, config):
     simulation_name = f"Simulation_s{config['expansion_level']}_T{config['time_horizon']}_" \
                       f"gamma{config['gamma']}_Expand{config['expand_poi']}_v{config['simulation_variation']}"
@@ -134,17 +361,20 @@ def main():
 
     run(data_dir, config, simulate=True, force=force)
 
-def construct_abstract_mdp(ground_mdp, abstract_mdp_file_path, config):
+def construct_abstract_mdp(ground_mdp, cache, config):
 
     # Abstract MDP
-    if os.path.isfile(abstract_mdp_file_path + ".pickle") and os.path.isfile(abstract_mdp_file_path + ".json"):
+    if cache.load("abstract_mdp", get_abstract_mdp_parameters(config), ABSTRACT_MDP_MODULES, read_abstract_mdp):
         print(colored("Abstraction was already done.", "blue"))
-        #abstract_mdp = pickle.load(open(abstract_mdp_file_path + ".pickle", "rb"))
-        #log = yaml.load(open(abstract_mdp_file_path + ".yaml"), Loader=yaml.CLoader)
     else:
+        # Drop an entry whose store is missing or has another version since it would keep the new abstraction out
+        if cache.contains("abstract_mdp", get_abstract_mdp_parameters(config), ABSTRACT_MDP_MODULES):
+            cache.discard("abstract_mdp", get_abstract_mdp_parameters(config), ABSTRACT_MDP_MODULES)
+
         start = time.time()
         abstract_mdp = EarthObservationAbstractMDP(
-            ground_mdp, config["abstract_aggregate"], config["abstract_width"], config["abstract_height"])
+            ground_mdp, get_abstract_aggregate(config), config["abstract_width"], config["abstract_height"],
+            get_abstract_samples(config), get_abstract_seed(config))
         end = time.time()
 
         logging.info("Built the abstract earth observation MDP: [states=%d, actions=%d, time=%f]",
@@ -152,10 +382,6 @@ def construct_abstract_mdp(ground_mdp, abstract_mdp_file_path, config):
                      len(abstract_mdp.actions()),
                      end - start)
 
-        # Store abstract MDP
-        with open(abstract_mdp_file_path + ".pickle", "wb") as f:
-            print(pickle.dump(abstract_mdp, f, pickle.HIGHEST_PROTOCOL))
-
         # Store abstraction logs
         log = {
             "Earth Observation Ground MDP": {
@@ -170,15 +396,18 @@ def construct_abstract_mdp(ground_mdp, abstract_mdp_file_path, config):
             }
         }
         log["Abstract MDP"] = {
-            "Abstraction Aggregate": config["abstract_aggregate"],
+            "Abstraction Aggregate": get_abstract_aggregate(config),
             "Abstraction Width": config["abstract_width"],
             "Abstraction Height": config["abstract_height"],
             "Abstraction Time": round(end - start, 2),
             "Abstraction Human Time": readable_time(end - start),
             "Abstraction Number of States": len(abstract_mdp.states()),
         }
-        # yaml.dump(log, open(abstract_mdp_file_path + ".yaml", "w"))
-        json.dump(log, open(abstract_mdp_file_path + ".json", "w"), indent=4, sort_keys=True)
+        if abstract_mdp.get_sampling_statistics():
+            log["Abstract MDP"]["Sampling"] = abstract_mdp.get_sampling_statistics()
+
+        # Store the abstract MDP with its log
+        cache.save("abstract_mdp", get_abstract_mdp_parameters(config), ABSTRACT_MDP_MODULES, write_abstract_mdp(abstract_mdp, log))
 
 def simulate_MDP(log, ground_mdp, data_dir, config, force, solution, abstract_mdp):
 
@@ -211,6 +440,8 @@ def simulate_MDP(log, ground_mdp, data_dir, config, force, solution, abstract_md
     log["Ground Policy Time"] = end - start
     log["Ground Policy Human Time"] = readable_time(end - start)
 
+    evaluate_policy(log, ground_mdp, policy, config)
+
     logging.info("Activating the simulator...")
     time_step = 1
     utils.set_simulation_random_variation(config["simulation_variation"])
@@ -274,78 +505,143 @@ def simulate_PAMDP(log, ground_mdp, abstract_mdp, data_dir, config, force):
     #state_history = []
     policy_cache = {}
 
-    logging.info("Activating the simulator...")
-    time_step = 1
-    utils.set_simulation_random_variation(config["simulation_variation"])
-    while time_step <= config["time_horizon"]:
-        logging.info(f"Time step: {time_step}")
-        log["Simulation"]["Steps"].append({})
-        step_log = log["Simulation"]["Steps"][-1]
+    solver_config = get_solver_config(config)
+    log["Simulation"]["Solver"] = solver_config
 
-        time_step += 1
+    # Sketch before the simulation starts so that the first refine does not pay for it
+    start = time.time()
+    sketched_solution = load_sketch(abstract_mdp, data_dir, config)
+    end = time.time()
+    log["Simulation"]["Sketch Time"] = end - start
+    log["Simulation"]["Sketch Human Time"] = readable_time(end - start)
+
+    # Keep the CPLEX problem between refines so that each refine only pays for the abstract states it grounds differently
+    solver_session = None
+    if solver_config["solver"] == "CPLEX":
+        import cplex_mdp_solver
+        solver_session = cplex_mdp_solver.SolverSession()
+
+    # Keep the parts of each PAMDP that only depend on a single abstract state since consecutive PAMDPs mostly share them
+    pamdp_cache_size = int(get_config_value(config, "pamdp_cache_size", partially_abstract_mdp.DEFAULT_CACHE_SIZE))
+    pamdp_cache = PartiallyAbstractMDPCache(ground_mdp, abstract_mdp, pamdp_cache_size) if pamdp_cache_size > 0 else None
+
+    # Only a simulation without the cache builds PAMDPs from scratch so only it needs one pool of worker processes for them
+    pamdp_pool = PartiallyAbstractMDPPool(ground_mdp, abstract_mdp) if pamdp_cache is None else None
+
+    # Stop the worker processes even if the simulation fails so that a sweep worker does not pile them up across its rows
+    prefetcher = None
+    try:
+        # Refine the abstract states that the agent is likely to reach next in the background if there are prefetch workers
+        prefetch_workers = int(get_config_value(config, "prefetch_workers", 0))
+        if prefetch_workers > 0:
+            prefetcher = RefinePrefetcher(ground_mdp, abstract_mdp, sketched_solution, config["expand_poi"], config["expansion_level"], config["gamma"],
+                                          solver_config, pamdp_cache_size, prefetch_workers, int(get_config_value(config, "prefetch_depth", 1)))
+
+        logging.info("Activating the simulator...")
+        time_step = 1
+        utils.set_simulation_random_variation(config["simulation_variation"])
+        while time_step <= config["time_horizon"]:
+            logging.info(f"Time step: {time_step}")
+            log["Simulation"]["Steps"].append({})
+            step_log = log["Simulation"]["Steps"][-1]
+
+            time_step += 1
+
+            step_log["Step"] = time_step
+            step_log["Current Ground State"] = current_ground_state
+            step_log["Current Abstract State"] = current_abstract_state
+
+            ground_states = abstract_mdp.get_ground_states([current_abstract_state])
+
+            if prefetcher:
+                prefetcher.collect(policy_cache, current_ground_state, current_abstract_state)
+
+            if current_ground_state not in policy_cache:
+                #logging.info("Encountered a new abstract state: [%s]", current_abstract_state)
+                log["Simulation"]["Cache Misses"] += 1
+
+                logging.info("Starting the policy sketch refine algorithm...")
+                start = time.time()
+                solution = policy_sketch_refine.solve(ground_mdp, current_ground_state, abstract_mdp,
+                                                      current_abstract_state, config["expand_poi"], 
+                                                      config["expansion_level"], config["gamma"], solver_session, solver_config,
+                                                      pamdp_cache, pamdp_pool)
+                end = time.time()
+                logging.info("Finished the policy sketch refine algorithm: [time=%f]", end - start)
+                step_log["Policy Sketch-Refine Time"] = end - start
+                step_log["Policy Sketch-Refine Human Time"] = readable_time(end - start)
+                if solver_session:
+                    step_log["Solver Session"] = dict(solver_session.statistics)
+
+                start = time.time()
+                # The policy of the current abstract state only needs the values of its ground states and their successors
+                values = utils.get_ground_entities(solution['values'], ground_mdp, abstract_mdp, ground_states + list(utils.get_successor_state_set(ground_mdp, ground_states)))
+                end = time.time()
+                #logging.info("Calculated the values from the solution of policy sketch refine: [time=%f]", end - start)
+                step_log["Ground Entities Time"] = end - start
+                step_log["Ground Entities Human Time"] = readable_time(end - start)
+
+                start = time.time()
+                policy = utils.get_ground_policy(values, ground_mdp, abstract_mdp, ground_states,
+                                                 current_abstract_state, config["gamma"])
+                end = time.time()
+                #logging.info("Calculated the policy from the values: [time=%f]", end - start)
+                step_log["Ground Policy Time"] = end - start
+                step_log["Ground Policy Human Time"] = readable_time(end - start)
+
+                #logging.info("Cached the ground states for the new abstract state: [%s]", current_abstract_state)
+                for ground_state in ground_states:
+                    policy_cache[ground_state] = policy[ground_state]
+            else:
+                log["Simulation"]["Cache Hits"] += 1
 
-        step_log["Step"] = time_step
-        step_log["Current Ground State"] = current_ground_state
-        step_log["Current Abstract State"] = current_abstract_state
+                if prefetcher:
+                    prefetcher.record_hit(current_abstract_state)
 
-        ground_states = abstract_mdp.get_ground_states([current_abstract_state])
-
-        if current_ground_state not in policy_cache:
-            #logging.info("Encountered a new abstract state: [%s]", current_abstract_state)
-            log["Simulation"]["Cache Misses"] += 1
-
-            logging.info("Starting the policy sketch refine algorithm...")
-            start = time.time()
-            solution = policy_sketch_refine.solve(ground_mdp, current_ground_state, abstract_mdp,
-                                                  current_abstract_state, config["expand_poi"], 
-                                                  config["expansion_level"], config["gamma"])
-            end = time.time()
-            logging.info("Finished the policy sketch refine algorithm: [time=%f]", end - start)
-            step_log["Policy Sketch-Refine Time"] = end - start
-            step_log["Policy Sketch-Refine Human Time"] = readable_time(end - start)
-
-            start = time.time()
-            values = utils.get_ground_entities(solution['values'], ground_mdp, abstract_mdp)
-            end = time.time()
-            #logging.info("Calculated the values from the solution of policy sketch refine: [time=%f]", end - start)
-            step_log["Ground Entities Time"] = end - start
-            step_log["Ground Entities Human Time"] = readable_time(end - start)
-
-            start = time.time()
-            policy = utils.get_ground_policy(values, ground_mdp, abstract_mdp, ground_states,
-                                             current_abstract_state, config["gamma"])
-            end = time.time()
-            #logging.info("Calculated the policy from the values: [time=%f]", end - start)
-            step_log["Ground Policy Time"] = end - start
-            step_log["Ground Policy Human Time"] = readable_time(end - start)
-
-            #logging.info("Cached the ground states for the new abstract state: [%s]", current_abstract_state)
-            for ground_state in ground_states:
-                policy_cache[ground_state] = policy[ground_state]
-        else:
-            log["Simulation"]["Cache Hits"] += 1
+            #state_history.append(current_ground_state)
 
-        #state_history.append(current_ground_state)
+            #expanded_state_policy = {}
+            #for ground_state in ground_states:
+            #    expanded_state_policy[ground_state] = policy_cache[ground_state]
 
-        #expanded_state_policy = {}
-        #for ground_state in ground_states:
-        #    expanded_state_policy[ground_state] = policy_cache[ground_state]
+            current_action = policy_cache[current_ground_state]
 
-        current_action = policy_cache[current_ground_state]
+            #logging.info("Current Ground State: [%s]", current_ground_state)
+            #logging.info("Current Abstract State: [%s]", current_abstract_state)
+            #logging.info("Current Action: [%s]", current_action)
 
-        #logging.info("Current Ground State: [%s]", current_ground_state)
-        #logging.info("Current Abstract State: [%s]", current_abstract_state)
-        #logging.info("Current Action: [%s]", current_action)
+            if prefetcher:
+                prefetcher.submit(current_ground_state, current_abstract_state, current_action, policy_cache)
 
-        current_reward = ground_mdp.reward_function(current_ground_state, current_action)
-        step_log["Current Reward"] = current_reward
-        log["Simulation"]["Cumulative Reward"] += current_reward
+            current_reward = ground_mdp.reward_function(current_ground_state, current_action)
+            step_log["Current Reward"] = current_reward
+            log["Simulation"]["Cumulative Reward"] += current_reward
 
-        current_ground_state = utils.get_successor_state(current_ground_state, current_action, ground_mdp)
-        current_abstract_state = abstract_mdp.get_abstract_state(current_ground_state)
+            current_ground_state = utils.get_successor_state(current_ground_state, current_action, ground_mdp)
+            current_abstract_state = abstract_mdp.get_abstract_state(current_ground_state)
 
-        if config["sleep_duration"] > 0:
-            time.sleep(config["sleep_duration"])
+            if config["sleep_duration"] > 0:
+                time.sleep(config["sleep_duration"])
+    finally:
+        if prefetcher:
+            prefetcher.shutdown()
+
+        if pamdp_pool:
+            pamdp_pool.shutdown()
+
+        policy_sketch_refine.clear_sketch(abstract_mdp)
+
+    if prefetcher:
+        log["Simulation"]["Prefetch"] = prefetcher.statistics
+
+    if pamdp_cache:
+        log["Simulation"]["PAMDP Cache"] = pamdp_cache.statistics
+
+    # Follow the refined policy wherever the simulation refined one and the sketched policy everywhere else
+    if is_policy_evaluated(config):
+        abstract_states = utils.get_abstract_states(abstract_mdp, ground_mdp.states())
+        policy = {ground_state: policy_cache.get(ground_state, sketched_solution["policy"][abstract_state]) for ground_state, abstract_state in zip(ground_mdp.states(), abstract_states)}
+        evaluate_policy(log, ground_mdp, policy, config)
 
     log["Simulation"]["Number of Steps"] = time_step - 1
     log["Simulation"]["Cache Hit Ratio"] = log["Simulation"]["Cache Hits"] / log["Simulation"]["Number of Steps"]
@@ -380,9 +676,12 @@ def simulate_abstract_MDP(log, ground_mdp, abstract_mdp, data_dir, config, force
     }
 
     logging.info("Solving Abstract MDP...")
+    load_sketch(abstract_mdp, data_dir, config)
     solution = policy_sketch_refine.solve(ground_mdp, current_ground_state, abstract_mdp,
                                           current_abstract_state, config["expand_poi"], 
-                                          config["expansion_level"], config["gamma"])
+                                          config["expansion_level"], config["gamma"],
+                                          solver_config=get_solver_config(config))
+    policy_sketch_refine.clear_sketch(abstract_mdp)
     #solution = policy_sketch_refine.solve(ground_mdp, current_ground_state, abstract_mdp,
     #                                      current_abstract_state, config["expand_poi"], 
     #                                      config["expansion_level"], config["gamma"])
@@ -392,6 +691,8 @@ def simulate_abstract_MDP(log, ground_mdp, abstract_mdp, data_dir, config, force
     print(solution['values'])
     policy = utils.get_full_ground_policy(solution['values'], abstract_mdp, abstract_mdp.states(), config["gamma"])
 
+    evaluate_policy(log, ground_mdp, utils.get_ground_entities(policy, ground_mdp, abstract_mdp), config)
+
     logging.info("Activating the simulator...")
     time_step = 1
     utils.set_simulation_random_variation(config["simulation_variation"])
@@ -421,36 +722,35 @@ def simulate_abstract_MDP(log, ground_mdp, abstract_mdp, data_dir, config, force
 
 
 def run(data_dir, config, simulate=False, force=False):
-    size = config["width"], config["height"]
-
     # Check data dir
     if not os.path.isdir(data_dir):
         raise Exception(f"Data directory {data_dir} does not exist. Create it and run this again.")
 
+    # Fail before solving anything instead of after a whole simulation
+    if simulate:
+        validate_policy_evaluation(config, get_config_flag(config, "factored", False))
+
+    cache = get_artifact_cache(data_dir, config)
+
     # Generate Earth Observation MDP
-    utils.set_domain_random_variation(config["domain_variation"])
     start = time.time()
-    ground_mdp = EarthObservationMDP(size, config["n_pois"], config["visibility"])
+    ground_mdp = get_ground_mdp(cache, config)
     end = time.time()
     logging.info("Built the earth observation MDP: [states=%d, actions=%d, time=%f]",
                  len(ground_mdp.states()),
                  len(ground_mdp.actions()),
                  end - start)
 
-    abstract_mdp_file_path = get_abstraction_path(data_dir, config)
-
     if not simulate:
-        construct_abstract_mdp(ground_mdp, abstract_mdp_file_path, config)
+        construct_abstract_mdp(ground_mdp, cache, config)
     else:
-        print(abstract_mdp_file_path)
-        if os.path.isfile(abstract_mdp_file_path + ".pickle") and os.path.isfile(abstract_mdp_file_path + ".json"):
+        abstraction = cache.load("abstract_mdp", get_abstract_mdp_parameters(config), ABSTRACT_MDP_MODULES, read_abstract_mdp)
+        if abstraction:
             print(colored("Loading abstract MDP from cache.", "blue"))
-            # Load the abstract MDP 
-            abstract_mdp = pickle.load(open(abstract_mdp_file_path + ".pickle", "rb"))
+            # Load the abstract MDP with its log
+            abstract_mdp, log = abstraction
             # Simulate the PAMDP
             if config["abstract_aggregate"] == "MEAN":
-                # log = yaml.load(open(abstract_mdp_file_path + ".yaml"), Loader=yaml.CLoader)
-                log = json.load(open(abstract_mdp_file_path + ".json"))
                 simulate_PAMDP(log, ground_mdp, abstract_mdp, data_dir, config, force)
             # Solve and simulate the ground MDP only (no abstraction)
             elif config["abstract_aggregate"] == "NONE":
@@ -462,12 +762,11 @@ def run(data_dir, config, simulate=False, force=False):
                     if not force:
                         return
                
-                if os.path.isfile(abstract_mdp_file_path + "_mdp.pickle") and os.path.isfile(abstract_mdp_file_path + "_mdp.json"):
+                ground_solution = cache.load("ground_solution", get_ground_solution_parameters(config), GROUND_MDP_MODULES + SOLUTION_MODULES, read_ground_solution)
+                if ground_solution:
                     print(colored("Loading MDP solution from cache.", "blue"))
-                    # Load the MDP
-                    solution = pickle.load(open(abstract_mdp_file_path + "_mdp.pickle", "rb"))
-                    # log = yaml.load(open(abstract_mdp_file_path + "_mdp.yaml"), Loader=yaml.CLoader)
-                    log = json.load(open(abstract_mdp_file_path + "_mdp.json"))
+                    # Load the MDP solution with its log
+                    solution, log = ground_solution
                     simulate_MDP(log, ground_mdp, data_dir, config, force, solution, abstract_mdp)
                 else:
                     log = {
@@ -485,19 +784,20 @@ def run(data_dir, config, simulate=False, force=False):
                         }
                     }
                     print(colored("Solving ground MDP.", "blue"))
+                    solver_config = get_solver_config(config)
                     start = time.time()
-                    solution = cplex_mdp_solver.solve(ground_mdp, config["gamma"])
+                    if solver_config["solver"] == "CPLEX":
+                        import cplex_mdp_solver
+                        solution = cplex_mdp_solver.solve(ground_mdp, config["gamma"])
+                    else:
+                        solution = policy_sketch_refine.solve_mdp(ground_mdp, config["gamma"], solver_config=solver_config)
                     end = time.time()
+                    log["Earth Observation Ground MDP"]["Solver"] = solver_config
                     log["Earth Observation Ground MDP"]["Solving Time"] = round(end - start, 2)
                     log["Earth Observation Ground MDP"]["Solving Human Time"] = readable_time(end - start)
                     
-                    # Store log of MDP for timing
-                    # yaml.dump(log, open(abstract_mdp_file_path + "_mdp.yaml", "w"))
-                    json.dump(log, open(abstract_mdp_file_path + "_mdp.json", "w"), indent=4, sort_keys=True)
-
-                    # Store MDP solution
-                    with open(abstract_mdp_file_path + "_mdp.pickle", "wb") as f:
-                        print(pickle.dump(solution, f, pickle.HIGHEST_PROTOCOL))
+                    # Store MDP solution with its log for timing
+                    cache.save("ground_solution", get_ground_solution_parameters(config), GROUND_MDP_MODULES + SOLUTION_MODULES, artifact_cache.write_pickle(solution, log))
 
                     # Simulate the MDP (will extend the given log, but write to a different file)
                     simulate_MDP(log, ground_mdp, data_dir, config, force, solution, abstract_mdp)
@@ -513,33 +813,31 @@ def run(data_dir, config, simulate=False, force=False):
         #                                       policy_cache=policy_cache)
 
 def run_abstract(data_dir, config, simulate=False, force=False):
-    size = config["width"], config["height"]
-
     # Check data dir
     if not os.path.isdir(data_dir):
         raise Exception(f"Data directory {data_dir} does not exist. Create it and run this again.")
 
+    validate_policy_evaluation(config, get_config_flag(config, "factored", False))
+
+    cache = get_artifact_cache(data_dir, config)
+
     # Generate Earth Observation MDP
-    utils.set_domain_random_variation(config["domain_variation"])
     start = time.time()
-    ground_mdp = EarthObservationMDP(size, config["n_pois"], config["visibility"])
+    ground_mdp = get_ground_mdp(cache, config)
     end = time.time()
     logging.info("Built the earth observation MDP: [states=%d, actions=%d, time=%f]",
                  len(ground_mdp.states()),
                  len(ground_mdp.actions()),
                  end - start)
 
-    abstract_mdp_file_path = get_abstraction_path(data_dir, config)
-        
-    print(abstract_mdp_file_path)
-    if os.path.isfile(abstract_mdp_file_path + ".pickle") and os.path.isfile(abstract_mdp_file_path + ".json"):
+    abstraction = cache.load("abstract_mdp", get_abstract_mdp_parameters(config), ABSTRACT_MDP_MODULES, read_abstract_mdp)
+    if abstraction:
         print(colored("Loading abstract MDP from cache.", "blue"))
-        # Load the abstract MDP 
-        abstract_mdp = pickle.load(open(abstract_mdp_file_path + ".pickle", "rb"))
+        # Load the abstract MDP with its log
+        abstract_mdp, log = abstraction
 
         # Simulate the abstract MDP
         if config["abstract_aggregate"] == "MEAN":
-            log = json.load(open(abstract_mdp_file_path + ".json"))
             simulate_abstract_MDP(log, ground_mdp, abstract_mdp, data_dir, config, force)
         else:
             raise AssertionError("Abstract_aggregate not recognized")
@@ -98,6 +98,24 @@ class GridWorldMDP:
 
         return 0
 
+    def successors(self, state, action):
+        row = math.floor(state / self.width)
+        column = state - row * self.width
+
+        # Only the current cell and its neighbors can be reached by moving or slipping
+        candidate_successor_states = [state]
+        for row_offset, column_offset in [[-1, 0], [0, -1], [0, 1], [1, 0]]:
+            if 0 <= row + row_offset < self.height and 0 <= column + column_offset < self.width:
+                candidate_successor_states.append(self.width * (row + row_offset) + column + column_offset)
+
+        successors = []
+        for successor_state in sorted(candidate_successor_states):
+            probability = self.transition_function(state, action, successor_state)
+            if probability > 0:
+                successors.append((successor_state, probability))
+
+        return successors
+
     def reward_function(self, state, action):
         row = math.floor(state / self.width)
         column = state - row * self.width
@@ -0,0 +1,129 @@
+import logging
+
+import numpy as np
+from scipy.sparse import diags
+
+import utils
+from memory_mdp import MemoryMDP, get_transition_matrix, validate
+
+METHODS = ['VALUE_ITERATION', 'POLICY_ITERATION', 'GAUSS_SEIDEL']
+
+DEFAULT_TOLERANCE = 1e-6
+DEFAULT_MAX_ITERATIONS = 100000
+
+# The number of evaluation sweeps that modified policy iteration runs for each policy
+POLICY_EVALUATION_SWEEPS = 20
+
+
+def get_action_values(values, rewards, transition_matrices, gamma):
+    return np.stack([rewards[:, j] + gamma * (transition_matrix @ values) for j, transition_matrix in enumerate(transition_matrices)], axis=1)
+
+
+# The greedy policy takes the first best action in the same way as the strict > comparison of the CPLEX solver
+def get_greedy_policy(values, rewards, transition_matrices, gamma):
+    return utils.get_best_action_indices(get_action_values(values, rewards, transition_matrices, gamma))
+
+
+def run_value_iteration(values, is_variable_state, rewards, transition_matrices, gamma, tolerance, max_iterations):
+    for iteration in range(1, max_iterations + 1):
+        new_values = np.where(is_variable_state, np.max(get_action_values(values, rewards, transition_matrices, gamma), axis=1), values)
+
+        delta = np.max(np.abs(new_values - values), initial=0)
+        values = new_values
+
+        if delta < tolerance:
+            return values, iteration, True
+
+    return values, max_iterations, False
+
+
+def run_policy_iteration(values, is_variable_state, rewards, transition_matrices, gamma, tolerance, max_iterations):
+    iteration = 0
+
+    while iteration < max_iterations:
+        policy = get_greedy_policy(values, rewards, transition_matrices, gamma)
+
+        # Build the rewards and the transition matrix of the current policy to evaluate it with a few sweeps
+        policy_rewards = rewards[np.arange(len(policy)), policy]
+        policy_transition_matrix = sum(diags((policy == j).astype(float)) @ transition_matrix for j, transition_matrix in enumerate(transition_matrices)).tocsr()
+
+        for _ in range(POLICY_EVALUATION_SWEEPS):
+            iteration += 1
+
+            new_values = np.where(is_variable_state, policy_rewards + gamma * (policy_transition_matrix @ values), values)
+
+            delta = np.max(np.abs(new_values - values), initial=0)
+            values = new_values
+
+            if delta < tolerance or iteration >= max_iterations:
+                break
+
+        if delta < tolerance and np.array_equal(policy, get_greedy_policy(values, rewards, transition_matrices, gamma)):
+            return values, iteration, True
+
+    return values, iteration, False
+
+
+def run_gauss_seidel(values, is_variable_state, rewards, transition_matrices, gamma, tolerance, max_iterations):
+    values = values.copy()
+
+    variable_state_indices = np.flatnonzero(is_variable_state)
+
+    for iteration in range(1, max_iterations + 1):
+        delta = 0
+
+        # Sweep over the states in place so that each backup already uses the values updated earlier in the sweep
+        for i in variable_state_indices:
+            best_action_value = None
+
+            for j, transition_matrix in enumerate(transition_matrices):
+                start, end = transition_matrix.indptr[i], transition_matrix.indptr[i + 1]
+                action_value = rewards[i, j] + gamma * np.dot(transition_matrix.data[start:end], values[transition_matrix.indices[start:end]])
+
+                if best_action_value is None or action_value > best_action_value:
+                    best_action_value = action_value
+
+            delta = max(delta, abs(best_action_value - values[i]))
+            values[i] = best_action_value
+
+        if delta < tolerance:
+            return values, iteration, True
+
+    return values, max_iterations, False
+
+
+SOLVERS = {
+    'VALUE_ITERATION': run_value_iteration,
+    'POLICY_ITERATION': run_policy_iteration,
+    'GAUSS_SEIDEL': run_gauss_seidel
+}
+
+
+def solve(mdp, gamma, constant_state_values={}, relax_infeasible=False, method='VALUE_ITERATION', tolerance=DEFAULT_TOLERANCE, max_iterations=DEFAULT_MAX_ITERATIONS):
+    if method not in SOLVERS:
+        raise ValueError(f"Invalid parameter provided: method must be in {METHODS}")
+
+    # NOTE: The relax_infeasible parameter only exists for compatibility with the CPLEX solver since every MDP is feasible here
+    memory_mdp = MemoryMDP(mdp, is_sparse=True)
+
+    validate(memory_mdp, constant_state_values)
+
+    transition_matrices = [get_transition_matrix(memory_mdp, j) for j in range(memory_mdp.n_actions)]
+
+    is_variable_state = np.array([state not in constant_state_values for state in memory_mdp.states], dtype=bool)
+    initial_values = np.array([constant_state_values.get(state, 0) for state in memory_mdp.states], dtype=float)
+
+    values, iterations, is_converged = SOLVERS[method](initial_values, is_variable_state, memory_mdp.rewards, transition_matrices, gamma, tolerance, max_iterations)
+
+    if not is_converged:
+        logging.warning("Failed to converge within the maximum number of iterations: [method=%s, iterations=%d]", method, iterations)
+
+    policy = get_greedy_policy(values, memory_mdp.rewards, transition_matrices, gamma)
+
+    variable_state_indices = np.flatnonzero(is_variable_state)
+
+    return {
+        'objective_value': float(np.dot(memory_mdp.start_state_probabilities[variable_state_indices], values[variable_state_indices])),
+        'values': {memory_mdp.states[i]: float(values[i]) for i in variable_state_indices},
+        'policy': {memory_mdp.states[i]: memory_mdp.actions[policy[i]] for i in variable_state_indices}
+    }
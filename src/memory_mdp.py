@@ -0,0 +1,88 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+
+import utils
+
+
+class MemoryMDP:
+    def __init__(self, mdp, is_sparse=False):
+        self.states = mdp.states()
+        self.actions = mdp.actions()
+
+        self.n_states = len(self.states)
+        self.n_actions = len(self.actions)
+
+        self.state_indices = {state: index for index, state in enumerate(self.states)}
+
+        self.is_sparse = is_sparse
+
+        self.rewards = np.array(utils.get_reward_matrix(mdp, self.states), dtype=float)
+
+        if self.is_sparse:
+            self.transition_probabilities = self.__compute_sparse_transition_probabilities(mdp)
+        else:
+            self.transition_probabilities = np.zeros(shape=(self.n_states, self.n_actions, self.n_states))
+            for state in range(self.n_states):
+                for action in range(self.n_actions):
+                    for successor_state, probability in utils.get_successors(mdp, self.states[state], self.actions[action]):
+                        self.transition_probabilities[state, action, self.state_indices[successor_state]] = probability
+
+        self.start_state_probabilities = np.zeros(self.n_states)
+        for state in range(self.n_states):
+            self.start_state_probabilities[state] = self.start_state_probabilities[state] = mdp.start_state_function(self.states[state])
+
+    # Build one CSR matrix of shape (n_states, n_states) per action that only stores the nonzero transition probabilities
+    def __compute_sparse_transition_probabilities(self, mdp):
+        transition_probabilities = []
+
+        for action in range(self.n_actions):
+            rows = []
+            columns = []
+            probabilities = []
+
+            for state in range(self.n_states):
+                for successor_state, probability in utils.get_successors(mdp, self.states[state], self.actions[action]):
+                    rows.append(state)
+                    columns.append(self.state_indices[successor_state])
+                    probabilities.append(probability)
+
+            transition_probabilities.append(csr_matrix((probabilities, (rows, columns)), shape=(self.n_states, self.n_states)))
+
+        return transition_probabilities
+
+
+# Return the CSR matrix of shape (n_states, n_states) of the transition probabilities of an action for either representation
+def get_transition_matrix(memory_mdp, action):
+    if memory_mdp.is_sparse:
+        return memory_mdp.transition_probabilities[action]
+    return csr_matrix(memory_mdp.transition_probabilities[:, action, :])
+
+
+# Return the (n_states, n_actions) array of R + gamma * T * V for the value of every state
+def get_action_values(memory_mdp, values, gamma):
+    # Sparse products sum each row sequentially so that identical successor distributions always produce identical values
+    # (unlike a dense BLAS product), which keeps ties between actions and results reproducible
+    expected_future_values = np.stack([get_transition_matrix(memory_mdp, j) @ values for j in range(memory_mdp.n_actions)], axis=1)
+
+    return memory_mdp.rewards + gamma * expected_future_values
+
+
+def validate(memory_mdp, constant_state_values):
+    assert memory_mdp.n_states is not None
+    assert memory_mdp.n_actions is not None
+
+    assert memory_mdp.states is not None
+    assert memory_mdp.actions is not None
+    assert memory_mdp.rewards is not None
+    assert memory_mdp.transition_probabilities is not None
+    assert memory_mdp.start_state_probabilities is not None
+
+    assert memory_mdp.rewards.shape == (memory_mdp.n_states, memory_mdp.n_actions)
+    if memory_mdp.is_sparse:
+        assert len(memory_mdp.transition_probabilities) == memory_mdp.n_actions
+        assert all(matrix.shape == (memory_mdp.n_states, memory_mdp.n_states) for matrix in memory_mdp.transition_probabilities)
+    else:
+        assert memory_mdp.transition_probabilities.shape == (memory_mdp.n_states, memory_mdp.n_actions, memory_mdp.n_states)
+    assert memory_mdp.start_state_probabilities.shape == (memory_mdp.n_states,)
+
+    assert all(state in memory_mdp.states for state in constant_state_values)
@@ -1,146 +1,430 @@
+from collections import OrderedDict
 from concurrent.futures import ProcessPoolExecutor
 
+import numpy as np
+
 import printer
 import utils
 
 NUM_PROCESSES = 8
 
+# The number of ground blocks that a PAMDP cache holds before it evicts the least recently used one
+DEFAULT_CACHE_SIZE = 1024
+
+
+# The models that each worker process receives once when it starts instead of with every task
+WORKER_STATE = {}
+
+
+# Every ground state has the same weight within its abstract state so there is no need to hold a weight for each one
+def get_weight(ground_states):
+    return 1 / len(ground_states)
+
+
+def is_factored(abstract_mdp):
+    return getattr(abstract_mdp, 'is_factored', False)
+
+
+# A factored abstract state can hold more ground states than a PAMDP could ever enumerate so a factored PAMDP only ever
+# visits the ground states of the abstract states that it grounds
+def get_ground_states(abstract_mdp, abstract_states, is_grounded):
+    assert is_grounded or not is_factored(abstract_mdp), "A factored PAMDP cannot visit the ground states of an abstract state that it does not ground"
+    return abstract_mdp.get_ground_states(abstract_states)
+
+
+# The reward of an abstract state in a PAMDP is the mean reward of its ground states, which the abstraction already holds
+# whenever it takes the mean over every ground state instead of the maximum or the mean of a sample
+def get_abstract_rewards(ground_mdp, abstract_mdp, abstract_state):
+    if getattr(abstract_mdp, 'abstraction', None) == 'MEAN' and getattr(abstract_mdp, 'num_samples', None) is None:
+        return {action: abstract_mdp.reward_function(abstract_state, action) for action in ground_mdp.actions()}
+
+    if is_factored(abstract_mdp):
+        raise ValueError("Invalid parameter provided: a factored PAMDP requires the MEAN abstraction")
+
+    reward_matrix = utils.get_reward_matrix(ground_mdp, get_ground_states(abstract_mdp, [abstract_state], False))
+    return dict(zip(ground_mdp.actions(), reward_matrix.mean(axis=0).tolist()))
+
+
+# NOTE: The start state distribution of a factored ground MDP is uniform so the start state probability of a factored
+# abstract state only depends on how many ground states it holds
+def get_abstract_start_state_probability(ground_mdp, abstract_mdp, abstract_state):
+    if is_factored(abstract_mdp):
+        return abstract_mdp.get_num_ground_states(abstract_state) / len(ground_mdp.states())
+
+    start_state_probability = 0
+    for ground_state in get_ground_states(abstract_mdp, [abstract_state], False):
+        start_state_probability += ground_mdp.start_state_function(ground_state)
+
+    return start_state_probability
+
+
+def compute_states(abstract_mdp, grounded_abstract_states):
+    ground_states = get_ground_states(abstract_mdp, grounded_abstract_states, True)
+    abstract_states = [abstract_state for abstract_state in abstract_mdp.states() if abstract_state not in grounded_abstract_states]
+    all_states = ground_states + abstract_states
+    return all_states
+
+
+def initialize_worker(ground_mdp, abstract_mdp):
+    WORKER_STATE['ground_mdp'] = ground_mdp
+    WORKER_STATE['abstract_mdp'] = abstract_mdp
+    WORKER_STATE['state_space_key'] = None
+
+
+# Splits the state space of a PAMDP into its ground states and its abstract states
+def get_state_sets(abstract_mdp, state_space):
+    abstract_state_set = set(abstract_mdp.states()).intersection(state_space)
+    ground_state_set = set(state_space) - abstract_state_set
+    return state_space, ground_state_set, abstract_state_set
+
+
+# Every task of the same PAMDP shares its state space so a worker only rebuilds it when a new PAMDP comes along
+def get_worker_state_space(grounded_abstract_states):
+    if WORKER_STATE['state_space_key'] != grounded_abstract_states:
+        WORKER_STATE['state_space_key'] = grounded_abstract_states
+        WORKER_STATE['state_space'] = get_state_sets(WORKER_STATE['abstract_mdp'], compute_states(WORKER_STATE['abstract_mdp'], list(grounded_abstract_states)))
+
+    return WORKER_STATE['state_space']
+
+
+def task(grounded_abstract_states, start, end):
+    state_sets = get_worker_state_space(grounded_abstract_states)
+    return compute_transition_probabilities(WORKER_STATE['ground_mdp'], WORKER_STATE['abstract_mdp'], grounded_abstract_states, state_sets, start, end)
+
+
+def compute_transition_probabilities(ground_mdp, abstract_mdp, grounded_abstract_states, state_sets, start, end):
+    state_space, ground_state_set, abstract_state_set = state_sets
 
-def task(abstract_mdp, ground_mdp, state_space, ground_state_set, abstract_state_set, pamdp):
     results = {}
 
-    for state in state_space:
+    for state in state_space[start:end]:
         results[state] = {}
 
-        for action in pamdp.action_space:
+        for action in ground_mdp.actions():
             results[state][action] = {}
 
-            for successor_state in pamdp.state_space:
-                probability = 0
+            # s is a ground state
+            if state in ground_state_set:
+                for ground_successor_state, probability in utils.get_successors(ground_mdp, state, action):
+                    # s' is either a ground state or the abstract state that contains it
+                    if ground_successor_state in ground_state_set:
+                        successor_state = ground_successor_state
+                    else:
+                        successor_state = abstract_mdp.get_abstract_state(ground_successor_state)
 
-                # Both s and s' are ground states
-                if state in ground_state_set and successor_state in ground_state_set:
-                    probability = ground_mdp.transition_function(state, action, successor_state)
+                    results[state][action][successor_state] = results[state][action].get(successor_state, 0) + probability
 
-                # s is a ground state, s' is an abstract state
-                elif state in ground_state_set and successor_state in abstract_state_set:
-                    # If transition probability in abstract mdp is zero, then it is also zero for any underlying ground states!
-                    if abstract_mdp.transition_function(abstract_mdp.get_abstract_state(state), action, successor_state) > 0:       # comment this and the identical line below for benchmarking
-                        for ground_successor_state in abstract_mdp.get_ground_states([successor_state]):
-                            probability += ground_mdp.transition_function(state, action, ground_successor_state)
+            # s is an abstract state
+            else:
+                is_ground_successor_possible = False
+
+                for successor_state, probability in utils.get_successors(abstract_mdp, state, action):
+                    # Both s and s' are abstract states
+                    if successor_state in abstract_state_set:
+                        results[state][action][successor_state] = probability
+                    else:
+                        is_ground_successor_possible = True
+
+                # If transition probability in abstract mdp is zero, then it is also zero for any underlying ground states!
+                if is_ground_successor_possible and is_factored(abstract_mdp):
+                    for grounded_abstract_state in grounded_abstract_states:
+                        ground_successor_states, probabilities = abstract_mdp.get_ground_successor_distribution(ground_mdp, state, action, grounded_abstract_state)
+                        results[state][action].update(zip(ground_successor_states.tolist(), probabilities.tolist()))
+                elif is_ground_successor_possible:
+                    ground_states = get_ground_states(abstract_mdp, [state], False)
+                    weight = get_weight(ground_states)
+
+                    for ground_state in ground_states:
+                        for ground_successor_state, probability in utils.get_successors(ground_mdp, ground_state, action):
+                            # s' is a ground state
+                            if ground_successor_state in ground_state_set:
+                                results[state][action][ground_successor_state] = results[state][action].get(ground_successor_state, 0) + weight * probability
 
-                # s is an abstract state and s' is a ground state
-                elif state in abstract_state_set and successor_state in ground_state_set:
-                    # If transition probability in abstract mdp is zero, then it is also zero for any underlying ground states!
-                    if abstract_mdp.transition_function(state, action, abstract_mdp.get_abstract_state(successor_state)) > 0:
-                        for ground_state in abstract_mdp.get_ground_states([state]):
-                            probability += pamdp.weights[ground_state] * ground_mdp.transition_function(ground_state, action, successor_state)
+    return results
 
-                # Both s and s' are abstract states
-                else:
-                    probability = abstract_mdp.transition_function(state, action, successor_state)
 
-                results[state][action][successor_state] = probability
+# Computes the transition probabilities of PAMDPs in worker processes that hold the ground MDP and the abstract MDP
+# for the whole simulation so that each task only sends the grounded abstract states and a range of state indices
+class PartiallyAbstractMDPPool:
+    def __init__(self, ground_mdp, abstract_mdp, num_processes=NUM_PROCESSES):
+        if num_processes <= 0:
+            raise ValueError("Invalid parameter provided: num_processes must be positive")
 
-    return results
+        self.ground_mdp = ground_mdp
+        self.abstract_mdp = abstract_mdp
+        self.num_processes = num_processes
 
+        # Start the worker processes on the first PAMDP since the cache might build every PAMDP without them
+        self.pool = None
 
-class PartiallyAbstractMDP:
-    def __compute_weights(self, abstract_mdp):
-        weights = {}
+    def __enter__(self):
+        return self
 
-        for abstract_state in abstract_mdp.states():
-            ground_states = abstract_mdp.get_ground_states([abstract_state])
-            for ground_state in ground_states:
-                weights[ground_state] = 1 / len(ground_states)
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+
+    def compute_transition_probabilities(self, grounded_abstract_states, num_states):
+        if not self.pool:
+            self.pool = ProcessPoolExecutor(max_workers=self.num_processes, initializer=initialize_worker, initargs=(self.ground_mdp, self.abstract_mdp))
 
-        return weights
+        transition_probabilities = {}
 
-    def __compute_states(self, abstract_mdp, grounded_abstract_states):
-        ground_states = abstract_mdp.get_ground_states(grounded_abstract_states)
-        abstract_states = [abstract_state for abstract_state in abstract_mdp.states() if abstract_state not in grounded_abstract_states]
-        all_states = ground_states + abstract_states
-        return all_states
+        grounded_abstract_states = tuple(grounded_abstract_states)
+        partition_size = -(-num_states // self.num_processes)
 
-    def __compute_rewards(self, ground_mdp, abstract_mdp):
+        partition_futures = []
+        for start in range(0, num_states, partition_size):
+            partition_futures.append(self.pool.submit(task, grounded_abstract_states, start, min(start + partition_size, num_states)))
+
+        statistics = {'count': 0, 'total': len(partition_futures)}
+
+        for partition_future in partition_futures:
+            printer.print_loading_bar(statistics['count'], statistics['total'], "Partially Abstract Transition Probabilities")
+            statistics['count'] += 1
+
+            transition_probabilities.update(partition_future.result())
+
+        return transition_probabilities
+
+    def shutdown(self):
+        if self.pool:
+            self.pool.shutdown(wait=True)
+            self.pool = None
+
+
+# Holds the parts of a PAMDP that only depend on a single abstract state so that consecutive PAMDPs, which mostly ground
+# the same abstract states, can be assembled from them instead of being rebuilt from the ground MDP and the abstract MDP
+class PartiallyAbstractMDPCache:
+    def __init__(self, ground_mdp, abstract_mdp, max_size=DEFAULT_CACHE_SIZE):
+        if max_size <= 0:
+            raise ValueError("Invalid parameter provided: max_size must be positive")
+
+        self.ground_mdp = ground_mdp
+        self.abstract_mdp = abstract_mdp
+        self.max_size = max_size
+
+        # The abstract blocks are as small as the abstraction and every PAMDP reads almost all of them so they stay resident
+        # while only the ground blocks and the mass of the abstract states next to them go through the LRU
+        self.abstract_blocks = {}
+        self.entries = OrderedDict()
+
+        self.statistics = {
+            'Max Size': max_size,
+            'Abstract Blocks': 0,
+            'Size': 0,
+            'Hits': 0,
+            'Misses': 0,
+            'Evictions': 0
+        }
+
+    def __get_entry(self, key, compute_entry):
+        if key in self.entries:
+            self.statistics['Hits'] += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+        self.statistics['Misses'] += 1
+        entry = compute_entry(*key[1:])
+        self.entries[key] = entry
+
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.statistics['Evictions'] += 1
+
+        self.statistics['Size'] = len(self.entries)
+
+        return entry
+
+    def __compute_ground_block(self, abstract_state):
         rewards = {}
+        start_state_probabilities = {}
+        successors = {}
 
-        statistics = {'count': 0, 'total': len(self.state_space) * len(self.action_space)}
+        ground_states = get_ground_states(self.abstract_mdp, [abstract_state], True)
 
-        for state in self.state_space:
-            rewards[state] = {}
+        # Tag each ground successor with its abstract state so that a PAMDP can tell whether it is grounded without a lookup
+        batch_successors = {}
+        for action in self.ground_mdp.actions():
+            indices, ground_successor_states, probabilities = utils.get_batch_successor_arrays(self.ground_mdp, ground_states, action)
+            boundaries = [0] + np.searchsorted(indices, np.arange(1, len(ground_states))).tolist() + [len(indices)]
+            tagged_successors = list(zip(ground_successor_states.tolist(), utils.get_abstract_states(self.abstract_mdp, ground_successor_states), probabilities.tolist()))
+            batch_successors[action] = [tagged_successors[start:end] for start, end in zip(boundaries[:-1], boundaries[1:])]
 
-            # TODO: Make the lookup in this for loop more efficient
-            for action in self.action_space:
-                printer.print_loading_bar(statistics['count'], statistics['total'], 'Partially Abstract Rewards')
-                statistics['count'] += 1
-
-                # For a ground state, copy the reward from the ground MDP
-                if state in ground_mdp.states():
-                    rewards[state][action] = ground_mdp.reward_function(state, action)
-                # For an abstract state, use the weighted sum of all of its ground states rewards
-                else:
-                    rewards[state][action] = 0
-                    for ground_state in abstract_mdp.get_ground_states([state]):
-                        # TODO: Decide whether max is totally useless now - weights seem better
-                        rewards[state][action] += self.weights[ground_state] * ground_mdp.reward_function(ground_state, action)
-                        # rewards[state][action] = max(ground_mdp.reward_function(ground_state, action), rewards[state][action])
+        reward_matrix = utils.get_reward_matrix(self.ground_mdp, ground_states).tolist()
 
-        return rewards
+        for i, ground_state in enumerate(ground_states):
+            rewards[ground_state] = dict(zip(self.ground_mdp.actions(), reward_matrix[i]))
+            start_state_probabilities[ground_state] = self.ground_mdp.start_state_function(ground_state)
+            successors[ground_state] = {action: batch_successors[action][i] for action in self.ground_mdp.actions()}
 
-    def __compute_transition_probabilities(self, ground_mdp, abstract_mdp):
-        transition_probabilities = {}
+        return {'rewards': rewards, 'start_state_probabilities': start_state_probabilities, 'successors': successors}
 
-        ground_state_set = set(ground_mdp.states())
-        abstract_state_set = set(abstract_mdp.states())
+    def __compute_abstract_block(self, abstract_state):
+        rewards = get_abstract_rewards(self.ground_mdp, self.abstract_mdp, abstract_state)
+        start_state_probability = get_abstract_start_state_probability(self.ground_mdp, self.abstract_mdp, abstract_state)
 
-        with ProcessPoolExecutor(max_workers=NUM_PROCESSES) as pool:
-            partition_futures = []
-            state_space_partitions = utils.get_partitions(self.state_space, NUM_PROCESSES)
+        successors = {action: utils.get_successors(self.abstract_mdp, abstract_state, action) for action in self.ground_mdp.actions()}
 
-            statistics = {'count': 0, 'total': len(state_space_partitions)}
+        return {'rewards': rewards, 'start_state_probability': start_state_probability, 'successors': successors}
 
-            for state_space in state_space_partitions:
-                printer.print_loading_bar(statistics['count'], statistics['total'], "Partially Abstract Transition Probabilities")
-                statistics['count'] += 1
+    # The weighted probability mass that an abstract state sends to each ground successor is only needed when an abstract
+    # state is next to a grounded abstract state so it is cached separately from the rest of the abstract state and is
+    # grouped by the abstract state of each ground successor so that a PAMDP only visits the grounded abstract states
+    def __compute_abstract_block_mass(self, abstract_state):
+        ground_states = get_ground_states(self.abstract_mdp, [abstract_state], False)
+        weight = get_weight(ground_states)
 
-                partition_future = pool.submit(task, abstract_mdp, ground_mdp, state_space, ground_state_set, abstract_state_set, self)
-                partition_futures.append(partition_future)
+        mass = {}
+        for action in self.ground_mdp.actions():
+            _, ground_successor_states, probabilities = utils.get_batch_successor_arrays(self.ground_mdp, ground_states, action)
 
-            for partition_future in partition_futures:
-                result = partition_future.result()
-                for key in result:
-                    transition_probabilities[key] = result[key]
+            # NOTE: The unbuffered add accumulates in the order of the ground states just like a running sum would
+            unique_ground_successor_states, inverse = np.unique(ground_successor_states, return_inverse=True)
+            totals = np.zeros(len(unique_ground_successor_states))
+            np.add.at(totals, inverse.ravel(), weight * probabilities)
 
-        return transition_probabilities
+            abstract_successor_states = np.array(utils.get_abstract_states(self.abstract_mdp, unique_ground_successor_states), dtype=object)
+            order = np.argsort(abstract_successor_states, kind='stable')
+            boundaries = np.flatnonzero(abstract_successor_states[order][1:] != abstract_successor_states[order][:-1]) + 1
+
+            mass[action] = {}
+            for group in np.split(order, boundaries):
+                if len(group) > 0:
+                    mass[action][abstract_successor_states[group[0]]] = list(zip(unique_ground_successor_states[group].tolist(), totals[group].tolist()))
+
+        return mass
+
+    # A factored abstract state sends its mass to the ground states of a single grounded abstract state in closed form
+    def __compute_factored_abstract_block_mass(self, abstract_state, grounding_abstract_state):
+        mass = {}
+        for action in self.ground_mdp.actions():
+            ground_successor_states, probabilities = self.abstract_mdp.get_ground_successor_distribution(self.ground_mdp, abstract_state, action, grounding_abstract_state)
+            mass[action] = list(zip(ground_successor_states.tolist(), probabilities.tolist()))
+
+        return mass
+
+    def get_ground_block(self, abstract_state):
+        return self.__get_entry(('ground', abstract_state), self.__compute_ground_block)
+
+    def get_abstract_block(self, abstract_state):
+        if abstract_state not in self.abstract_blocks:
+            self.abstract_blocks[abstract_state] = self.__compute_abstract_block(abstract_state)
+            self.statistics['Abstract Blocks'] = len(self.abstract_blocks)
+
+        return self.abstract_blocks[abstract_state]
+
+    def get_abstract_block_mass(self, abstract_state, action, grounding_abstract_state):
+        if is_factored(self.abstract_mdp):
+            return self.__get_entry(('mass', abstract_state, grounding_abstract_state), self.__compute_factored_abstract_block_mass)[action]
+
+        return self.__get_entry(('mass', abstract_state), self.__compute_abstract_block_mass)[action].get(grounding_abstract_state, [])
+
+
+class PartiallyAbstractMDP:
+    def __compute_rewards(self, ground_mdp, abstract_mdp):
+        rewards = {}
+
+        statistics = {'count': 0, 'total': len(self.state_space) * len(self.action_space)}
+
+        abstract_state_set = set(abstract_mdp.states())
+
+        for state in self.state_space:
+            printer.print_loading_bar(statistics['count'], statistics['total'], 'Partially Abstract Rewards')
+            statistics['count'] += len(self.action_space)
+
+            # For a ground state, copy the reward from the ground MDP
+            if state not in abstract_state_set:
+                rewards[state] = {action: ground_mdp.reward_function(state, action) for action in self.action_space}
+            # For an abstract state, use the mean reward of its ground states
+            else:
+                rewards[state] = get_abstract_rewards(ground_mdp, abstract_mdp, state)
+
+        return rewards
+
+    def __compute_transition_probabilities(self, ground_mdp, abstract_mdp, grounding_abstract_states, pool):
+        if pool:
+            return pool.compute_transition_probabilities(grounding_abstract_states, len(self.state_space))
+
+        # Without a pool from the caller, compute them in this process since the caller is either a worker process itself
+        # (e.g., a prefetch worker) or only builds the odd PAMDP, and a pool for each PAMDP would oversubscribe the machine
+        state_sets = get_state_sets(abstract_mdp, self.state_space)
+        return compute_transition_probabilities(ground_mdp, abstract_mdp, tuple(grounding_abstract_states), state_sets, 0, len(self.state_space))
 
     def __compute_start_state_probabilities(self, ground_mdp, abstract_mdp):
         start_state_probabilities = {}
 
         statistics = {'count': 0, 'total': len(self.state_space)}
 
+        abstract_state_set = set(abstract_mdp.states())
+
         for state in self.state_space:
             printer.print_loading_bar(statistics['count'], statistics['total'], "Partially Abstract Start State Probabilities")
             statistics['count'] += 1
 
-            start_state_probabilities[state] = 0
-
-            if state in ground_mdp.states():
+            if state not in abstract_state_set:
                 start_state_probabilities[state] = ground_mdp.start_state_function(state)
             else:
-                for ground_state in abstract_mdp.get_ground_states([state]):
-                    start_state_probabilities[state] += ground_mdp.start_state_function(ground_state)
+                start_state_probabilities[state] = get_abstract_start_state_probability(ground_mdp, abstract_mdp, state)
 
         return start_state_probabilities
 
-    def __init__(self, ground_mdp, abstract_mdp, grounding_abstract_states):
-        self.weights = self.__compute_weights(abstract_mdp)
+    def __assemble(self, abstract_mdp, grounding_abstract_states, cache):
+        self.rewards = {}
+        self.transition_probabilities = {}
+        self.start_state_probabilities = {}
+
+        grounding_abstract_state_set = set(grounding_abstract_states)
+
+        for grounding_abstract_state in grounding_abstract_states:
+            ground_block = cache.get_ground_block(grounding_abstract_state)
 
-        self.state_space = self.__compute_states(abstract_mdp, grounding_abstract_states)
+            for ground_state, ground_successors in ground_block['successors'].items():
+                self.rewards[ground_state] = dict(ground_block['rewards'][ground_state])
+                self.start_state_probabilities[ground_state] = ground_block['start_state_probabilities'][ground_state]
+
+                self.transition_probabilities[ground_state] = {}
+                for action in self.action_space:
+                    results = self.transition_probabilities[ground_state][action] = {}
+
+                    # s' is either a ground state or the abstract state that contains it
+                    for ground_successor_state, abstract_successor_state, probability in ground_successors[action]:
+                        successor_state = ground_successor_state if abstract_successor_state in grounding_abstract_state_set else abstract_successor_state
+                        results[successor_state] = results.get(successor_state, 0) + probability
+
+        for abstract_state in abstract_mdp.states():
+            if abstract_state in grounding_abstract_state_set:
+                continue
+
+            abstract_block = cache.get_abstract_block(abstract_state)
+
+            self.rewards[abstract_state] = dict(abstract_block['rewards'])
+            self.start_state_probabilities[abstract_state] = abstract_block['start_state_probability']
+
+            self.transition_probabilities[abstract_state] = {}
+            for action in self.action_space:
+                results = self.transition_probabilities[abstract_state][action] = {}
+
+                is_ground_successor_possible = False
+                for successor_state, probability in abstract_block['successors'][action]:
+                    if successor_state in grounding_abstract_state_set:
+                        is_ground_successor_possible = True
+                    else:
+                        results[successor_state] = probability
+
+                if is_ground_successor_possible:
+                    for grounding_abstract_state in grounding_abstract_states:
+                        results.update(cache.get_abstract_block_mass(abstract_state, action, grounding_abstract_state))
+
+    def __init__(self, ground_mdp, abstract_mdp, grounding_abstract_states, cache=None, pool=None):
+        self.state_space = compute_states(abstract_mdp, grounding_abstract_states)
         self.action_space = ground_mdp.actions()
-        self.rewards = self.__compute_rewards(ground_mdp, abstract_mdp)
-        self.transition_probabilities = self.__compute_transition_probabilities(ground_mdp, abstract_mdp)
-        self.start_state_probabilities = self.__compute_start_state_probabilities(ground_mdp, abstract_mdp)
+
+        if cache:
+            self.__assemble(abstract_mdp, grounding_abstract_states, cache)
+        else:
+            self.rewards = self.__compute_rewards(ground_mdp, abstract_mdp)
+            self.transition_probabilities = self.__compute_transition_probabilities(ground_mdp, abstract_mdp, grounding_abstract_states, pool)
+            self.start_state_probabilities = self.__compute_start_state_probabilities(ground_mdp, abstract_mdp)
 
     def states(self):
         return list(self.state_space)
@@ -152,7 +436,10 @@ class PartiallyAbstractMDP:
         return self.rewards[state][action]
 
     def transition_function(self, state, action, successor_state):
-        return self.transition_probabilities[state][action][successor_state]
+        return self.transition_probabilities[state][action].get(successor_state, 0)
+
+    def successors(self, state, action):
+        return list(self.transition_probabilities[state][action].items())
 
     def start_state_function(self, state):
         return self.start_state_probabilities[state]
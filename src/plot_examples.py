@@ -103,6 +103,26 @@ def calculate_statistics(independent, dependent):
 
     return independent_var, dependent_var_mean, dependent_var_var, conf_interval_95
 
+# Use a function for the Y axis (with sort=False since its results cannot be sorted)
+def rollouts(config, results):
+    return results["Simulation"]["Rollouts"]
+
+# Reads what calculate_statistics computes from the batch of rollouts of each config row instead of from one config row
+# per simulation variation (key is either "Return" or "Discounted Return")
+def calculate_rollout_statistics(independent, dependent, key="Return"):
+    independent_var = []
+    dependent_var_mean = []
+    dependent_var_var = []
+    conf_interval_95 = []
+
+    for x, results in sorted(zip(independent, dependent), key=lambda pair: pair[0]):
+        independent_var.append(x)
+        dependent_var_mean.append(results["Mean " + key])
+        dependent_var_var.append(results[key + " Variance"])
+        conf_interval_95.append(results[key + " Confidence Interval"])
+
+    return independent_var, dependent_var_mean, dependent_var_var, conf_interval_95
+
 def main():
     arg_parser = ArgumentParser()
     arg_parser.add_argument("baseline_config_file")
@@ -0,0 +1,116 @@
+import numpy as np
+from scipy.sparse import csr_matrix, identity
+from scipy.sparse.linalg import spsolve
+
+import utils
+
+METHODS = ['DIRECT', 'ITERATIVE']
+
+DEFAULT_METHOD = 'DIRECT'
+
+DEFAULT_TOLERANCE = 1e-10
+DEFAULT_MAX_ITERATIONS = 100000
+
+
+# Maps successor states to their indices in the state space with a binary search if the states are sorted integers
+def get_state_indices(states, successor_states):
+    state_array = np.asarray(states)
+    if state_array.dtype.kind in 'iu' and np.all(np.diff(state_array) > 0):
+        return np.searchsorted(state_array, successor_states)
+
+    state_indices = {state: index for index, state in enumerate(states)}
+    return np.array([state_indices[successor_state] for successor_state in successor_states.tolist()], dtype=int)
+
+
+# Builds the rewards and the CSR transition matrix of the Markov chain that a policy induces on an MDP
+def get_policy_model(mdp, policy):
+    states = mdp.states()
+    actions = mdp.actions()
+
+    policy_actions = [policy[state] for state in states]
+
+    rewards = np.zeros(len(states))
+    rows = []
+    columns = []
+    probabilities = []
+
+    # Batch the states of each action together so that the MDP can compute their successors all at once
+    for j, action in enumerate(actions):
+        action_state_indices = np.array([i for i, policy_action in enumerate(policy_actions) if policy_action == action], dtype=int)
+        if len(action_state_indices) == 0:
+            continue
+
+        action_states = [states[i] for i in action_state_indices.tolist()]
+        rewards[action_state_indices] = np.asarray(utils.get_reward_matrix(mdp, action_states))[:, j]
+
+        indices, successor_states, action_probabilities = utils.get_batch_successor_arrays(mdp, action_states, action)
+        rows.append(action_state_indices[indices])
+        columns.append(get_state_indices(states, successor_states))
+        probabilities.append(action_probabilities)
+
+    transition_matrix = csr_matrix((np.concatenate(probabilities), (np.concatenate(rows), np.concatenate(columns))), shape=(len(states), len(states)))
+
+    return rewards, transition_matrix
+
+
+def get_system_matrix(transition_matrix, gamma):
+    return identity(transition_matrix.shape[0], format='csr') - gamma * transition_matrix
+
+
+# A direct solve is exact but its factorization fills in quickly when states have many successors like the weather does
+def run_direct(rewards, transition_matrix, gamma, tolerance, max_iterations):
+    values = spsolve(get_system_matrix(transition_matrix, gamma).tocsc(), rewards)
+    return values, 1, bool(np.all(np.isfinite(values)))
+
+
+# Iterates V <- R + gamma * P V from zero, which is a contraction for any gamma < 1 unlike a Krylov solver that can
+# break down on a nonsymmetric system, and stops once the values are within the tolerance of the fixed point
+def run_iterative(rewards, transition_matrix, gamma, tolerance, max_iterations):
+    values = np.zeros(len(rewards))
+
+    for iteration in range(1, max_iterations + 1):
+        new_values = rewards + gamma * (transition_matrix @ values)
+
+        delta = np.max(np.abs(new_values - values), initial=0)
+        values = new_values
+
+        if gamma * delta < tolerance * (1 - gamma):
+            return values, iteration, True
+
+    return values, max_iterations, False
+
+
+SOLVERS = {
+    'DIRECT': run_direct,
+    'ITERATIVE': run_iterative
+}
+
+
+# Solves (I - gamma * P) V = R for the exact values of a policy instead of estimating them with a simulation
+def evaluate(mdp, policy, gamma, method=DEFAULT_METHOD, tolerance=DEFAULT_TOLERANCE, max_iterations=DEFAULT_MAX_ITERATIONS):
+    if method not in SOLVERS:
+        raise ValueError(f"Invalid parameter provided: method must be in {METHODS}")
+
+    if not 0 <= gamma < 1:
+        raise ValueError("Invalid parameter provided: gamma must be in [0, 1)")
+
+    rewards, transition_matrix = get_policy_model(mdp, policy)
+
+    values, iterations, is_converged = SOLVERS[method](rewards, transition_matrix, gamma, tolerance, max_iterations)
+
+    # The values of an unconverged solve can be arbitrarily wrong so they are never returned
+    if not is_converged:
+        raise RuntimeError(f"Failed to converge within the maximum number of iterations: [method={method}, iterations={iterations}]")
+
+    residual = float(np.max(np.abs(rewards + gamma * (transition_matrix @ values) - values), initial=0))
+
+    states = mdp.states()
+    start_state_probabilities = np.array([mdp.start_state_function(state) for state in states], dtype=float)
+
+    return {
+        'objective_value': float(np.dot(start_state_probabilities, values)),
+        'values': {state: float(value) for state, value in zip(states, values.tolist())},
+        'method': method,
+        'iterations': iterations,
+        'residual': residual
+    }
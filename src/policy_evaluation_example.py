@@ -0,0 +1,56 @@
+import logging
+import time
+
+import numpy as np
+
+import iterative_mdp_solver
+import policy_evaluation
+import utils
+from earth_observation_mdp import EarthObservationMDP
+
+# The domain on which the iterative evaluation used to break down and report values that were far from the exact ones
+SIZE = (6, 4)
+POINTS_OF_INTEREST = 2
+VISIBILITY = None
+DOMAIN_VARIATION = 1
+
+GAMMA = 0.9
+
+# Every method must agree with the direct solve and with value iteration up to this tolerance
+TOLERANCE = 1e-6
+
+logging.basicConfig(format='[%(asctime)s|%(module)-30s|%(funcName)-10s|%(levelname)-5s] %(message)s', datefmt='%H:%M:%S', level=logging.INFO)
+
+
+def get_value_array(mdp, values):
+    return np.array([values[state] for state in mdp.states()])
+
+
+def main():
+    utils.set_domain_random_variation(DOMAIN_VARIATION)
+
+    start = time.time()
+    ground_mdp = EarthObservationMDP(SIZE, POINTS_OF_INTEREST, VISIBILITY)
+    logging.info("Built the earth observation MDP: [states=%d, actions=%d, time=%f]", len(ground_mdp.states()), len(ground_mdp.actions()), time.time() - start)
+
+    start = time.time()
+    solution = iterative_mdp_solver.solve(ground_mdp, GAMMA, tolerance=1e-12)
+    logging.info("Solved the earth observation MDP with value iteration: [time=%f]", time.time() - start)
+
+    expected_values = get_value_array(ground_mdp, solution['values'])
+
+    for method in policy_evaluation.METHODS:
+        start = time.time()
+        evaluation = policy_evaluation.evaluate(ground_mdp, solution['policy'], GAMMA, method)
+        logging.info("Evaluated the policy: [method=%s, objective_value=%f, iterations=%d, residual=%e, time=%f]",
+                     method, evaluation['objective_value'], evaluation['iterations'], evaluation['residual'], time.time() - start)
+
+        error = np.max(np.abs(get_value_array(ground_mdp, evaluation['values']) - expected_values))
+        assert error < TOLERANCE, f"The values of the {method} method are off by {error}"
+        assert abs(evaluation['objective_value'] - solution['objective_value']) < TOLERANCE, f"The objective value of the {method} method is off"
+
+    logging.info("Every method agrees with value iteration")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,98 @@
 import logging
 import time
+from collections import OrderedDict
 
-import cplex_mdp_solver
+import iterative_mdp_solver
 import utils
 from partially_abstract_mdp import PartiallyAbstractMDP
 
 logging.basicConfig(format='[%(asctime)s|%(module)-30s|%(funcName)-10s|%(levelname)-5s] %(message)s', datefmt='%H:%M:%S', level=logging.INFO)
 
 
-def sketch(abstract_mdp, gamma):
-    return cplex_mdp_solver.solve(abstract_mdp, gamma, constant_state_values={}, relax_infeasible=False)
+SOLVERS = ['CPLEX'] + iterative_mdp_solver.METHODS
 
+DEFAULT_SOLVER_CONFIG = {
+    'solver': 'CPLEX',
+    'tolerance': iterative_mdp_solver.DEFAULT_TOLERANCE,
+    'max_iterations': iterative_mdp_solver.DEFAULT_MAX_ITERATIONS
+}
 
-def refine(ground_mdp, ground_state, abstract_mdp, abstract_state, sketched_solution, expand_points_of_interest, expansion_level, gamma):
+
+def solve_mdp(mdp, gamma, constant_state_values={}, relax_infeasible=False, solver_config=None, solver_session=None):
+    solver_config = {**DEFAULT_SOLVER_CONFIG, **(solver_config or {})}
+
+    if solver_config['solver'] not in SOLVERS:
+        raise ValueError(f"Invalid parameter provided: solver must be in {SOLVERS}")
+
+    if solver_config['solver'] == 'CPLEX':
+        # NOTE: CPLEX is only imported once it is used so that the other solvers run without the licensed library
+        import cplex_mdp_solver
+
+        # Reuse the CPLEX problem of the previous MDP if there is a solver session since consecutive PAMDPs are nearly identical
+        if solver_session:
+            return solver_session.solve(mdp, gamma, constant_state_values=constant_state_values, relax_infeasible=relax_infeasible)
+        return cplex_mdp_solver.solve(mdp, gamma, constant_state_values=constant_state_values, relax_infeasible=relax_infeasible)
+
+    return iterative_mdp_solver.solve(mdp, gamma, constant_state_values=constant_state_values, relax_infeasible=relax_infeasible, method=solver_config['solver'],
+                                      tolerance=solver_config['tolerance'], max_iterations=solver_config['max_iterations'])
+
+
+# Sketched solutions keyed by the identity of the abstract MDP, gamma, and the solver since none of them change during a simulation
+# while only the few most recent ones stay in memory since every entry holds on to its whole abstract MDP
+MAX_SKETCH_CACHE_SIZE = 4
+SKETCH_CACHE = OrderedDict()
+
+
+def sketch(abstract_mdp, gamma, solver_config=None):
+    return solve_mdp(abstract_mdp, gamma, constant_state_values={}, relax_infeasible=False, solver_config=solver_config)
+
+
+def get_sketch_key(abstract_mdp, gamma, solver_config):
+    solver_config = {**DEFAULT_SOLVER_CONFIG, **(solver_config or {})}
+    return (id(abstract_mdp), gamma, tuple(sorted(solver_config.items())))
+
+
+# Hold on to the abstract MDP so that its identity cannot be reused by another abstract MDP while it is cached
+def cache_sketch(key, abstract_mdp, sketched_solution):
+    SKETCH_CACHE[key] = (abstract_mdp, sketched_solution)
+    SKETCH_CACHE.move_to_end(key)
+
+    while len(SKETCH_CACHE) > MAX_SKETCH_CACHE_SIZE:
+        SKETCH_CACHE.popitem(last=False)
+
+
+# Hands over a sketched solution that was loaded elsewhere so that every later sketch phase finds it in memory
+def set_sketch(abstract_mdp, gamma, solver_config, sketched_solution):
+    if sketched_solution:
+        cache_sketch(get_sketch_key(abstract_mdp, gamma, solver_config), abstract_mdp, sketched_solution)
+
+
+# Lets go of the sketched solutions of an abstract MDP once its simulation is over
+def clear_sketch(abstract_mdp):
+    for key in [key for key, (cached_abstract_mdp, _) in SKETCH_CACHE.items() if cached_abstract_mdp is abstract_mdp]:
+        del SKETCH_CACHE[key]
+
+
+# NOTE: A sketched solution is only persisted through the artifact cache of the experiment runner so that it is keyed on
+# everything that it depends on
+def get_sketch(abstract_mdp, gamma, solver_config=None):
+    solver_config = {**DEFAULT_SOLVER_CONFIG, **(solver_config or {})}
+    key = get_sketch_key(abstract_mdp, gamma, solver_config)
+
+    if key in SKETCH_CACHE:
+        logging.info("Loaded the sketched solution from memory")
+        SKETCH_CACHE.move_to_end(key)
+        return SKETCH_CACHE[key][1]
+
+    sketched_solution = sketch(abstract_mdp, gamma, solver_config)
+
+    if sketched_solution:
+        cache_sketch(key, abstract_mdp, sketched_solution)
+
+    return sketched_solution
+
+
+def refine(ground_mdp, ground_state, abstract_mdp, abstract_state, sketched_solution, expand_points_of_interest, expansion_level, gamma, solver_session=None, solver_config=None, pamdp_cache=None, pamdp_pool=None):
     if expansion_level == 'a':
         #values = {}
         #for state in ground_mdp.states():
@@ -71,7 +151,7 @@ def refine(ground_mdp, ground_state, abstract_mdp, abstract_state, sketched_solu
 
     # TODO Yikes...
     grounding_abstract_states = list(set([abstract_state] + list(point_of_interest_abstract_state_set)))
-    partially_abstract_mdp = PartiallyAbstractMDP(ground_mdp, abstract_mdp, grounding_abstract_states)
+    partially_abstract_mdp = PartiallyAbstractMDP(ground_mdp, abstract_mdp, grounding_abstract_states, pamdp_cache, pamdp_pool)
     logging.info("Built the PAMDP: [states=%d, actions=%d, time=%f]", len(partially_abstract_mdp.states()), len(partially_abstract_mdp.actions()), time.time() - start)
 
     abstract_state_set = set(abstract_mdp.states())
@@ -117,15 +197,15 @@ def refine(ground_mdp, ground_state, abstract_mdp, abstract_state, sketched_solu
     constant_state_values = {}
 
     start = time.time()
-    refined_solution = cplex_mdp_solver.solve(partially_abstract_mdp, gamma, constant_state_values=constant_state_values, relax_infeasible=False)
-    logging.info("Ran the CPLEX solver: [time=%f]", time.time() - start)
+    refined_solution = solve_mdp(partially_abstract_mdp, gamma, constant_state_values=constant_state_values, relax_infeasible=False, solver_config=solver_config, solver_session=solver_session)
+    logging.info("Ran the solver: [time=%f]", time.time() - start)
 
     if refined_solution:
         logging.info("Found a feasible solution to the PAMDP")
         return refined_solution
     else:
         logging.error("Failed to find a feasible solution to the PAMDP")
-        refined_solution = cplex_mdp_solver.solve(partially_abstract_mdp, gamma, constant_state_values=constant_state_values, relax_infeasible=True)
+        refined_solution = solve_mdp(partially_abstract_mdp, gamma, constant_state_values=constant_state_values, relax_infeasible=True, solver_config=solver_config, solver_session=solver_session)
         if refined_solution:        
             logging.info('Found a feasible solution to the PAMDP after relaxing some constraints')
             return refined_solution
@@ -133,15 +213,15 @@ def refine(ground_mdp, ground_state, abstract_mdp, abstract_state, sketched_solu
             logging.info('Could not find a feasible solution to the PAMDP')
             return refined_solution
 
-def solve(ground_mdp, ground_state, abstract_mdp, abstract_state, expand_points_of_interest, expansion_level, gamma):
+def solve(ground_mdp, ground_state, abstract_mdp, abstract_state, expand_points_of_interest, expansion_level, gamma, solver_session=None, solver_config=None, pamdp_cache=None, pamdp_pool=None):
     logging.info("Starting the sketch phase...")
     start = time.time()
-    sketched_solution = sketch(abstract_mdp, gamma)
+    sketched_solution = get_sketch(abstract_mdp, gamma, solver_config)
     logging.info("Finished the sketch phase: [time=%f]", time.time() - start)
 
     logging.info("Starting the refine phase...")
     start = time.time()
-    refined_solution = refine(ground_mdp, ground_state, abstract_mdp, abstract_state, sketched_solution, expand_points_of_interest, expansion_level, gamma)
+    refined_solution = refine(ground_mdp, ground_state, abstract_mdp, abstract_state, sketched_solution, expand_points_of_interest, expansion_level, gamma, solver_session, solver_config, pamdp_cache, pamdp_pool)
     logging.info("Finished the refine phase: [time=%f]", time.time() - start)
 
     return refined_solution
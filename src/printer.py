@@ -2,6 +2,8 @@ import sys
 
 from termcolor import colored
 
+import utils
+
 
 def print_states(mdp):
     print("States:")
@@ -28,10 +30,7 @@ def print_transition_function(mdp):
 
             total_probability = 0
 
-            for successor_state in mdp.states():
-                probability = mdp.transition_function(
-                    state, action, successor_state)
-
+            for successor_state, probability in utils.get_successors(mdp, state, action):
                 total_probability += probability
 
                 if probability > 0:
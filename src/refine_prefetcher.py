@@ -0,0 +1,202 @@
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import policy_sketch_refine
+import utils
+from partially_abstract_mdp import PartiallyAbstractMDPCache
+
+# The models and settings that each worker process receives once when it starts instead of with every task
+WORKER_STATE = {}
+
+
+def initialize_worker(ground_mdp, abstract_mdp, sketched_solution, expand_points_of_interest, expansion_level, gamma, solver_config, pamdp_cache_size):
+    logging.disable(logging.INFO)
+
+    WORKER_STATE['ground_mdp'] = ground_mdp
+    WORKER_STATE['abstract_mdp'] = abstract_mdp
+    WORKER_STATE['sketched_solution'] = sketched_solution
+    WORKER_STATE['expand_points_of_interest'] = expand_points_of_interest
+    WORKER_STATE['expansion_level'] = expansion_level
+    WORKER_STATE['gamma'] = gamma
+    WORKER_STATE['solver_config'] = solver_config
+    # NOTE: A worker never gets a PAMDP pool since it already runs next to the other workers so without the cache it
+    # builds the transitions of each PAMDP in its own process
+    WORKER_STATE['pamdp_cache'] = PartiallyAbstractMDPCache(ground_mdp, abstract_mdp, pamdp_cache_size) if pamdp_cache_size > 0 else None
+
+
+def task(ground_state, abstract_state):
+    start = time.time()
+
+    ground_mdp = WORKER_STATE['ground_mdp']
+    abstract_mdp = WORKER_STATE['abstract_mdp']
+    gamma = WORKER_STATE['gamma']
+
+    # NOTE: A solver session would carry over whichever refines this worker happened to run before so every refine starts fresh,
+    # which gives the same policy as the solver session of the simulation since both break near-ties the same way
+    solution = policy_sketch_refine.refine(ground_mdp, ground_state, abstract_mdp, abstract_state, WORKER_STATE['sketched_solution'],
+                                           WORKER_STATE['expand_points_of_interest'], WORKER_STATE['expansion_level'], gamma,
+                                           None, WORKER_STATE['solver_config'], WORKER_STATE['pamdp_cache'])
+
+    if not solution:
+        return None, time.time() - start
+
+    ground_states = abstract_mdp.get_ground_states([abstract_state])
+    values = utils.get_ground_entities(solution['values'], ground_mdp, abstract_mdp, ground_states + list(utils.get_successor_state_set(ground_mdp, ground_states)))
+    policy = utils.get_ground_policy(values, ground_mdp, abstract_mdp, ground_states, abstract_state, gamma)
+
+    return policy, time.time() - start
+
+
+# Refines the abstract states that the agent is likely to reach next in a process pool while the agent is still acting
+# so that the policy cache already contains their ground states once the agent arrives. A prefetched refine is only used
+# once the agent reaches its abstract state and only if it would have been refined the same way on demand so that the
+# simulation never depends on the number of workers or on how long each refine takes.
+class RefinePrefetcher:
+    def __init__(self, ground_mdp, abstract_mdp, sketched_solution, expand_points_of_interest, expansion_level, gamma, solver_config, pamdp_cache_size, num_workers, depth):
+        self.ground_mdp = ground_mdp
+        self.abstract_mdp = abstract_mdp
+        self.sketched_solution = sketched_solution
+        self.expand_points_of_interest = expand_points_of_interest
+        self.depth = depth
+
+        initial_arguments = (ground_mdp, abstract_mdp, sketched_solution, expand_points_of_interest, expansion_level, gamma, solver_config, pamdp_cache_size)
+        self.pool = ProcessPoolExecutor(max_workers=num_workers, initializer=initialize_worker, initargs=initial_arguments)
+
+        # The ground state that each prefetched abstract state was refined from along with the future of its refine
+        self.futures = {}
+
+        # Stop prefetching once a worker process dies since the pool cannot run any other refine after that
+        self.is_broken = False
+
+        # The refine time of each prefetched abstract state that the agent has not visited yet minus any time spent waiting for it
+        self.prefetch_times = {}
+
+        self.statistics = {
+            'Workers': num_workers,
+            'Depth': depth,
+            'Submitted': 0,
+            'Completed': 0,
+            'Failed': 0,
+            'Discarded': 0,
+            'Hits': 0,
+            'Waits': 0,
+            'Wait Time': 0.0,
+            'Time Saved': 0.0
+        }
+
+    def get_frontier(self, abstract_state, action):
+        frontier = set()
+
+        # Follow the current action for the first step and the sketched policy for any later step
+        layer = {abstract_state}
+        for step in range(self.depth):
+            next_layer = set()
+
+            for frontier_abstract_state in layer:
+                frontier_action = action if step == 0 else self.sketched_solution['policy'][frontier_abstract_state]
+
+                for successor_abstract_state, _ in utils.get_successors(self.abstract_mdp, frontier_abstract_state, frontier_action):
+                    if successor_abstract_state != abstract_state and successor_abstract_state not in frontier:
+                        frontier.add(successor_abstract_state)
+                        next_layer.add(successor_abstract_state)
+
+            layer = next_layer
+
+        return frontier
+
+    def __add_policy(self, abstract_state, policy, elapsed_time, policy_cache):
+        self.statistics['Completed'] += 1
+
+        if policy is None:
+            self.statistics['Failed'] += 1
+            return
+
+        for ground_state, action in policy.items():
+            policy_cache[ground_state] = action
+
+        self.prefetch_times[abstract_state] = self.prefetch_times.get(abstract_state, 0) + elapsed_time
+
+    # Only the refine of the abstract state that the agent is in gets merged so that the policy cache never depends on which
+    # of the other refines happen to be done yet
+    def collect(self, policy_cache, current_ground_state, current_abstract_state):
+        if current_abstract_state not in self.futures:
+            return
+
+        ground_state, future = self.futures.pop(current_abstract_state)
+
+        if current_ground_state in policy_cache:
+            future.cancel()
+            return
+
+        # The PAMDP of a refine that expands points of interest depends on the ground state that it was refined from
+        if self.expand_points_of_interest and ground_state != current_ground_state:
+            future.cancel()
+            self.statistics['Discarded'] += 1
+            return
+
+        # Wait for the current abstract state if it is still being refined since that is faster than starting over
+        wait_time = 0
+        if not future.done():
+            start = time.time()
+            wait([future])
+            wait_time = time.time() - start
+
+            self.statistics['Waits'] += 1
+            self.statistics['Wait Time'] += wait_time
+
+        # Leave the abstract state to an on-demand refine if its prefetched refine failed
+        try:
+            policy, elapsed_time = future.result()
+        except Exception as error:
+            logging.warning("Failed to prefetch an abstract state: [abstract_state=%s, error=%r]", current_abstract_state, error)
+            self.is_broken = self.is_broken or isinstance(error, BrokenProcessPool)
+            policy, elapsed_time = None, 0
+
+        self.__add_policy(current_abstract_state, policy, elapsed_time - wait_time, policy_cache)
+
+    def record_hit(self, abstract_state):
+        if abstract_state in self.prefetch_times:
+            self.statistics['Hits'] += 1
+            self.statistics['Time Saved'] += max(0, self.prefetch_times.pop(abstract_state))
+
+    def submit(self, current_ground_state, current_abstract_state, current_action, policy_cache):
+        if self.is_broken:
+            return
+
+        # Pick the most likely ground successor state as the representative of each abstract successor state
+        representative_ground_states = {}
+        for ground_successor_state, probability in sorted(utils.get_successors(self.ground_mdp, current_ground_state, current_action), key=lambda successor: -successor[1]):
+            abstract_successor_state = self.abstract_mdp.get_abstract_state(ground_successor_state)
+            if abstract_successor_state not in representative_ground_states:
+                representative_ground_states[abstract_successor_state] = ground_successor_state
+
+        for abstract_state in sorted(self.get_frontier(current_abstract_state, current_action)):
+            if abstract_state in self.prefetch_times:
+                continue
+
+            ground_state = representative_ground_states.get(abstract_state, self.abstract_mdp.get_ground_states([abstract_state])[0])
+            if ground_state in policy_cache:
+                continue
+
+            # Keep an earlier refine unless it expands the points of interest of a ground state that is no longer the representative
+            if abstract_state in self.futures:
+                if not self.expand_points_of_interest or self.futures[abstract_state][0] == ground_state:
+                    continue
+                self.futures.pop(abstract_state)[1].cancel()
+
+            try:
+                self.futures[abstract_state] = (ground_state, self.pool.submit(task, ground_state, abstract_state))
+            except BrokenProcessPool as error:
+                logging.warning("Stopped prefetching since a worker process died: [error=%r]", error)
+                self.is_broken = True
+                return
+
+            self.statistics['Submitted'] += 1
+
+    def shutdown(self):
+        for _, future in self.futures.values():
+            future.cancel()
+
+        self.pool.shutdown(wait=True)
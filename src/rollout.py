@@ -0,0 +1,90 @@
+import math
+import time
+
+import numpy as np
+
+import utils
+
+DEFAULT_NUM_ROLLOUTS = 1000
+
+
+def get_policy_array(mdp, policy):
+    actions = mdp.actions()
+    return np.array([actions.index(policy[state]) for state in mdp.states()], dtype=int)
+
+
+# Uses the same 95% confidence interval as the plots so that a batch of rollouts can stand in for a batch of simulations
+def get_statistics(returns):
+    mean = float(np.mean(returns))
+    variance = float(np.var(returns))
+    return mean, variance, 2.0 * math.sqrt(variance) / math.sqrt(len(returns))
+
+
+def get_rewards(mdp, states, action_indices):
+    # Only look up the rewards of each distinct state since most trajectories share a few states
+    unique_states, inverse = np.unique(states, return_inverse=True)
+    reward_matrix = np.asarray(utils.get_reward_matrix(mdp, unique_states.tolist()))
+    return reward_matrix[inverse.ravel(), action_indices]
+
+
+def sample_successor_states(mdp, states, action_indices, rng):
+    if hasattr(mdp, 'sample_successor_states'):
+        return mdp.sample_successor_states(states, action_indices, rng)
+
+    actions = mdp.actions()
+
+    successor_states = np.zeros(len(states), dtype=int)
+    for i, (state, action_index) in enumerate(zip(states.tolist(), action_indices.tolist())):
+        probability_threshold = rng.random()
+
+        total_probability = 0
+        for successor_state, transition_probability in utils.get_successors(mdp, state, actions[action_index]):
+            total_probability += transition_probability
+            successor_states[i] = successor_state
+
+            if total_probability >= probability_threshold:
+                break
+
+    return successor_states
+
+
+# Runs every trajectory of a fixed policy at the same time as arrays instead of one step of one trajectory at a time
+def evaluate(mdp, policy_array, start_state, time_horizon, gamma, num_rollouts=DEFAULT_NUM_ROLLOUTS, seed=None):
+    if num_rollouts <= 0:
+        raise ValueError("Invalid parameter provided: num_rollouts must be positive")
+
+    start = time.time()
+
+    rng = np.random.default_rng(seed)
+
+    states = np.full(num_rollouts, start_state, dtype=int)
+    returns = np.zeros(num_rollouts)
+    discounted_returns = np.zeros(num_rollouts)
+
+    discount = 1.0
+    for _ in range(time_horizon):
+        action_indices = policy_array[states]
+
+        rewards = get_rewards(mdp, states, action_indices)
+        returns += rewards
+        discounted_returns += discount * rewards
+        discount *= gamma
+
+        states = sample_successor_states(mdp, states, action_indices, rng)
+
+    mean_return, return_variance, return_confidence_interval = get_statistics(returns)
+    mean_discounted_return, discounted_return_variance, discounted_return_confidence_interval = get_statistics(discounted_returns)
+
+    end = time.time()
+
+    return {
+        "Number of Rollouts": num_rollouts,
+        "Time Horizon": time_horizon,
+        "Mean Return": mean_return,
+        "Return Variance": return_variance,
+        "Return Confidence Interval": return_confidence_interval,
+        "Mean Discounted Return": mean_discounted_return,
+        "Discounted Return Variance": discounted_return_variance,
+        "Discounted Return Confidence Interval": discounted_return_confidence_interval,
+        "Time": end - start
+    }
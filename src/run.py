@@ -1,10 +1,20 @@
+import hashlib
 import json
+import logging
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 
 import orjson as orjson
 import pandas as pd
 import yaml
 from argparse import ArgumentParser
-from earth_observation_policy_sr import run, run_abstract, get_simulator_path
+
+import artifact_cache
+from earth_observation_policy_sr import run, run_abstract, get_simulator_path, get_abstract_mdp_parameters
+
+ACTIONS = ['abstract', 'simulate', 'simulate_abstract']
+
+DEFAULT_NUM_WORKERS = 1
 
 
 def read_config(config_file):
@@ -43,36 +53,137 @@ def get_x_y(data_dir, config_file, x_func, y_func, sort=True):
     return x, y
 
 
+# A row is only done for the same action and the same columns so that editing a row of a config file runs it again
+def get_row_key(action, config):
+    description = {'action': action, 'config': config.to_dict()}
+    return hashlib.sha256(json.dumps(description, sort_keys=True, default=artifact_cache.get_json_value).encode()).hexdigest()
+
+
+def get_abstraction_key(config):
+    return json.dumps(get_abstract_mdp_parameters(config), sort_keys=True, default=artifact_cache.get_json_value)
+
+
+def get_manifest_path(data_dir, config_file, action):
+    config_name = os.path.splitext(os.path.basename(config_file))[0]
+    return os.path.join(data_dir, f"{config_name}_{action}_sweep.json")
+
+
+def read_manifest(manifest_path):
+    if not os.path.isfile(manifest_path):
+        return {}
+
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+# Replaces the manifest all at once so that a crash while writing it never loses the rows that were already done
+def write_manifest(manifest_path, manifest):
+    temporary_manifest_path = manifest_path + ".tmp"
+    with open(temporary_manifest_path, "w") as f:
+        json.dump(manifest, f, indent=4, sort_keys=True)
+    os.replace(temporary_manifest_path, manifest_path)
+
+
+def run_row(data_dir, config, action, force):
+    if action == "abstract":
+        run(data_dir, config, simulate=False, force=force)
+    elif action == "simulate":
+        run(data_dir, config, simulate=True, force=force)
+    elif action == "simulate_abstract":
+        run_abstract(data_dir, config, simulate=False, force=force)
+    else:
+        raise Exception(f"Action {action} not supported")
+
+
+# Builds the abstraction that each group of rows shares once and only then runs the rows of the group so that no two
+# workers ever build the same abstraction, while the manifest records every finished row so that a sweep can resume
+def run_sweep(data_dir, configs, action, force=False, num_workers=DEFAULT_NUM_WORKERS, manifest_path=None):
+    if num_workers <= 0:
+        raise ValueError("Invalid parameter provided: num_workers must be greater than 0")
+
+    manifest = read_manifest(manifest_path) if manifest_path and not force else {}
+    manifest.setdefault("Rows", {})
+
+    statistics = {'Done': 0, 'Skipped': 0, 'Failed': 0}
+
+    groups = {}
+    for index, config in configs.iterrows():
+        row_key = get_row_key(action, config)
+        if manifest["Rows"].get(row_key, {}).get("Status") == "Done":
+            statistics['Skipped'] += 1
+            continue
+        groups.setdefault(get_abstraction_key(config), []).append((index, row_key, config))
+
+    logging.info("Starting the sweep: [groups=%d, rows=%d, skipped=%d, workers=%d]",
+                 len(groups), sum(len(rows) for rows in groups.values()), statistics['Skipped'], num_workers)
+
+    def record(row, error):
+        index, row_key, _ = row
+        status = "Failed" if error else "Done"
+        manifest["Rows"][row_key] = {"Index": int(index), "Status": status, "Error": str(error) if error else None}
+        statistics[status] += 1
+        if error:
+            logging.error("Failed to run a row of the sweep: [index=%d, error=%s]", index, error)
+        else:
+            logging.info("Finished a row of the sweep: [index=%d]", index)
+
+    with ProcessPoolExecutor(max_workers=num_workers) as pool:
+        futures = {}
+
+        for rows in groups.values():
+            futures[pool.submit(run, data_dir, rows[0][2], False, force)] = ("abstraction", rows)
+
+        while futures:
+            done_futures, _ = wait(futures, return_when=FIRST_COMPLETED)
+
+            for future in done_futures:
+                task, payload = futures.pop(future)
+                error = future.exception()
+
+                if task == "abstraction":
+                    # Building the abstraction is all that there is to do for the rows of the abstract action
+                    if error or action == "abstract":
+                        for row in payload:
+                            record(row, error)
+                    else:
+                        for row in payload:
+                            futures[pool.submit(run_row, data_dir, row[2], action, force)] = ("row", row)
+                else:
+                    record(payload, error)
+
+            if manifest_path:
+                write_manifest(manifest_path, manifest)
+
+    logging.info("Finished the sweep: [done=%d, skipped=%d, failed=%d]", statistics['Done'], statistics['Skipped'], statistics['Failed'])
+
+    return statistics
+
+
 def main():
     arg_parser = ArgumentParser()
     arg_parser.add_argument("config_file")
     arg_parser.add_argument("data_dir")
     arg_parser.add_argument("action")
     arg_parser.add_argument("-f", "--force", default="")
+    arg_parser.add_argument("-w", "--workers", default=DEFAULT_NUM_WORKERS, type=int)
 
     args = arg_parser.parse_args()
     config_file = args.config_file
     data_dir = args.data_dir
     action = args.action
     force = args.force.lower() in ("1", "yes", "y", "t", "true")
+    num_workers = args.workers
+
+    if action not in ACTIONS:
+        raise Exception(f"Action {action} not supported")
 
     configs = read_config(config_file)
     print(configs)
     print()
 
-    for index, config in configs.iterrows():
-        if True:
-            print("am here")
-            run_abstract(data_dir, config, simulate=False, force=force)
-        else:
-            if action == "abstract":
-                run(data_dir, config, simulate=False, force=force)
-            elif action == "simulate":
-                run(data_dir, config, simulate=True, force=force)
-            else:
-                raise Exception(f"Action {action} not supported")
-
-        print()
+    statistics = run_sweep(data_dir, configs, action, force, num_workers, get_manifest_path(data_dir, config_file, action))
+    if statistics['Failed'] > 0:
+        raise Exception(f"Failed to run {statistics['Failed']} rows of the sweep. Run this again to retry them.")
 
 
 if __name__ == '__main__':
@@ -1,5 +1,7 @@
 import random
 
+import numpy as np
+
 
 def generate_random_grid_world(width, height, wall_probability):
     grid_world = [['O' for column in range(width)] for row in range(height)]
@@ -15,14 +17,35 @@ def generate_random_grid_world(width, height, wall_probability):
     return grid_world
 
 
-def get_ground_entities(entities, ground_mdp, abstract_mdp):
+# A warm-started solver session only matches a fresh solve up to rounding errors so it treats actions whose values are
+# within this relative tolerance of the best action value as ties that go to the lowest action index
+ACTION_VALUE_TOLERANCE = 1e-9
+
+
+# Return the first best action index just like a strict > comparison would unless there is a tolerance for near-ties
+def get_best_action_index(action_values, tolerance=0.0):
+    best_action_value = max(action_values)
+    threshold = best_action_value - tolerance * max(1.0, abs(best_action_value))
+    return next(index for index, action_value in enumerate(action_values) if action_value >= threshold)
+
+
+# Return the best action index of each row of an (n_states, n_actions) array of action values
+def get_best_action_indices(action_values, tolerance=0.0):
+    best_action_values = np.max(action_values, axis=1, keepdims=True)
+    thresholds = best_action_values - tolerance * np.maximum(1.0, np.abs(best_action_values))
+    return np.argmax(action_values >= thresholds, axis=1)
+
+
+# Only the given ground states get an entity if there are any since a large ground MDP has far too many states to map
+def get_ground_entities(entities, ground_mdp, abstract_mdp, ground_states=None):
     ground_entities = {}
 
-    for ground_state in ground_mdp.states():
+    ground_states = list(ground_mdp.states() if ground_states is None else ground_states)
+
+    for ground_state, abstract_state in zip(ground_states, get_abstract_states(abstract_mdp, ground_states)):
         if ground_state in entities:
             ground_entities[ground_state] = entities[ground_state]
         else:
-            abstract_state = abstract_mdp.get_abstract_state(ground_state)
             ground_entities[ground_state] = entities[abstract_state]
 
     return ground_entities
@@ -31,51 +54,48 @@ def get_ground_entities(entities, ground_mdp, abstract_mdp):
 def get_ground_policy(values, ground_mdp, abstract_mdp, ground_states, abstract_state, gamma):
     policy = {}
 
+    actions = ground_mdp.actions()
+
     for state in ground_states:
-        best_action = None
-        best_action_value = None
+        action_values = []
 
-        for action in ground_mdp.actions():
+        for action in actions:
             immediate_reward = ground_mdp.reward_function(state, action)
 
             expected_future_reward = 0
-            for successor_abstract_state in abstract_mdp.states():
-                if abstract_mdp.transition_function(abstract_state, action, successor_abstract_state) > 0:
-                    for successor_state in abstract_mdp.get_ground_states([successor_abstract_state]):
-                        expected_future_reward += ground_mdp.transition_function(state, action, successor_state) * values[successor_state]
-
-            action_value = immediate_reward + gamma * expected_future_reward
+            if hasattr(ground_mdp, 'successors'):
+                for successor_state, transition_probability in ground_mdp.successors(state, action):
+                    expected_future_reward += transition_probability * values[successor_state]
+            else:
+                for successor_abstract_state in abstract_mdp.states():
+                    if abstract_mdp.transition_function(abstract_state, action, successor_abstract_state) > 0:
+                        for successor_state in abstract_mdp.get_ground_states([successor_abstract_state]):
+                            expected_future_reward += ground_mdp.transition_function(state, action, successor_state) * values[successor_state]
 
-            if best_action_value is None or action_value > best_action_value:
-                best_action = action
-                best_action_value = action_value
+            action_values.append(immediate_reward + gamma * expected_future_reward)
 
-        policy[state] = best_action
+        policy[state] = actions[get_best_action_index(action_values)]
 
     return policy
 
 def get_full_ground_policy(values, ground_mdp, ground_states, gamma):
     policy = {}
 
+    actions = ground_mdp.actions()
+
     for state in ground_states:
-        best_action = None
-        best_action_value = None
+        action_values = []
 
-        for action in ground_mdp.actions():
+        for action in actions:
             immediate_reward = ground_mdp.reward_function(state, action)
 
             expected_future_reward = 0
-            for successor_state in ground_mdp.states():
-                if ground_mdp.transition_function(state, action, successor_state) > 0:
-                    expected_future_reward += ground_mdp.transition_function(state, action, successor_state) * values[successor_state]
-
-            action_value = immediate_reward + gamma * expected_future_reward
+            for successor_state, transition_probability in get_successors(ground_mdp, state, action):
+                expected_future_reward += transition_probability * values[successor_state]
 
-            if best_action_value is None or action_value > best_action_value:
-                best_action = action
-                best_action_value = action_value
+            action_values.append(immediate_reward + gamma * expected_future_reward)
 
-        policy[state] = best_action
+        policy[state] = actions[get_best_action_index(action_values)]
 
     return policy
 
@@ -84,24 +104,85 @@ def get_successor_state_set(mdp, states):
 
     for state in states:
         for action in mdp.actions():  # <-- FIXME This is okay only if every state has the same set of actions...
-            for successor_state in mdp.states():  # <-- FIXME Likely not the fastest method! Try using a graph
-                if mdp.transition_function(state, action, successor_state) > 0:
-                    successor_state_set.add(successor_state)
+            for successor_state, _ in get_successors(mdp, state, action):
+                successor_state_set.add(successor_state)
 
     return successor_state_set
 
 
-def get_successor_state(current_state, current_action, mdp):
-    probability_threshold = random.random()
+# Returns the (successor state, probability) pairs with a nonzero probability in the order of the state space
+def get_successors(mdp, state, action):
+    if hasattr(mdp, 'successors'):
+        return mdp.successors(state, action)
 
-    total_probability = 0
+    successors = []
 
     for successor_state in mdp.states():
-        transition_probability = mdp.transition_function(current_state, current_action, successor_state)
+        transition_probability = mdp.transition_function(state, action, successor_state)
+        if transition_probability > 0:
+            successors.append((successor_state, transition_probability))
+
+    return successors
+
+
+# Returns the flat arrays of the index of the state, the successor state, and the probability of every nonzero transition
+# of a batch of states ordered by state and then by successor state
+def get_batch_successor_arrays(mdp, states, action):
+    if hasattr(mdp, 'get_successor_distributions'):
+        successor_states, probabilities = mdp.get_successor_distributions(states, action)
+        is_successor = probabilities > 0
+        return np.nonzero(is_successor)[0], successor_states[is_successor], probabilities[is_successor]
+
+    indices = []
+    successor_states = []
+    probabilities = []
 
-        if transition_probability == 0:
-            continue
+    for i, state in enumerate(states):
+        for successor_state, probability in get_successors(mdp, state, action):
+            indices.append(i)
+            successor_states.append(successor_state)
+            probabilities.append(probability)
+
+    return np.array(indices, dtype=int), np.array(successor_states, dtype=int), np.array(probabilities, dtype=float)
+
+
+def get_batch_successors(mdp, states, action):
+    if not hasattr(mdp, 'get_successor_distributions'):
+        return [get_successors(mdp, state, action) for state in states]
+
+    indices, successor_states, probabilities = get_batch_successor_arrays(mdp, states, action)
+    boundaries = [0] + np.searchsorted(indices, np.arange(1, len(states))).tolist() + [len(indices)]
+
+    successor_states = successor_states.tolist()
+    probabilities = probabilities.tolist()
+
+    return [list(zip(successor_states[start:end], probabilities[start:end])) for start, end in zip(boundaries[:-1], boundaries[1:])]
+
+
+def get_abstract_states(abstract_mdp, ground_states):
+    if hasattr(abstract_mdp, 'get_abstract_states'):
+        return abstract_mdp.get_abstract_states(ground_states)
+
+    return [abstract_mdp.get_abstract_state(ground_state) for ground_state in ground_states]
+
+
+# Returns the (len(states), len(actions)) array of rewards as a slice of the reward matrix of the MDP if it has one
+def get_reward_matrix(mdp, states):
+    if hasattr(mdp, 'reward_matrix'):
+        return mdp.reward_matrix[np.asarray(states, dtype=int)]
+
+    return np.array([[mdp.reward_function(state, action) for action in mdp.actions()] for state in states], dtype=float).reshape(len(states), len(mdp.actions()))
+
+
+def get_successor_state(current_state, current_action, mdp):
+    if hasattr(mdp, 'sample_successor_state'):
+        return mdp.sample_successor_state(current_state, current_action)
+
+    probability_threshold = random.random()
+
+    total_probability = 0
 
+    for successor_state, transition_probability in get_successors(mdp, current_state, current_action):
         total_probability += transition_probability
 
         if total_probability >= probability_threshold: